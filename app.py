@@ -1,5 +1,8 @@
 import cv2
 import numpy as np
+from simulacion import campo_estelar, superficie_craterizada
+from config_multiwindow import AI_CONFIG
+from modelos_ia import PoolModelos, POOL_MODELOS, CACHE_INFERENCIA, huella_imagen
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog, scrolledtext
 from PIL import Image, ImageTk, ImageDraw
@@ -7,17 +10,11 @@ import json
 
 
 import os
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import itertools
 import time
 import math
-import torch
-import requests
-from io import BytesIO
-from transformers import pipeline, BlipProcessor, BlipForConditionalGeneration
-from bs4 import BeautifulSoup
-import re
 from datetime import datetime
 
 class NASAImageExplorerPro:
@@ -56,11 +53,21 @@ class NASAImageExplorerPro:
         
         # Sistema de análisis IA
         self.analizador = None
-        self.analizando = False
+        self.version_imagen = 0
+        self.cola_analisis = ColaAnalisis(self._ejecutar_analisis_ia_internet, self.fallo_trabajo_analisis)
+        self.progreso_ia = tk.DoubleVar(value=0.0)
         self.filtros_generados = False
+        self.analisis_teselas = tk.BooleanVar(value=True)
+        self.describir_teselas = tk.BooleanVar(value=False)
+        self.lote_teselas = tk.IntVar(value=8)
+        self.mostrar_mapa_ia = tk.BooleanVar(value=True)
+        self.mapa_ia = None
         
         # Cache para imágenes procesadas
         self.image_cache = {}
+        self.planos = None
+        self.planos_vista = None
+        self.histogramas_color = None
         
         # Nuevas variables para división de imagen
         self.image_tiles = {}
@@ -103,6 +110,7 @@ class NASAImageExplorerPro:
             }
         }
         self.vars_color = {}
+        self.clasificador_color = ClasificadorColorHSV(self.rangos_color)
         
         # Variables para detección de patrones
         self.detectar_circulos = tk.BooleanVar(value=True)
@@ -110,30 +118,66 @@ class NASAImageExplorerPro:
         self.mostrar_centroides = tk.BooleanVar(value=True)
         self.detectar_rectangulos = tk.BooleanVar(value=True)
         self.detectar_lineas = tk.BooleanVar(value=True)
-        self.patrones_detectados = []
+        self.detectar_estrellas = tk.BooleanVar(value=False)
+        self.detectar_crateres = tk.BooleanVar(value=False)
+        self.patrones_detectados = CatalogoPatrones.vacio(self.clasificador_color.colores_dominantes)
+        self.patrones_vista = self.patrones_detectados
+        self.errores_patrones = []
+        self.indice_patrones = IndiceEspacial()
+        self.indice_etiquetas = IndiceEspacial()
+        self.superposicion_pendiente = False
+        self.estilo_marcador = tk.StringVar(value="Dot")
+        self.radio_marcador = tk.IntVar(value=5)
+        self.max_marcadores = 20000
+        self.pagina_patrones = 0
+        self.tamano_pagina_patrones = 100
+        self.filtro_tipo_patron = tk.StringVar(value="All")
+        self.filtro_color_patron = tk.StringVar(value="All")
+        self.orden_patrones = tk.StringVar(value="Detection order")
+        self.ordenes_patrones = {
+            "Detection order": None,
+            "Area ↓": ("area", True),
+            "Area ↑": ("area", False),
+            "Radius ↓": ("radio", True),
+            "Length ↓": ("longitud", True),
+            "Flux ↓": ("flujo", True),
+        }
+        self.cancelar_deteccion = None
+        self.progreso_deteccion = tk.DoubleVar(value=0)
+        self.cache_deteccion = CacheDeteccion()
+        
+        # Parámetros de detección editables; sus cambios se previsualizan sobre un proxy reducido
+        self.parametros_deteccion = {nombre: (tk.DoubleVar if isinstance(valor, float) else tk.IntVar)(value=valor)
+                                     for nombre, valor in PARAMETROS_DETECCION.items()}
+        self.vista_previa_activa = tk.BooleanVar(value=True)
+        self.lado_proxy = 768
+        self.presupuesto_vista_previa = 0.25
+        self.vista_previa_programada = None
+        self.vista_previa_en_curso = False
+        self.vista_previa_pendiente = False
         
         # Configurar interfaz
         self.setup_ui()
         
-        # Cargar datos y modelos
+        # Cargar datos; los modelos IA se comparten entre ventanas y se cargan al primer análisis
         self.load_sample_datasets()
-        self.cargar_modelos_background()
-        
-    def cargar_modelos_background(self):
-        def cargar_modelos():
-            try:
-                self.mostrar_estado("🔄 Cargando modelos IA...")
-                self.analizador = AnalizadorEspecializadoNASA()
-                self.mostrar_estado("✅ Modelos IA cargados")
-            except Exception as e:
-                self.mostrar_estado("❌ Error cargando modelos IA")
+        self.pool_modelos = pool_modelos()
+        self.analizador = AnalizadorEspecializadoNASA(self.pool_modelos)
+        self.pool_modelos.adquirir(self.aviso_modelos)
+        self.root.bind("<Destroy>", self.al_destruir_ventana, add="+")
         
-        thread = threading.Thread(target=cargar_modelos)
-        thread.daemon = True
-        thread.start()
+    def al_destruir_ventana(self, event):
+        # <Destroy> llega también por cada widget hijo
+        if event.widget is self.root:
+            self.cola_analisis.cancelar()
+            self.pool_modelos.liberar(self.aviso_modelos)
         
     def mostrar_estado(self, mensaje):
         self.status_var.set(mensaje)
+    
+    def aviso_modelos(self, mensaje):
+        """Cargas, descargas y errores del pool de modelos; llegan desde otros hilos"""
+        self.root.after(0, lambda: self.mostrar_estado(mensaje))
         
     def setup_ui(self):
         main_frame = ttk.Frame(self.root)
@@ -194,18 +238,65 @@ class NASAImageExplorerPro:
         self.color_adjust_tab = ttk.Frame(self.filters_notebook)
         self.color_ranges_tab = ttk.Frame(self.filters_notebook)
         self.pattern_detection_tab = ttk.Frame(self.filters_notebook)
+        self.detector_params_tab = ttk.Frame(self.filters_notebook)
         
         self.filters_notebook.add(self.active_filters_tab, text="Active Filters")
         self.filters_notebook.add(self.color_filters_tab, text="Color Filters")
         self.filters_notebook.add(self.color_adjust_tab, text="Color Adjustment")
         self.filters_notebook.add(self.color_ranges_tab, text="Color Ranges")
         self.filters_notebook.add(self.pattern_detection_tab, text="Pattern Detection")
+        self.filters_notebook.add(self.detector_params_tab, text="Detector Parameters")
         
         self.setup_active_filters_tab(self.active_filters_tab)
         self.setup_color_filters_tab(self.color_filters_tab)
         self.setup_color_adjust_tab(self.color_adjust_tab)
         self.setup_color_ranges_tab(self.color_ranges_tab)
         self.setup_pattern_detection_tab(self.pattern_detection_tab)
+        self.setup_detector_params_tab(self.detector_params_tab)
+        
+    def setup_detector_params_tab(self, parent):
+        params_frame = ttk.Frame(parent)
+        params_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
+        ttk.Label(params_frame, text="Detector Parameters:", 
+                 font=('Arial', 10, 'bold')).pack(anchor=tk.W, pady=(0, 10))
+        
+        grid_frame = ttk.Frame(params_frame)
+        grid_frame.pack(fill=tk.X)
+        grid_frame.columnconfigure(0, weight=1)
+        
+        campos = [
+            ("umbral_binario", "Binary threshold", 0, 255, 1),
+            ("area_min_contorno", "Min contour area", 0, 100000, 10),
+            ("area_min_rectangulo", "Min rectangle area", 0, 100000, 10),
+            ("hough_param1", "Circle edge threshold", 1, 500, 1),
+            ("hough_param2", "Circle votes", 1, 500, 1),
+            ("radio_min", "Min circle radius", 0, 1000, 1),
+            ("radio_max", "Max circle radius", 1, 1000, 1),
+            ("distancia_circulos", "Min circle distance", 1, 1000, 1),
+            ("canny_bajo", "Canny low", 0, 500, 1),
+            ("canny_alto", "Canny high", 0, 500, 1),
+            ("lineas_votos", "Line votes", 1, 500, 1),
+            ("lineas_longitud_min", "Min line length", 1, 2000, 1),
+            ("lineas_hueco_max", "Max line gap", 0, 500, 1),
+            ("estrellas_sigma", "Star threshold (sigma)", 1.0, 50.0, 0.5),
+        ]
+        for fila, (nombre, texto, minimo, maximo, paso) in enumerate(campos):
+            ttk.Label(grid_frame, text=texto + ":").grid(row=fila, column=0, sticky=tk.W, pady=1)
+            ttk.Spinbox(grid_frame, from_=minimo, to=maximo, increment=paso, width=8,
+                        textvariable=self.parametros_deteccion[nombre]).grid(row=fila, column=1, padx=2, pady=1)
+            self.parametros_deteccion[nombre].trace_add("write", lambda *args: self.programar_vista_previa())
+        
+        ttk.Checkbutton(params_frame, text="Live preview on visible area", 
+                       variable=self.vista_previa_activa).pack(anchor=tk.W, pady=(10, 2))
+        
+        btn_frame = ttk.Frame(params_frame)
+        btn_frame.pack(fill=tk.X, pady=10)
+        
+        ttk.Button(btn_frame, text="Reset Defaults", 
+                  command=self.restablecer_parametros_deteccion).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
+        ttk.Button(btn_frame, text="🛰 Apply to Full Image", 
+                  command=self.aplicar_deteccion_completa).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
         
     def setup_pattern_detection_tab(self, parent):
         pattern_frame = ttk.Frame(parent)
@@ -224,9 +315,24 @@ class NASAImageExplorerPro:
         ttk.Checkbutton(detection_frame, text="Detect Rectangles", 
                        variable=self.detectar_rectangulos).pack(anchor=tk.W, pady=2)
         ttk.Checkbutton(detection_frame, text="Show Centroids", 
-                       variable=self.mostrar_centroides).pack(anchor=tk.W, pady=2)
+                       variable=self.mostrar_centroides, command=self.alternar_marcadores).pack(anchor=tk.W, pady=2)
         ttk.Checkbutton(detection_frame, text="Detect Lines", 
                        variable=self.detectar_lineas).pack(anchor=tk.W, pady=2)
+        ttk.Checkbutton(detection_frame, text="Detect Stars", 
+                       variable=self.detectar_estrellas).pack(anchor=tk.W, pady=2)
+        ttk.Checkbutton(detection_frame, text="Detect Craters (multi-scale)", 
+                       variable=self.detectar_crateres).pack(anchor=tk.W, pady=2)
+        
+        estilo_frame = ttk.Frame(pattern_frame)
+        estilo_frame.pack(fill=tk.X, pady=2)
+        
+        ttk.Label(estilo_frame, text="Marker:").pack(side=tk.LEFT)
+        estilo_combo = ttk.Combobox(estilo_frame, textvariable=self.estilo_marcador, state="readonly", width=6,
+                                    values=["Dot", "Ring"])
+        estilo_combo.pack(side=tk.LEFT, padx=2)
+        estilo_combo.bind("<<ComboboxSelected>>", lambda e: self.reestilizar_marcadores())
+        ttk.Spinbox(estilo_frame, from_=2, to=20, width=4, textvariable=self.radio_marcador,
+                    command=self.dibujar_superposicion).pack(side=tk.LEFT, padx=2)
         
         btn_frame = ttk.Frame(pattern_frame)
         btn_frame.pack(fill=tk.X, pady=10)
@@ -236,9 +342,48 @@ class NASAImageExplorerPro:
         ttk.Button(btn_frame, text="Clear Patterns", 
                   command=self.limpiar_patrones).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
         
+        full_frame = ttk.Frame(pattern_frame)
+        full_frame.pack(fill=tk.X, pady=(0, 5))
+        
+        ttk.Button(full_frame, text="🛰 Detect Full Image", 
+                  command=self.aplicar_deteccion_completa).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
+        ttk.Button(full_frame, text="Cancel", 
+                  command=self.cancelar_deteccion_completa).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
+        
+        ttk.Progressbar(pattern_frame, variable=self.progreso_deteccion, 
+                        maximum=100).pack(fill=tk.X, padx=2)
+        
         results_frame = ttk.LabelFrame(pattern_frame, text="Detected Patterns", padding=5)
         results_frame.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
         
+        filtros_frame = ttk.Frame(results_frame)
+        filtros_frame.pack(fill=tk.X)
+        
+        tipo_combo = ttk.Combobox(filtros_frame, textvariable=self.filtro_tipo_patron, state="readonly", width=10,
+                                  values=["All"] + list(CatalogoPatrones.TIPOS))
+        tipo_combo.pack(side=tk.LEFT, padx=2)
+        tipo_combo.bind("<<ComboboxSelected>>", self.actualizar_vista_patrones)
+        color_combo = ttk.Combobox(filtros_frame, textvariable=self.filtro_color_patron, state="readonly", width=12,
+                                   values=["All"] + self.clasificador_color.colores_dominantes)
+        color_combo.pack(side=tk.LEFT, padx=2)
+        color_combo.bind("<<ComboboxSelected>>", self.actualizar_vista_patrones)
+        orden_combo = ttk.Combobox(filtros_frame, textvariable=self.orden_patrones, state="readonly", width=14,
+                                   values=list(self.ordenes_patrones))
+        orden_combo.pack(side=tk.LEFT, padx=2)
+        orden_combo.bind("<<ComboboxSelected>>", self.actualizar_vista_patrones)
+        
+        pagina_frame = ttk.Frame(results_frame)
+        pagina_frame.pack(fill=tk.X, pady=2)
+        
+        ttk.Button(pagina_frame, text="◀", width=3,
+                  command=lambda: self.cambiar_pagina_patrones(-1)).pack(side=tk.LEFT, padx=2)
+        self.pagina_patrones_label = ttk.Label(pagina_frame, text="Page 0 / 0")
+        self.pagina_patrones_label.pack(side=tk.LEFT, padx=2)
+        ttk.Button(pagina_frame, text="▶", width=3,
+                  command=lambda: self.cambiar_pagina_patrones(1)).pack(side=tk.LEFT, padx=2)
+        ttk.Button(pagina_frame, text="Export", 
+                  command=self.exportar_patrones).pack(side=tk.RIGHT, padx=2)
+        
         self.pattern_results_text = scrolledtext.ScrolledText(results_frame, wrap=tk.WORD, 
                                                             height=10, font=('Consolas', 9))
         self.pattern_results_text.pack(fill=tk.BOTH, expand=True, padx=2, pady=2)
@@ -256,37 +401,94 @@ class NASAImageExplorerPro:
                 messagebox.showwarning("Warning", "No visible region found")
                 return
             
-            x1, y1, x2, y2 = region_visible
-            
-            # Extraer solo la región visible de la imagen
-            region_imagen = self.current_filtered_image[y1:y2, x1:x2]
-            
-            # Aplicar detección de patrones solo en la región visible
-            region_con_patrones, info_patrones = self.detectar_patrones_con_colores(region_imagen)
-            
-            # Crear una copia de la imagen completa
-            imagen_completa_con_patrones = self.current_filtered_image.copy()
+            # Solo se analizan las teselas de la región visible que no están en la caché
+            opciones = self.opciones_deteccion()
+            detector = DetectorTeselado(self.clasificador_color, opciones, parametros=self.leer_parametros_deteccion())
+            patrones, _ = detector.ejecutar(self.current_filtered_image, region=region_visible,
+                                            cache=self.cache_deteccion)
+            patrones = patrones.filtrar(region=region_visible)
             
-            # Reemplazar solo la región visible con la versión con patrones
-            imagen_completa_con_patrones[y1:y2, x1:x2] = region_con_patrones
+            # Los marcadores van en la capa de superposición, la imagen no se modifica
+            self.establecer_patrones(patrones)
+            self.dibujar_superposicion()
             
-            # Actualizar la imagen mostrada
-            self.current_filtered_image = imagen_completa_con_patrones
-            self.update_filtered_tiles()
-            self.display_current_image()
-            
-            self.mostrar_resultados_patrones(info_patrones)
-            
-            filter_name = "Pattern Detection (Visible Area)"
-            if filter_name not in self.active_filters:
-                self.active_filters.append(filter_name)
-                self.filters_listbox.insert(tk.END, filter_name)
+            self.mostrar_resultados_patrones(resumen_patrones(patrones, opciones))
             
-            self.mostrar_estado("✅ Pattern detection applied to visible area")
+            self.mostrar_estado(f"✅ Pattern detection applied to visible area "
+                                f"({detector.teselas_nuevas} new tiles analysed)")
         
         except Exception as e:
             self.mostrar_estado(f"❌ Error in pattern detection: {e}")
             messagebox.showerror("Error", f"Error detecting patterns: {str(e)}")
+    
+    def aplicar_deteccion_completa(self):
+        """Detecta patrones en toda la imagen por teselas en segundo plano, con progreso y cancelación"""
+        if self.current_filtered_image is None:
+            messagebox.showwarning("Warning", "Please load an image first")
+            return
+        if self.cancelar_deteccion is not None:
+            self.mostrar_estado("⏳ Full-image pattern detection already running")
+            return
+        
+        imagen = self.current_filtered_image
+        detector = DetectorTeselado(self.clasificador_color, self.opciones_deteccion(),
+                                    parametros=self.leer_parametros_deteccion())
+        cancelar = threading.Event()
+        self.cancelar_deteccion = cancelar
+        self.progreso_deteccion.set(0)
+        self.mostrar_estado("🔍 Detecting patterns on the full image...")
+        
+        def progreso(fraccion):
+            self.root.after(0, lambda: self.progreso_deteccion.set(fraccion * 100))
+        
+        def ejecutar():
+            try:
+                resultado = detector.ejecutar(imagen, progreso, cancelar)
+                self.root.after(0, lambda: self.finalizar_deteccion_completa(imagen, resultado))
+            except Exception as e:
+                self.root.after(0, lambda error=e: self.finalizar_deteccion_completa(imagen, None, error))
+        
+        thread = threading.Thread(target=ejecutar)
+        thread.daemon = True
+        thread.start()
+    
+    def finalizar_deteccion_completa(self, imagen, resultado, error=None):
+        self.cancelar_deteccion = None
+        
+        if error is not None:
+            self.progreso_deteccion.set(0)
+            self.mostrar_estado(f"❌ Error in pattern detection: {error}")
+            messagebox.showerror("Error", f"Error detecting patterns: {str(error)}")
+            return
+        if resultado is None:
+            self.progreso_deteccion.set(0)
+            self.mostrar_estado("⏹ Full-image pattern detection cancelled")
+            return
+        if imagen is not self.current_filtered_image:
+            self.mostrar_estado("⚠️ Image changed during detection, results discarded")
+            return
+        
+        patrones, info_patrones = resultado
+        self.establecer_patrones(patrones)
+        self.dibujar_superposicion()
+        self.mostrar_resultados_patrones(info_patrones)
+        
+        self.mostrar_estado(f"✅ Pattern detection applied to full image ({len(patrones)} patterns)")
+    
+    def cancelar_deteccion_completa(self):
+        if self.cancelar_deteccion is not None:
+            self.cancelar_deteccion.set()
+            self.mostrar_estado("⏹ Cancelling pattern detection...")
+    def origen_imagen(self):
+        """Posición en el canvas de la esquina de la imagen: center_image la desplaza cuando cabe entera"""
+        coords = self.canvas.coords(self.canvas_image) if self.canvas_image else []
+        return (coords[0], coords[1]) if coords else (0.0, 0.0)
+    
+    def rectangulo_en_canvas(self, coords, origen):
+        ox, oy = origen
+        x1, y1, x2, y2 = coords
+        return ox + x1 * self.scale, oy + y1 * self.scale, ox + x2 * self.scale, oy + y2 * self.scale
+    
     def obtener_region_visible(self):
         """Obtiene las coordenadas de la región visible actual en la imagen original"""
         if self.current_filtered_image is None:
@@ -299,25 +501,12 @@ class NASAImageExplorerPro:
         if canvas_width <= 1 or canvas_height <= 1:
             return None
         
-        # Obtener la vista actual del scroll
-        x_view = self.canvas.xview()
-        y_view = self.canvas.yview()
-        
-        # Calcular dimensiones de la imagen escalada
-        img_width_scaled = self.original_size[0] * self.scale
-        img_height_scaled = self.original_size[1] * self.scale
-        
-        # Calcular región visible en coordenadas escaladas
-        visible_x1_scaled = max(0, int(x_view[0] * img_width_scaled))
-        visible_y1_scaled = max(0, int(y_view[0] * img_height_scaled))
-        visible_x2_scaled = min(img_width_scaled, int(x_view[1] * img_width_scaled))
-        visible_y2_scaled = min(img_height_scaled, int(y_view[1] * img_height_scaled))
-        
-        # Convertir a coordenadas de la imagen original
-        x1 = int(visible_x1_scaled / self.scale)
-        y1 = int(visible_y1_scaled / self.scale)
-        x2 = int(visible_x2_scaled / self.scale)
-        y2 = int(visible_y2_scaled / self.scale)
+        # Esquinas visibles del canvas, pasadas a la imagen original (que puede no estar en 0, 0)
+        ox, oy = self.origen_imagen()
+        x1 = int((self.canvas.canvasx(0) - ox) / self.scale)
+        y1 = int((self.canvas.canvasy(0) - oy) / self.scale)
+        x2 = int(math.ceil((self.canvas.canvasx(canvas_width) - ox) / self.scale))
+        y2 = int(math.ceil((self.canvas.canvasy(canvas_height) - oy) / self.scale))
         
         # Asegurar que las coordenadas estén dentro de los límites de la imagen
         x1 = max(0, min(x1, self.original_size[0] - 1))
@@ -421,235 +610,218 @@ class NASAImageExplorerPro:
             except Exception as e:
                 messagebox.showerror("Error", f"Could not save image: {e}")
     
+    def opciones_deteccion(self):
+        """Lee las casillas de detección en el hilo de la interfaz para pasarlas a los detectores"""
+        return {
+            "circulos": self.detectar_circulos.get(),
+            "contornos": self.detectar_contornos.get(),
+            "rectangulos": self.detectar_rectangulos.get(),
+            "lineas": self.detectar_lineas.get(),
+            "estrellas": self.detectar_estrellas.get(),
+            "crateres": self.detectar_crateres.get(),
+        }
+    
     def detectar_patrones_con_colores(self, imagen):
-        imagen_patrones = imagen.copy()
-        info_patrones = []
-        self.patrones_detectados = []
-        
-        gris = cv2.cvtColor(imagen, cv2.COLOR_BGR2GRAY)
-        gris_suavizado = cv2.medianBlur(gris, 5)
-        
-        # Detectar círculos
-        if self.detectar_circulos.get():
+        """Detecta patrones en `imagen`; devuelve (CatalogoPatrones en coordenadas de `imagen`, info)"""
+        return detectar_patrones(imagen, self.clasificador_color, self.opciones_deteccion(),
+                                 self.leer_parametros_deteccion())
+    
+    def leer_parametros_deteccion(self):
+        """Valores del panel de parámetros; un campo vacío o no numérico toma su valor por defecto"""
+        parametros = {}
+        for nombre, variable in self.parametros_deteccion.items():
             try:
-                circles = cv2.HoughCircles(
-                    gris_suavizado,
-                    cv2.HOUGH_GRADIENT,
-                    dp=1,
-                    minDist=30,
-                    param1=50,
-                    param2=30,
-                    minRadius=5,
-                    maxRadius=100
-                )
-                
-                if circles is not None:
-                    circles = np.round(circles[0, :]).astype("int")
-                    
-                    for (x, y, r) in circles:
-                        color_dominante = self.analizar_color_area(imagen, x, y, r)
-                        
-                        # Solo poner un punto en el centro del color dominante
-                        color_bgr = self.rangos_color.get(color_dominante, {}).get("color_bgr", (0, 255, 0))
-                        cv2.circle(imagen_patrones, (x, y), 5, color_bgr, -1)  # Punto sólido
-                        
-                        patron_info = {
-                            "tipo": "Círculo",
-                            "centro": (x, y),
-                            "radio": r,
-                            "color_dominante": color_dominante,
-                            "area": np.pi * r * r
-                        }
-                        self.patrones_detectados.append(patron_info)
-                    
-                    info_patrones.append(f"Círculos detectados: {len(circles)}")
-            except Exception as e:
-                info_patrones.append(f"Error en círculos: {str(e)}")
+                parametros[nombre] = variable.get()
+            except tk.TclError:
+                parametros[nombre] = PARAMETROS_DETECCION[nombre]
+        return parametros
+    
+    def restablecer_parametros_deteccion(self):
+        for nombre, valor in PARAMETROS_DETECCION.items():
+            self.parametros_deteccion[nombre].set(valor)
+    
+    def programar_vista_previa(self):
+        """Agrupa los cambios seguidos del panel de parámetros en una sola vista previa"""
+        if not self.vista_previa_activa.get() or self.current_filtered_image is None:
+            return
+        if self.vista_previa_programada is not None:
+            self.root.after_cancel(self.vista_previa_programada)
+        self.vista_previa_programada = self.root.after(150, self.lanzar_vista_previa)
+    
+    def lanzar_vista_previa(self):
+        """Detecta en segundo plano sobre un proxy reducido de la región visible; una vista previa a la vez"""
+        self.vista_previa_programada = None
+        if self.vista_previa_en_curso:
+            self.vista_previa_pendiente = True
+            return
+        region = self.obtener_region_visible()
+        if region is None:
+            return
         
-        # Detectar contornos
-        if self.detectar_contornos.get():
-            try:
-                _, thresh = cv2.threshold(gris_suavizado, 127, 255, cv2.THRESH_BINARY)
-                contornos, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-                
-                contornos_filtrados = [cnt for cnt in contornos if cv2.contourArea(cnt) > 100]
-                
-                for i, cnt in enumerate(contornos_filtrados):
-                    M = cv2.moments(cnt)
-                    if M["m00"] != 0:
-                        cx = int(M["m10"] / M["m00"])
-                        cy = int(M["m01"] / M["m00"])
-                        
-                        color_dominante = self.analizar_color_area(imagen, cx, cy, 10)
-                        
-                        # Solo poner un punto en el centroide del color dominante
-                        color_bgr = self.rangos_color.get(color_dominante, {}).get("color_bgr", (0, 255, 0))
-                        cv2.circle(imagen_patrones, (cx, cy), 5, color_bgr, -1)
-                        
-                        patron_info = {
-                            "tipo": "Contorno",
-                            "centroide": (cx, cy),
-                            "area": cv2.contourArea(cnt),
-                            "color_dominante": color_dominante
-                        }
-                        self.patrones_detectados.append(patron_info)
-                
-                info_patrones.append(f"Contornos detectados: {len(contornos_filtrados)}")
-            except Exception as e:
-                info_patrones.append(f"Error en contornos: {str(e)}")
+        x1, y1, x2, y2 = region
+        imagen = self.current_filtered_image
+        factor = max(1.0, max(x2 - x1, y2 - y1) / self.lado_proxy)
+        opciones = self.opciones_deteccion()
+        parametros = escalar_parametros(self.leer_parametros_deteccion(), factor)
+        self.vista_previa_en_curso = True
         
-        # Detectar rectángulos
-        if self.detectar_rectangulos.get():
+        def ejecutar():
+            inicio = time.time()
             try:
-                _, thresh = cv2.threshold(gris_suavizado, 127, 255, cv2.THRESH_BINARY)
-                contornos, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-                
-                rectangulos_detectados = 0
-                for i, cnt in enumerate(contornos):
-                    area = cv2.contourArea(cnt)
-                    if area > 500:
-                        peri = cv2.arcLength(cnt, True)
-                        approx = cv2.approxPolyDP(cnt, 0.02 * peri, True)
-                        
-                        if len(approx) == 4:
-                            rectangulos_detectados += 1
-                            
-                            M = cv2.moments(cnt)
-                            if M["m00"] != 0:
-                                cx = int(M["m10"] / M["m00"])
-                                cy = int(M["m01"] / M["m00"])
-                                
-                                color_dominante = self.analizar_color_area(imagen, cx, cy, 15)
-                                
-                                # Solo poner un punto en el centro del color dominante
-                                color_bgr = self.rangos_color.get(color_dominante, {}).get("color_bgr", (0, 255, 0))
-                                cv2.circle(imagen_patrones, (cx, cy), 5, color_bgr, -1)
-                                
-                                patron_info = {
-                                    "tipo": "Rectángulo",
-                                    "centro": (cx, cy),
-                                    "area": area,
-                                    "color_dominante": color_dominante,
-                                    "esquinas": len(approx)
-                                }
-                                self.patrones_detectados.append(patron_info)
-                
-                info_patrones.append(f"Rectángulos detectados: {rectangulos_detectados}")
+                proxy = imagen[y1:y2, x1:x2]
+                if factor > 1:
+                    proxy = cv2.resize(proxy, (max(1, round((x2 - x1) / factor)), max(1, round((y2 - y1) / factor))),
+                                       interpolation=cv2.INTER_AREA)
+                patrones, info_patrones = detectar_patrones(proxy, self.clasificador_color, opciones, parametros)
+                resultado = (patrones.escalar(factor).desplazar(x1, y1), info_patrones, factor, time.time() - inicio)
+                self.root.after(0, lambda: self.finalizar_vista_previa(imagen, resultado))
             except Exception as e:
-                info_patrones.append(f"Error en rectángulos: {str(e)}")
+                self.root.after(0, lambda error=e: self.finalizar_vista_previa(imagen, None, error))
         
-        # Detectar líneas
-        if self.detectar_lineas.get():
-            try:
-                bordes = cv2.Canny(gris_suavizado, 50, 150, apertureSize=3)
-                lineas = cv2.HoughLinesP(bordes, 1, np.pi/180, threshold=50, 
-                                    minLineLength=30, maxLineGap=10)
-                
-                if lineas is not None:
-                    lineas_detectadas = 0
-                    for linea in lineas:
-                        x1, y1, x2, y2 = linea[0]
-                        mx, my = (x1 + x2) // 2, (y1 + y2) // 2
-                        color_dominante = self.analizar_color_area(imagen, mx, my, 5)
-                        
-                        # Solo poner un punto en el punto medio del color dominante
-                        color_bgr = self.rangos_color.get(color_dominante, {}).get("color_bgr", (0, 255, 0))
-                        cv2.circle(imagen_patrones, (mx, my), 5, color_bgr, -1)
-                        
-                        patron_info = {
-                            "tipo": "Línea",
-                            "punto_medio": (mx, my),
-                            "longitud": np.sqrt((x2-x1)**2 + (y2-y1)**2),
-                            "color_dominante": color_dominante,
-                            "puntos": [(x1, y1), (x2, y2)]
-                        }
-                        self.patrones_detectados.append(patron_info)
-                        lineas_detectadas += 1
-                    
-                    info_patrones.append(f"Líneas detectadas: {lineas_detectadas}")
-            except Exception as e:
-                info_patrones.append(f"Error en líneas: {str(e)}")
+        thread = threading.Thread(target=ejecutar)
+        thread.daemon = True
+        thread.start()
+    
+    def finalizar_vista_previa(self, imagen, resultado, error=None):
+        self.vista_previa_en_curso = False
+        if self.vista_previa_pendiente:
+            # Los parámetros cambiaron mientras se calculaba: este resultado ya no vale
+            self.vista_previa_pendiente = False
+            self.lanzar_vista_previa()
+            return
+        if error is not None:
+            self.mostrar_estado(f"❌ Error in detection preview: {error}")
+            return
+        if imagen is not self.current_filtered_image or self.cancelar_deteccion is not None:
+            return
         
-        return imagen_patrones, info_patrones
+        patrones, info_patrones, factor, duracion = resultado
+        # El coste crece con el área del proxy: se ajusta su lado para quedar dentro del presupuesto
+        ajuste = math.sqrt(self.presupuesto_vista_previa / max(duracion, 1e-3))
+        self.lado_proxy = int(min(1536, max(256, self.lado_proxy * min(2.0, ajuste))))
+        
+        self.establecer_patrones(patrones)
+        self.dibujar_superposicion()
+        self.mostrar_resultados_patrones(info_patrones)
+        self.mostrar_estado(f"👁 Preview at 1/{factor:.1f} scale: {len(patrones)} patterns "
+                            f"in {duracion * 1000:.0f} ms")
+    
+    def imagen_con_marcadores(self):
+        """Copia de la imagen actual con los marcadores visibles dibujados, para guardar"""
+        if not self.mostrar_centroides.get() or not len(self.patrones_detectados):
+            return self.current_filtered_image
+        return dibujar_patrones(self.current_filtered_image.copy(), self.patrones_detectados,
+                                self.rangos_color, self.radio_marcador.get())
     
-    def analizar_color_area(self, imagen, x, y, radio):
+    def analizar_color_area(self, imagen, x, y, radio, integral=None):
         try:
-            h, w = imagen.shape[:2]
-            x1 = max(0, x - radio)
-            y1 = max(0, y - radio)
-            x2 = min(w, x + radio)
-            y2 = min(h, y + radio)
-            
-            roi = imagen[y1:y2, x1:x2]
-            
-            if roi.size == 0:
-                return "Desconocido"
-            
-            roi_hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
-            conteo_colores = {}
-            
-            for color_name, config in self.rangos_color.items():
-                if color_name == "Rojo":
-                    mascara1 = cv2.inRange(roi_hsv, config["hsv_bajo1"], config["hsv_alto1"])
-                    mascara2 = cv2.inRange(roi_hsv, config["hsv_bajo2"], config["hsv_alto2"])
-                    mascara_color = cv2.bitwise_or(mascara1, mascara2)
-                else:
-                    mascara_color = cv2.inRange(roi_hsv, config["hsv_bajo"], config["hsv_alto"])
-                
-                conteo = np.sum(mascara_color > 0)
-                if conteo > 0:
-                    conteo_colores[color_name] = conteo
-            
-            if conteo_colores:
-                return max(conteo_colores, key=conteo_colores.get)
-            else:
-                return "Sin color definido"
+            if integral is not None:
+                return integral.color_dominante(x, y, radio)
+            return color_dominante_roi(imagen, self.clasificador_color, x, y, radio)
                 
         except Exception as e:
             return f"Error: {str(e)}"
     
+    def establecer_patrones(self, catalogo):
+        """Sustituye el catálogo de patrones y reconstruye su índice espacial"""
+        self.patrones_detectados = catalogo
+        self.indice_patrones.limpiar()
+        self.indice_patrones.insertar_puntos(np.arange(len(catalogo)), catalogo.datos["x"], catalogo.datos["y"])
+    
+    def patrones_en_radio(self, x, y, radio):
+        """Patrones a distancia <= radio (píxeles de imagen), del más cercano al más lejano"""
+        return self.patrones_detectados[np.array(self.indice_patrones.en_radio(x, y, radio), dtype=np.int64)]
+    
+    def patron_mas_cercano(self, x, y, radio_max=None):
+        """(índice en el catálogo, distancia) del patrón más cercano, o None"""
+        return self.indice_patrones.mas_cercano(x, y, radio_max)
+    
     def mostrar_resultados_patrones(self, info_patrones):
+        """Muestra el catálogo paginado; los detectores que fallaron se listan encima de la tabla"""
+        self.errores_patrones = [linea for linea in info_patrones if linea.startswith("Error en")]
+        self.actualizar_vista_patrones()
+    
+    def actualizar_vista_patrones(self, event=None):
+        """Aplica filtro y orden del panel al catálogo y vuelve a la primera página"""
+        tipo = self.filtro_tipo_patron.get()
+        color = self.filtro_color_patron.get()
+        vista = self.patrones_detectados.filtrar(tipo=None if tipo == "All" else tipo,
+                                                 color=None if color == "All" else color)
+        orden = self.ordenes_patrones.get(self.orden_patrones.get())
+        if orden is not None:
+            vista = vista.ordenar(*orden)
+        
+        self.patrones_vista = vista
+        self.pagina_patrones = 0
+        self.mostrar_pagina_patrones()
+    
+    def total_paginas_patrones(self):
+        return max(1, -(-len(self.patrones_vista) // self.tamano_pagina_patrones))
+    
+    def cambiar_pagina_patrones(self, delta):
+        self.pagina_patrones = min(max(0, self.pagina_patrones + delta), self.total_paginas_patrones() - 1)
+        self.mostrar_pagina_patrones()
+    
+    def mostrar_pagina_patrones(self):
         texto = "PATTERN DETECTION RESULTS\n"
         texto += "=" * 50 + "\n\n"
         
-        # for info in info_patrones:
-        #     texto += f"• {info}\n"
+        for error in self.errores_patrones:
+            texto += f"❌ {error}\n"
+        if self.errores_patrones:
+            texto += "\n"
+        
+        for tipo, conteo in self.patrones_detectados.conteos_por_tipo().items():
+            if conteo:
+                texto += f"• {tipo}: {conteo}\n"
         
         texto += "\nDETALLES POR PATRÓN:\n" + "-" * 30 + "\n"
         
-        for i, patron in enumerate(self.patrones_detectados, 1):
-            texto += f"\n{i}. {patron['tipo']}:\n"
-            texto += f"   - Color dominante: {patron['color_dominante']}\n"
-            texto += f"   - Área: {patron.get('area', 'N/A'):.1f}\n"
-            
-            if 'centro' in patron:
-                texto += f"   - Centro: {patron['centro']}\n"
-            if 'radio' in patron:
-                texto += f"   - Radio: {patron['radio']} px\n"
-            # Se eliminó la línea del perímetro
+        inicio = self.pagina_patrones * self.tamano_pagina_patrones
+        pagina = self.patrones_vista.pagina(self.pagina_patrones, self.tamano_pagina_patrones)
+        for i in range(len(pagina)):
+            texto += f"\n{inicio + i + 1}. {pagina.describir(i)}"
         
-        texto += f"\nTotal de patrones detectados: {len(self.patrones_detectados)}"
+        texto += f"\nMostrando {len(pagina)} de {len(self.patrones_vista)} (total detectados: {len(self.patrones_detectados)})"
         
+        self.pagina_patrones_label.config(text=f"Page {self.pagina_patrones + 1} / {self.total_paginas_patrones()}")
         self.pattern_results_text.config(state='normal')
         self.pattern_results_text.delete(1.0, tk.END)
         self.pattern_results_text.insert(1.0, texto)
         self.pattern_results_text.config(state='disabled')
     
+    def exportar_patrones(self):
+        """Exporta los patrones filtrados del panel a CSV o NPZ"""
+        if not len(self.patrones_vista):
+            messagebox.showwarning("Warning", "No patterns to export")
+            return
+        
+        ruta = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("NumPy NPZ", "*.npz")]
+        )
+        
+        if ruta:
+            try:
+                if ruta.lower().endswith(".npz"):
+                    self.patrones_vista.exportar_npz(ruta)
+                else:
+                    self.patrones_vista.exportar_csv(ruta)
+                self.mostrar_estado(f"✅ {len(self.patrones_vista)} patterns exported to {os.path.basename(ruta)}")
+            except Exception as e:
+                messagebox.showerror("Error", f"Could not export patterns: {e}")
+    
     def limpiar_patrones(self):
-        self.patrones_detectados = []
+        self.establecer_patrones(CatalogoPatrones.vacio(self.clasificador_color.colores_dominantes))
+        self.patrones_vista = self.patrones_detectados
+        self.errores_patrones = []
+        self.pagina_patrones = 0
+        self.pagina_patrones_label.config(text="Page 0 / 0")
         self.pattern_results_text.config(state='normal')
         self.pattern_results_text.delete(1.0, tk.END)
         self.pattern_results_text.config(state='disabled')
         
-        # Solo limpiar si el filtro de patrones está activo
-        patron_filters = [f for f in self.active_filters if "Pattern Detection" in f]
-        for filter_name in patron_filters:
-            index = self.active_filters.index(filter_name)
-            self.active_filters.pop(index)
-            self.filters_listbox.delete(index)
-        
-        if patron_filters:
-            self.reapply_all_filters()
+        self.canvas.delete("marcador")
         
         self.mostrar_estado("🔄 Pattern detection cleared")
 
@@ -767,6 +939,8 @@ class NASAImageExplorerPro:
                   command=self.mostrar_ventanas_individuales).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
         ttk.Button(btn_frame, text="Reset to Original", 
                   command=self.reset_color_ranges).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
+        ttk.Button(btn_frame, text="Export Stats", 
+                  command=self.exportar_estadisticas_color).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
         
         stats_frame = ttk.LabelFrame(ranges_frame, text="Detection Statistics", padding=5)
         stats_frame.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
@@ -788,6 +962,21 @@ class NASAImageExplorerPro:
         ttk.Button(analysis_frame, text="🧠 AI Image Analysis", 
                   command=self.analizar_imagen_ia).pack(fill=tk.X, pady=2)
         
+        progreso_frame = ttk.Frame(analysis_frame)
+        progreso_frame.pack(fill=tk.X, pady=2)
+        ttk.Progressbar(progreso_frame, variable=self.progreso_ia, maximum=1.0).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        ttk.Button(progreso_frame, text="⏹", width=3, command=self.cancelar_analisis_ia).pack(side=tk.LEFT, padx=(2, 0))
+        
+        tiles_frame = ttk.Frame(analysis_frame)
+        tiles_frame.pack(fill=tk.X, pady=2)
+        ttk.Checkbutton(tiles_frame, text="Tiled analysis", variable=self.analisis_teselas).pack(side=tk.LEFT)
+        ttk.Label(tiles_frame, text="Batch:").pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Spinbox(tiles_frame, from_=1, to=64, width=4, textvariable=self.lote_teselas).pack(side=tk.LEFT, padx=2)
+        ttk.Checkbutton(analysis_frame, text="Caption each tile (slow)",
+                       variable=self.describir_teselas).pack(anchor=tk.W)
+        ttk.Checkbutton(analysis_frame, text="Show AI label map", variable=self.mostrar_mapa_ia,
+                       command=self.dibujar_superposicion).pack(anchor=tk.W)
+        
         ttk.Label(analysis_frame, text="OpenCV Filters:", font=('Arial', 9, 'bold')).pack(anchor=tk.W, pady=(10,0))
         
         filter_frame = ttk.Frame(analysis_frame)
@@ -842,8 +1031,8 @@ class NASAImageExplorerPro:
         
         self.canvas = tk.Canvas(canvas_container, 
                                bg="black",
-                               yscrollcommand=self.v_scrollbar.set,
-                               xscrollcommand=self.h_scrollbar.set,
+                               yscrollcommand=lambda *vista: self.on_canvas_scroll(self.v_scrollbar, *vista),
+                               xscrollcommand=lambda *vista: self.on_canvas_scroll(self.h_scrollbar, *vista),
                                cursor="crosshair")
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
@@ -1000,34 +1189,13 @@ class NASAImageExplorerPro:
         self.set_image(image)
         
     def create_simulated_starfield(self, width, height):
-        image = Image.new('RGB', (width, height), color='black')
-        draw = ImageDraw.Draw(image)
-        
-        np.random.seed(42)
-        for _ in range(100):
-            x = np.random.randint(0, width)
-            y = np.random.randint(0, height)
-            size = np.random.exponential(1) + 0.5
-            
-            colors = [(255, 255, 255), (255, 200, 100), (100, 150, 255)]
-            color = colors[np.random.randint(0, len(colors))]
-            
-            draw.ellipse([x-size, y-size, x+size, y+size], fill=color)
-            
-        return image
+        image = campo_estelar(width, height, 100)
+        return Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
         
     def create_simulated_lunar_surface(self, width, height):
-        image = Image.new('RGB', (width, height), color=(100, 100, 100))
-        draw = ImageDraw.Draw(image)
-        
-        for _ in range(50):
-            x = np.random.randint(0, width)
-            y = np.random.randint(0, height)
-            size = np.random.randint(5, 20)
-            draw.ellipse([x-size, y-size, x+size, y+size], 
-                        outline=(150, 150, 150), fill=(80, 80, 80))
-            
-        return image
+        image = superficie_craterizada(width, height, 50, 5, 20, fondo=(100, 100, 100),
+                                       relleno=(80, 80, 80), borde=(150, 150, 150))
+        return Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
         
     def create_simulated_earth_view(self, width, height):
         image = Image.new('RGB', (width, height), color=(0, 0, 50))
@@ -1066,6 +1234,10 @@ class NASAImageExplorerPro:
                 messagebox.showerror("Error", f"Could not load image: {str(e)}")
 
     def set_image(self, image):
+        # Primero la versión: un análisis que lea la imagen a la vez ya se sabe obsoleto
+        self.version_imagen += 1
+        self.cola_analisis.cancelar()
+        self.progreso_ia.set(0.0)
         self.original_image = image
         self.images["primary"] = image
         self.active_image_id = "primary"
@@ -1074,7 +1246,12 @@ class NASAImageExplorerPro:
         self.zoom_slider.set(100)
         
         self.cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+        self.mapa_ia = None
+        self.planos = CachePlanosImagen(self.cv_image, self.tile_size)
+        self.histogramas_color = HistogramasColorTeselas(self.planos, self.clasificador_color, self.tile_size)
         self.current_filtered_image = self.cv_image.copy()
+        self.establecer_patrones(CatalogoPatrones.vacio(self.clasificador_color.colores_dominantes))
+        self.cache_deteccion.limpiar()
         
         self.divide_image_into_tiles()
         self.generar_todos_filtros_automatico()
@@ -1107,6 +1284,7 @@ class NASAImageExplorerPro:
             return
             
         self.current_tiles = {}
+        self.planos_vista = CachePlanosImagen(self.current_filtered_image, self.tile_size)
         height, width = self.current_filtered_image.shape[:2]
         
         for y in range(0, height, self.tile_size):
@@ -1124,16 +1302,10 @@ class NASAImageExplorerPro:
             self.display_full_image()
         else:
             self.display_visible_tiles()
+        self.dibujar_superposicion()
             
     def display_full_image(self):
-        if len(self.current_filtered_image.shape) == 3:
-            if self.current_filtered_image.shape[2] == 3:
-                image_rgb = cv2.cvtColor(self.current_filtered_image, cv2.COLOR_BGR2RGB)
-            else:
-                image_rgb = cv2.cvtColor(self.current_filtered_image, cv2.COLOR_GRAY2RGB)
-        else:
-            image_rgb = cv2.cvtColor(self.current_filtered_image, cv2.COLOR_GRAY2RGB)
-            
+        image_rgb = self.planos_vista.plano("rgb")
         image_pil = Image.fromarray(image_rgb)
         
         width = int(image_pil.width * self.scale)
@@ -1149,6 +1321,89 @@ class NASAImageExplorerPro:
         self.zoom_label.config(text=f"{int(self.scale * 100)}%")
         self.status_var.set(f"Displaying: {width}x{height} pixels | Zoom: {int(self.scale * 100)}% | Filters: {len(self.active_filters)}")
 
+    def on_canvas_scroll(self, scrollbar, *vista):
+        scrollbar.set(*vista)
+        self.programar_superposicion()
+    
+    def programar_superposicion(self):
+        """Agrupa los cambios de vista y redibuja la superposición una vez cuando la interfaz quede libre"""
+        if not self.superposicion_pendiente:
+            self.superposicion_pendiente = True
+            self.root.after_idle(self.dibujar_superposicion)
+    
+    def dibujar_superposicion(self):
+        """Dibuja solo las etiquetas que caen en la región visible, consultando el índice espacial"""
+        self.superposicion_pendiente = False
+        self.canvas.delete("overlay")
+        
+        region = self.obtener_region_visible()
+        if region is None:
+            return
+        
+        origen = self.origen_imagen()
+        for ident in self.indice_etiquetas.en_rectangulo(*region):
+            label_data = self.labels[ident]
+            x1, y1, x2, y2 = self.rectangulo_en_canvas(label_data["coords"], origen)
+            self.canvas.create_rectangle(x1, y1, x2, y2, outline="yellow", width=2,
+                                         tags=("overlay", "permanent_label"))
+            self.canvas.create_text(x1, y1 - 10, text=label_data["name"], fill="yellow", anchor=tk.SW,
+                                    tags=("overlay", "permanent_label"))
+        
+        if self.mapa_ia is not None and self.mostrar_mapa_ia.get():
+            self.dibujar_mapa_ia(region, origen)
+        
+        if self.mostrar_centroides.get():
+            self.dibujar_marcadores(region, origen)
+    
+    def dibujar_mapa_ia(self, region, origen):
+        """Rejilla del análisis por teselas con la etiqueta de cada tesela visible"""
+        mapa = self.mapa_ia
+        for fila, columna, coords in mapa.teselas_en(*region):
+            x1, y1, x2, y2 = self.rectangulo_en_canvas(coords, origen)
+            self.canvas.create_rectangle(x1, y1, x2, y2, outline="cyan", dash=(4, 4), tags=("overlay", "mapa_ia"))
+            codigo = mapa.codigos[fila, columna]
+            if codigo >= 0:
+                texto = f"{chr(65 + codigo % 26)} {mapa.etiquetas[codigo].split(',')[0]} {mapa.puntuaciones[fila, columna] * 100:.0f}%"
+                self.canvas.create_text(x1 + 4, y1 + 4, text=texto, fill="cyan", anchor=tk.NW, width=max(x2 - x1 - 8, 1),
+                                        tags=("overlay", "mapa_ia"))
+    
+    def color_marcador(self, codigo):
+        nombre = self.patrones_detectados.colores[codigo]
+        return self.get_color_hex(self.rangos_color.get(nombre, {}).get("color_bgr", (0, 255, 0)))
+    
+    def dibujar_marcadores(self, region, origen):
+        """Un óvalo por patrón visible, de tamaño fijo en pantalla; como mucho max_marcadores"""
+        ids = np.array(self.indice_patrones.en_rectangulo(*region), dtype=np.int64)
+        if ids.size > self.max_marcadores:
+            ids = ids[np.linspace(0, ids.size - 1, self.max_marcadores).astype(np.int64)]
+            self.mostrar_estado(f"Showing {self.max_marcadores} of the visible patterns, zoom in for all")
+        
+        datos = self.patrones_detectados.datos[np.sort(ids)]
+        radio = self.radio_marcador.get()
+        anillo = self.estilo_marcador.get() == "Ring"
+        for codigo in np.unique(datos["color"]):
+            color = self.color_marcador(codigo)
+            relleno, borde = ("", color) if anillo else (color, "")
+            tags = ("overlay", "marcador", f"marcador_{codigo}")
+            grupo = datos[datos["color"] == codigo]
+            for x, y in zip(origen[0] + grupo["x"] * self.scale, origen[1] + grupo["y"] * self.scale):
+                self.canvas.create_oval(x - radio, y - radio, x + radio, y + radio,
+                                        fill=relleno, outline=borde, width=2, tags=tags)
+    
+    def alternar_marcadores(self):
+        """Mostrar u ocultar marcadores sin tocar la imagen"""
+        if self.mostrar_centroides.get():
+            self.dibujar_superposicion()
+        else:
+            self.canvas.delete("marcador")
+    
+    def reestilizar_marcadores(self):
+        """Cambia punto/anillo sobre los elementos ya dibujados, por color, sin recrearlos"""
+        anillo = self.estilo_marcador.get() == "Ring"
+        for codigo in range(len(self.patrones_detectados.colores)):
+            color = self.color_marcador(codigo)
+            self.canvas.itemconfigure(f"marcador_{codigo}", fill="" if anillo else color, outline=color if anillo else "")
+
     def display_visible_tiles(self):
         self.canvas.delete("all")
         
@@ -1185,14 +1440,7 @@ class NASAImageExplorerPro:
                 display_width = int(tile_width * self.scale)
                 display_height = int(tile_height * self.scale)
                 
-                if len(tile.shape) == 3:
-                    if tile.shape[2] == 3:
-                        tile_rgb = cv2.cvtColor(tile, cv2.COLOR_BGR2RGB)
-                    else:
-                        tile_rgb = cv2.cvtColor(tile, cv2.COLOR_GRAY2RGB)
-                else:
-                    tile_rgb = cv2.cvtColor(tile, cv2.COLOR_GRAY2RGB)
-                    
+                tile_rgb = self.planos_vista.tesela("rgb", x, y)
                 tile_pil = Image.fromarray(tile_rgb)
                 resized_tile = tile_pil.resize((display_width, display_height), Image.Resampling.LANCZOS)
                 tile_photo = ImageTk.PhotoImage(resized_tile)
@@ -1221,15 +1469,21 @@ class NASAImageExplorerPro:
             if img_width < canvas_width and img_height < canvas_height:
                 x_offset = (canvas_width - img_width) / 2
                 y_offset = (canvas_height - img_height) / 2
+                ox, oy = self.origen_imagen()
                 self.canvas.coords(self.canvas_image, x_offset, y_offset)
-                self.canvas.config(scrollregion=self.canvas.bbox(tk.ALL))
+                # La superposición va en coordenadas de canvas: se desplaza con la imagen
+                self.canvas.move("overlay", x_offset - ox, y_offset - oy)
+                self.canvas.config(scrollregion=self.canvas.bbox(self.canvas_image))
 
-    def aplicar_filtros_color_avanzados(self, imagen):
+    def aplicar_filtros_color_avanzados(self, imagen, planos=None):
+        if planos is None:
+            planos = CachePlanosImagen(imagen, self.tile_size)
+        
         filtros = {}
         
         filtros["Original"] = imagen
         
-        gris = cv2.cvtColor(imagen, cv2.COLOR_BGR2GRAY)
+        gris = planos.gris()
         filtros["Escala de Grises"] = cv2.cvtColor(gris, cv2.COLOR_GRAY2BGR)
         
         _, bn = cv2.threshold(gris, 127, 255, cv2.THRESH_BINARY)
@@ -1250,7 +1504,7 @@ class NASAImageExplorerPro:
         filtros["Canal Verde"] = cv2.merge([zeros, g, zeros])
         filtros["Canal Azul"] = cv2.merge([b, zeros, zeros])
         
-        hsv = cv2.cvtColor(imagen, cv2.COLOR_BGR2HSV)
+        hsv = planos.hsv()
         filtros["HSV Color"] = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
         
         filtros["Desenfoque Gaussiano"] = cv2.GaussianBlur(imagen, (15, 15), 0)
@@ -1261,22 +1515,19 @@ class NASAImageExplorerPro:
         
         filtros["Filtro Bilateral"] = cv2.bilateralFilter(imagen, 9, 75, 75)
         
-        lab = cv2.cvtColor(imagen, cv2.COLOR_BGR2LAB)
-        l, a, b = cv2.split(lab)
+        l, a, b = cv2.split(planos.lab())
         clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
         l = clahe.apply(l)
         lab = cv2.merge([l, a, b])
         filtros["Alto Contraste"] = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
         
-        hsv = cv2.cvtColor(imagen, cv2.COLOR_BGR2HSV)
-        h, s, v = cv2.split(hsv)
+        h, s, v = cv2.split(planos.hsv())
         v = cv2.add(v, 50)
         v = np.clip(v, 0, 255)
         hsv = cv2.merge([h, s, v])
         filtros["Brillo Aumentado"] = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
         
-        ycrcb = cv2.cvtColor(imagen, cv2.COLOR_BGR2YCrCb)
-        y, cr, cb = cv2.split(ycrcb)
+        y, cr, cb = cv2.split(planos.ycrcb())
         y = cv2.equalizeHist(y)
         ycrcb = cv2.merge([y, cr, cb])
         filtros["Histograma Ecualizado"] = cv2.cvtColor(ycrcb, cv2.COLOR_YCrCb2BGR)
@@ -1295,7 +1546,7 @@ class NASAImageExplorerPro:
     
     def _generar_todos_filtros_thread(self):
         try:
-            todos_filtros = self.aplicar_filtros_color_avanzados(self.cv_image)
+            todos_filtros = self.aplicar_filtros_color_avanzados(self.cv_image, self.planos)
             
             for nombre, filtro in todos_filtros.items():
                 self.transformaciones[nombre] = filtro
@@ -1335,8 +1586,7 @@ class NASAImageExplorerPro:
             
         elif filter_type == "hsv_color":
             filter_name = "HSV Color"
-            hsv = cv2.cvtColor(self.cv_image, cv2.COLOR_BGR2HSV)
-            filtered_image = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+            filtered_image = cv2.cvtColor(self.planos.hsv(), cv2.COLOR_HSV2BGR)
             
         elif filter_type == "sepia":
             filter_name = "Sepia"
@@ -1348,12 +1598,12 @@ class NASAImageExplorerPro:
             
         elif filter_type == "grayscale":
             filter_name = "Escala de Grises"
-            gris = cv2.cvtColor(self.cv_image, cv2.COLOR_BGR2GRAY)
+            gris = self.planos.gris()
             filtered_image = cv2.cvtColor(gris, cv2.COLOR_GRAY2BGR)
             
         elif filter_type == "black_white":
             filter_name = "Blanco y Negro"
-            gris = cv2.cvtColor(self.cv_image, cv2.COLOR_BGR2GRAY)
+            gris = self.planos.gris()
             _, bw = cv2.threshold(gris, 127, 255, cv2.THRESH_BINARY)
             filtered_image = cv2.cvtColor(bw, cv2.COLOR_GRAY2BGR)
             
@@ -1377,18 +1627,24 @@ class NASAImageExplorerPro:
             return
             
         try:
-            image_float = self.cv_image.astype(np.float32) / 255.0
-            
             brightness = self.brightness_var.get()
-            image_adjusted = image_float * brightness
-            
             contrast = self.contrast_var.get()
-            image_adjusted = (image_adjusted - 0.5) * contrast + 0.5
-            
-            hsv = cv2.cvtColor(np.clip(image_adjusted, 0, 1), cv2.COLOR_BGR2HSV)
             saturation = self.saturation_var.get()
-            hsv[:, :, 1] = np.clip(hsv[:, :, 1] * saturation, 0, 1)
-            image_adjusted = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+            
+            if brightness == 1.0 and contrast == 1.0:
+                # Sin brillo ni contraste el HSV es el de la imagen original: se reutiliza de la caché
+                image_adjusted = self.cv_image.astype(np.float32) / 255.0
+                hsv = self.planos.plano("hsv_float") if saturation != 1.0 else None
+            else:
+                image_float = self.cv_image.astype(np.float32) / 255.0
+                image_adjusted = image_float * brightness
+                image_adjusted = np.clip((image_adjusted - 0.5) * contrast + 0.5, 0, 1)
+                hsv = cv2.cvtColor(image_adjusted, cv2.COLOR_BGR2HSV) if saturation != 1.0 else None
+            
+            if hsv is not None:
+                h, s, v = cv2.split(hsv)
+                s = np.clip(s * saturation, 0, 1)
+                image_adjusted = cv2.cvtColor(cv2.merge([h, s, v]), cv2.COLOR_HSV2BGR)
             
             image_adjusted = np.clip(image_adjusted * 255, 0, 255).astype(np.uint8)
             
@@ -1421,69 +1677,47 @@ class NASAImageExplorerPro:
             return
         
         try:
-            if not hasattr(self, 'imagen_hsv') or self.imagen_hsv is None:
-                self.imagen_hsv = cv2.cvtColor(self.cv_image, cv2.COLOR_BGR2HSV)
-            
-            mascara_combinada = np.zeros(self.imagen_hsv.shape[:2], dtype=np.uint8)
-            imagen_resultado = np.zeros_like(self.cv_image)
-            
-            estadisticas = []
-            total_pixeles = self.imagen_hsv.shape[0] * self.imagen_hsv.shape[1]
-            
-            for color_name, var in self.vars_color.items():
-                if var.get():
-                    config = self.rangos_color[color_name]
-                    
-                    if color_name == "Rojo":
-                        mascara1 = cv2.inRange(self.imagen_hsv, config["hsv_bajo1"], config["hsv_alto1"])
-                        mascara2 = cv2.inRange(self.imagen_hsv, config["hsv_bajo2"], config["hsv_alto2"])
-                        mascara_color = cv2.bitwise_or(mascara1, mascara2)
-                    else:
-                        mascara_color = cv2.inRange(self.imagen_hsv, config["hsv_bajo"], config["hsv_alto"])
-                    
-                    mascara_combinada = cv2.bitwise_or(mascara_combinada, mascara_color)
-                    
-                    imagen_color = np.zeros_like(self.cv_image)
-                    imagen_color[mascara_color > 0] = config["color_bgr"]
-                    imagen_resultado = cv2.add(imagen_resultado, imagen_color)
-                    
-                    pixeles_color = np.sum(mascara_color > 0)
-                    porcentaje = (pixeles_color / total_pixeles) * 100
-                    estadisticas.append(f"{color_name}: {pixeles_color:,} píxeles ({porcentaje:.2f}%)")
-            
-            imagen_final = cv2.addWeighted(self.cv_image, 0.3, imagen_resultado, 0.7, 0)
-            
-            self.current_filtered_image = imagen_final
-            self.update_filtered_tiles()
-            self.display_current_image()
+            seleccion = [color_name for color_name, var in self.vars_color.items() if var.get()]
+            
+            # Solo se repintan las teselas con algún color añadido o quitado de la selección
+            imagen_final, repintadas = self.histogramas_color.superposicion(seleccion)
+            estadisticas = self.calcular_estadisticas_color(seleccion)
+            
+            if imagen_final is not self.current_filtered_image:
+                self.current_filtered_image = imagen_final
+                self.update_filtered_tiles()
+                self.display_current_image()
             
-            self.mostrar_estadisticas_color(estadisticas, total_pixeles)
+            self.mostrar_estadisticas_color(estadisticas)
             
             filter_name = "Color Ranges Detection"
             if filter_name not in self.active_filters:
                 self.active_filters.append(filter_name)
                 self.filters_listbox.insert(tk.END, filter_name)
             
-            self.mostrar_estado("✅ Rangos de color aplicados")
+            self.mostrar_estado(f"✅ Rangos de color aplicados ({len(repintadas)} teselas repintadas)")
             
         except Exception as e:
             self.mostrar_estado(f"❌ Error aplicando rangos de color: {e}")
             messagebox.showerror("Error", f"Error al procesar rangos de color: {str(e)}")
     
-    def mostrar_estadisticas_color(self, estadisticas, total_pixeles):
-        texto = f"PÍXELES TOTALES: {total_pixeles:,}\n"
+    def calcular_estadisticas_color(self, seleccion=None):
+        """Estadísticas estructuradas de los rangos de color de la imagen actual"""
+        if seleccion is None:
+            seleccion = [color_name for color_name, var in self.vars_color.items() if var.get()]
+        return self.histogramas_color.estadisticas(seleccion)
+    
+    def mostrar_estadisticas_color(self, estadisticas):
+        texto = f"PÍXELES TOTALES: {estadisticas.total_pixeles:,}\n"
         texto += "=" * 50 + "\n\n"
         
-        if estadisticas:
-            for stat in estadisticas:
-                texto += f"• {stat}\n"
-            
-            pixeles_detectados = sum(int(stat.split(":")[1].split(" ")[1].replace(",", "")) 
-                                   for stat in estadisticas)
-            pixeles_no_detectados = total_pixeles - pixeles_detectados
-            porcentaje_no_detectado = (pixeles_no_detectados / total_pixeles) * 100
+        if estadisticas.colores:
+            for color_name in estadisticas.colores:
+                pixeles_color = estadisticas.conteos[color_name]
+                porcentaje = estadisticas.porcentaje(pixeles_color)
+                texto += f"• {color_name}: {pixeles_color:,} píxeles ({porcentaje:.2f}%)\n"
             
-            texto += f"\n• No detectados: {pixeles_no_detectados:,} píxeles ({porcentaje_no_detectado:.2f}%)"
+            texto += f"\n• No detectados: {estadisticas.no_detectados:,} píxeles ({estadisticas.porcentaje_no_detectado:.2f}%)"
         else:
             texto += "No hay colores seleccionados para mostrar"
         
@@ -1503,29 +1737,43 @@ class NASAImageExplorerPro:
         
         self.mostrar_estado("🔄 Rangos de color restablecidos")
     
-    def mostrar_ventanas_individuales(self):
+    def exportar_estadisticas_color(self):
         if self.cv_image is None:
             messagebox.showwarning("Advertencia", "Primero carga una imagen")
             return
         
-        if not hasattr(self, 'imagen_hsv') or self.imagen_hsv is None:
-            self.imagen_hsv = cv2.cvtColor(self.cv_image, cv2.COLOR_BGR2HSV)
+        ruta = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("JSON", "*.json")]
+        )
+        
+        if ruta:
+            try:
+                estadisticas = self.calcular_estadisticas_color()
+                with open(ruta, "w", encoding="utf-8") as f:
+                    json.dump(estadisticas.a_dict(), f, indent=2, ensure_ascii=False)
+                self.mostrar_estado(f"✅ Estadísticas de color exportadas: {os.path.basename(ruta)}")
+            except Exception as e:
+                messagebox.showerror("Error", f"No se pudieron exportar las estadísticas: {e}")
+    
+    def mostrar_ventanas_individuales(self):
+        if self.cv_image is None:
+            messagebox.showwarning("Advertencia", "Primero carga una imagen")
+            return
         
         for color_name in self.rangos_color.keys():
             self.mostrar_color_individual(color_name)
     
+    def obtener_etiquetas_color(self):
+        """Imagen de etiquetas de color de la imagen actual, calculada una sola vez por imagen"""
+        self.histogramas_color.actualizar()
+        return self.histogramas_color.etiquetas
+    
     def mostrar_color_individual(self, color_name):
-        config = self.rangos_color[color_name]
+        etiquetas = self.obtener_etiquetas_color()
+        mascara_color = self.clasificador_color.mascara(etiquetas, color_name)
         
-        if color_name == "Rojo":
-            mascara1 = cv2.inRange(self.imagen_hsv, config["hsv_bajo1"], config["hsv_alto1"])
-            mascara2 = cv2.inRange(self.imagen_hsv, config["hsv_bajo2"], config["hsv_alto2"])
-            mascara_color = cv2.bitwise_or(mascara1, mascara2)
-        else:
-            mascara_color = cv2.inRange(self.imagen_hsv, config["hsv_bajo"], config["hsv_alto"])
-        
-        imagen_resultado = self.cv_image.copy()
-        imagen_resultado[mascara_color == 0] = 0
+        imagen_resultado = cv2.bitwise_and(self.cv_image, self.cv_image, mask=mascara_color)
         
         ventana = tk.Toplevel(self.root)
         ventana.title(f"Color {color_name}")
@@ -1541,8 +1789,8 @@ class NASAImageExplorerPro:
         label.image = imagen_tk
         label.pack(padx=20, pady=20)
         
-        total_pixeles = self.imagen_hsv.shape[0] * self.imagen_hsv.shape[1]
-        pixeles_color = np.sum(mascara_color > 0)
+        total_pixeles = etiquetas.size
+        pixeles_color = cv2.countNonZero(mascara_color)
         porcentaje = (pixeles_color / total_pixeles) * 100
         
         stats_label = tk.Label(ventana, 
@@ -1698,6 +1946,10 @@ class NASAImageExplorerPro:
         nombres = list(self.transformaciones.keys())
         transformaciones = list(self.transformaciones.values())
         
+        # matplotlib solo se importa la primera vez que se abre esta ventana
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        
         n_transformaciones = len(transformaciones)
         filas = int(np.ceil(np.sqrt(n_transformaciones)))
         columnas = int(np.ceil(n_transformaciones / filas))
@@ -1748,7 +2000,7 @@ class NASAImageExplorerPro:
         
         if ruta:
             try:
-                cv2.imwrite(ruta, self.current_filtered_image)
+                cv2.imwrite(ruta, self.imagen_con_marcadores())
                 messagebox.showinfo("Éxito", f"Imagen guardada como: {ruta}")
             except Exception as e:
                 messagebox.showerror("Error", f"No se pudo guardar la imagen: {e}")
@@ -1801,8 +2053,9 @@ class NASAImageExplorerPro:
         
     def on_mousewheel(self, event):
         if self.current_filtered_image is None: return
-        x = self.canvas.canvasx(event.x)
-        y = self.canvas.canvasy(event.y)
+        ox, oy = self.origen_imagen()
+        x = self.canvas.canvasx(event.x) - ox
+        y = self.canvas.canvasy(event.y) - oy
         if event.delta > 0 or event.num == 4:
             self.zoom_in(factor=1.2, center=(x, y))
         else:
@@ -1828,6 +2081,7 @@ class NASAImageExplorerPro:
             self.status_var.set("Navigation Mode")
 
     def cancel_current_operation(self):
+        self.cancelar_deteccion_completa()
         if self.current_label:
             self.canvas.delete(self.current_label)
             self.current_label = None
@@ -1836,8 +2090,9 @@ class NASAImageExplorerPro:
 
     def on_double_click(self, event):
         if self.current_filtered_image is None: return
-        x = self.canvas.canvasx(event.x)
-        y = self.canvas.canvasy(event.y)
+        ox, oy = self.origen_imagen()
+        x = self.canvas.canvasx(event.x) - ox
+        y = self.canvas.canvasy(event.y) - oy
         canvas_width = self.canvas.winfo_width()
         canvas_height = self.canvas.winfo_height()
         img_width = self.original_size[0] * self.scale
@@ -1885,21 +2140,33 @@ class NASAImageExplorerPro:
         self.last_mouse_x = event.x
         self.last_mouse_y = event.y
         if self.current_filtered_image is not None:
-            x = self.canvas.canvasx(event.x)
-            y = self.canvas.canvasy(event.y)
+            ox, oy = self.origen_imagen()
+            x = self.canvas.canvasx(event.x) - ox
+            y = self.canvas.canvasy(event.y) - oy
             if 0 <= x < self.original_size[0] * self.scale and 0 <= y < self.original_size[1] * self.scale:
                 orig_x = int(x / self.scale)
                 orig_y = int(y / self.scale)
-                self.status_var.set(f"Position: ({orig_x}, {orig_y}) | Zoom: {int(self.scale * 100)}% | Filters: {len(self.active_filters)}")
+                estado = f"Position: ({orig_x}, {orig_y}) | Zoom: {int(self.scale * 100)}% | Filters: {len(self.active_filters)}"
+                
+                # Patrón y etiquetas bajo el cursor (8 px de pantalla de tolerancia)
+                cercano = self.patron_mas_cercano(orig_x, orig_y, 8 / self.scale)
+                if cercano is not None:
+                    patron = self.patrones_detectados[cercano[0]]
+                    estado += f" | {patron.nombres_tipo[0]} ({patron.nombres_color[0]})"
+                etiquetas = self.indice_etiquetas.en_rectangulo(orig_x, orig_y, orig_x, orig_y)
+                if etiquetas:
+                    estado += " | " + ", ".join(self.labels[i]["name"] for i in etiquetas)
+                self.status_var.set(estado)
 
     def finalize_label(self, event):
         if self.current_label:
             end_x = self.canvas.canvasx(event.x)
             end_y = self.canvas.canvasy(event.y)
-            orig_start_x = int(self.start_x / self.scale)
-            orig_start_y = int(self.start_y / self.scale)
-            orig_end_x = int(end_x / self.scale)
-            orig_end_y = int(end_y / self.scale)
+            ox, oy = self.origen_imagen()
+            orig_start_x = int((self.start_x - ox) / self.scale)
+            orig_start_y = int((self.start_y - oy) / self.scale)
+            orig_end_x = int((end_x - ox) / self.scale)
+            orig_end_y = int((end_y - oy) / self.scale)
             
             if abs(orig_end_x - orig_start_x) > 5 and abs(orig_end_y - orig_start_y) > 5:
                 label_name = simpledialog.askstring("Feature Label", "Enter feature name or description:")
@@ -1911,17 +2178,11 @@ class NASAImageExplorerPro:
                         "mission": self.mission_var.get()
                     }
                     self.labels.append(label_data)
-                    self.canvas.itemconfig(self.current_label, dash=(), fill="", 
-                                         outline="yellow", width=2, tags="permanent_label")
-                    text_id = self.canvas.create_text(
-                        self.start_x, self.start_y - 10,
-                        text=label_name, fill="yellow", anchor=tk.SW, tags="permanent_label"
-                    )
-                    label_data["text_id"] = text_id
+                    self.indice_etiquetas.insertar(len(self.labels) - 1, *label_data["coords"])
                     self.status_var.set(f"Label added: {label_name}")
-            else:
-                self.canvas.delete(self.current_label)
+            self.canvas.delete(self.current_label)
             self.current_label = None
+            self.dibujar_superposicion()
 
     def save_viewport_state(self):
         if self.current_filtered_image is not None:
@@ -1983,52 +2244,110 @@ class NASAImageExplorerPro:
             messagebox.showwarning("Warning", "Please load an image first")
             return
         
-        if self.analizando:
-            messagebox.showinfo("Info", "Analysis already in progress")
-            return
-        
-        self.analizando = True
-        self.mostrar_estado("🔍 Starting AI analysis with internet search...")
-        
-        thread = threading.Thread(target=self._ejecutar_analisis_ia_internet)
-        thread.daemon = True
-        thread.start()
+        opciones = (self.analisis_teselas.get(), max(1, self.lote_teselas.get()), self.describir_teselas.get())
+        trabajo, nuevo = self.cola_analisis.encolar(self.version_imagen, opciones)
+        if nuevo:
+            self.progreso_ia.set(0.0)
+            self.mostrar_estado(f"🔍 AI analysis #{trabajo.id} queued...")
+        else:
+            self.mostrar_estado(f"ℹ️ AI analysis #{trabajo.id} of this image is already running")
+    
+    def cancelar_analisis_ia(self):
+        self.cola_analisis.cancelar()
+        self.progreso_ia.set(0.0)
+        self.mostrar_estado("⏹ AI analysis cancelled")
+    
+    def trabajo_vigente(self, trabajo):
+        """Un trabajo solo publica resultados si sigue siendo de la imagen actual y no se canceló"""
+        return trabajo.version == self.version_imagen and not trabajo.cancelado.is_set()
+    
+    def estado_trabajo(self, trabajo, mensaje, progreso=None):
+        if self.trabajo_vigente(trabajo):
+            if progreso is not None:
+                self.progreso_ia.set(progreso)
+            self.mostrar_estado(mensaje)
     
-    def _ejecutar_analisis_ia_internet(self):
+    def fallo_trabajo_analisis(self, trabajo, error):
+        """Excepción que escapó de _ejecutar_analisis_ia_internet, avisada desde el hilo de la cola"""
+        self.root.after(0, lambda: self.estado_trabajo(trabajo, f"❌ AI analysis #{trabajo.id} failed: {error}"))
+    
+    def _ejecutar_analisis_ia_internet(self, trabajo):
+        imagen, cv_image, analizador = self.original_image, self.cv_image, self.analizador
+        if not self.trabajo_vigente(trabajo):
+            return
         try:
-            self.limpiar_resultados_texto()
+            self.limpiar_resultados_texto(trabajo)
             
-            self.mostrar_estado("1️⃣ Running Basic Analysis with Internet Search...")
-            resultado_basico = self.analizador.analisis_basico_con_internet(self.original_image) if self.analizador else self._analisis_sin_modelos()
-            self.actualizar_resultado_basico(resultado_basico)
+            if analizador and analizador.en_cache(imagen):
+                self.estado_trabajo(trabajo, "⚡ Using cached AI results for this image")
+            elif analizador and not all(analizador.pool.cargado(nombre) for nombre in analizador.pool.MODELOS):
+                self.estado_trabajo(trabajo, "🔄 Loading AI models (first use, shared by all windows)...")
             
-            self.mostrar_estado("2️⃣ Running Planetary Analysis...")
-            resultado_planetario = self.analizador.analisis_planetario(self.original_image, "current_image") if self.analizador else self._analisis_planetario_simple()
-            self.actualizar_resultado_planetario(resultado_planetario)
+            grafo = self.grafo_analisis(trabajo, imagen, cv_image, analizador)
             
-            self.mostrar_estado("3️⃣ Running Stellar Analysis...")
-            resultado_estelar = self.analizador.analisis_estelar(self.original_image, "current_image") if self.analizador else self._analisis_estelar_simple()
-            self.actualizar_resultado_estelar(resultado_estelar)
+            def progreso(nombre, hechas, total):
+                trabajo.etapas[nombre] = hechas
+                self.estado_trabajo(trabajo, f"🔍 AI analysis #{trabajo.id}: {nombre} done ({hechas}/{total})",
+                                    hechas / total)
             
-            self.mostrar_estado("4️⃣ Running Advanced Analysis...")
-            resultado_avanzado = self.analizador.analisis_avanzado(self.original_image, "current_image") if self.analizador else self._analisis_avanzado_simple()
-            self.actualizar_resultado_avanzado(resultado_avanzado)
+            resultados, errores = grafo.ejecutar(progreso, cancelar=trabajo.cancelado)
+            if trabajo.cancelado.is_set():
+                return
             
-            self.mostrar_estado("✅ AI analysis with internet search completed")
+            if 'basico' in errores:
+                raise errores['basico']
+            if errores:
+                self.estado_trabajo(trabajo, f"⚠️ AI analysis completed, failed: {', '.join(errores)}", 1.0)
+            else:
+                self.estado_trabajo(trabajo, "✅ AI analysis with internet search completed", 1.0)
             
         except Exception as e:
             error_msg = f"❌ Analysis error: {str(e)}"
-            self.mostrar_estado(error_msg)
-            self.actualizar_resultado_basico(f"ERROR: {error_msg}\n\nTrying offline analysis...")
+            self.estado_trabajo(trabajo, error_msg)
+            self.actualizar_resultado_basico(f"ERROR: {error_msg}\n\nTrying offline analysis...", trabajo)
             
             try:
                 resultado_offline = self._analisis_sin_modelos()
-                self.actualizar_resultado_basico(resultado_offline)
+                self.actualizar_resultado_basico(resultado_offline, trabajo)
             except:
                 pass
-        
-        finally:
-            self.analizando = False
+    
+    def grafo_analisis(self, trabajo, imagen, cv_image, analizador):
+        """Etapas del análisis IA como grafo: los dos modelos y las heurísticas corren a la vez
+        y cada pestaña se rellena en cuanto su etapa termina, si el trabajo sigue vigente"""
+        def publicar(actualizar):
+            return lambda texto: actualizar(texto, trabajo)
+        
+        grafo = GrafoTareas(max_workers=4)
+        if not analizador:
+            grafo.agregar('basico', self._analisis_sin_modelos, al_terminar=publicar(self.actualizar_resultado_basico))
+            grafo.agregar('planetario', self._analisis_planetario_simple,
+                          al_terminar=publicar(self.actualizar_resultado_planetario))
+            grafo.agregar('estelar', self._analisis_estelar_simple, al_terminar=publicar(self.actualizar_resultado_estelar))
+            grafo.agregar('avanzado', self._analisis_avanzado_simple, al_terminar=publicar(self.actualizar_resultado_avanzado))
+            return grafo
+        
+        grafo.agregar('descripcion', lambda: analizador.describir(imagen))
+        grafo.agregar('clasificacion', lambda: analizador.clasificar(imagen))
+        grafo.agregar('internet', analizador.buscar_informacion_internet, ['descripcion'])
+        grafo.agregar('basico', analizador.informe_basico, ['descripcion', 'internet', 'clasificacion'],
+                      al_terminar=publicar(self.actualizar_resultado_basico))
+        grafo.agregar('planetario', lambda: analizador.analisis_planetario(imagen, "current_image"),
+                      al_terminar=publicar(self.actualizar_resultado_planetario))
+        grafo.agregar('estelar', lambda: analizador.analisis_estelar(imagen, "current_image"),
+                      al_terminar=publicar(self.actualizar_resultado_estelar))
+        grafo.agregar('avanzado', lambda: analizador.analisis_avanzado(imagen, "current_image"),
+                      al_terminar=publicar(self.actualizar_resultado_avanzado))
+        
+        teselas, lote, describir = trabajo.opciones
+        if teselas:
+            progreso = lambda hechas, total: self.estado_trabajo(trabajo, f"5️⃣ Tiled Analysis: {hechas}/{total} tiles")
+            grafo.agregar('teselas', lambda: analizador.analisis_por_teselas(cv_image, lote=lote, descripciones=describir,
+                                                                             progreso=progreso, cancelar=trabajo.cancelado),
+                          al_terminar=lambda mapa: self.root.after(0, self.establecer_mapa_ia, mapa, trabajo))
+            grafo.agregar('avanzado_teselas', lambda avanzado, mapa: avanzado + "\n\n" + mapa.informe(),
+                          ['avanzado', 'teselas'], al_terminar=publicar(self.actualizar_resultado_avanzado))
+        return grafo
 
     def _analisis_sin_modelos(self):
         resultado = "1️⃣  BASIC ANALYSIS\n" + "="*50 + "\n\n"
@@ -2077,36 +2396,54 @@ class NASAImageExplorerPro:
         
         return resultado
     
-    def actualizar_resultado_basico(self, texto):
+    def establecer_mapa_ia(self, mapa, trabajo=None):
+        if trabajo is not None and not self.trabajo_vigente(trabajo):
+            return
+        self.mapa_ia = mapa
+        self.dibujar_superposicion()
+    
+    def actualizar_resultado_basico(self, texto, trabajo=None):
         def actualizar():
+            if trabajo is not None and not self.trabajo_vigente(trabajo):
+                return
             self.text_basico.delete(1.0, tk.END)
             self.text_basico.insert(1.0, texto)
             self.notebook.select(0)
         self.root.after(0, actualizar)
     
-    def actualizar_resultado_planetario(self, texto):
+    def actualizar_resultado_planetario(self, texto, trabajo=None):
         def actualizar():
+            if trabajo is not None and not self.trabajo_vigente(trabajo):
+                return
             self.text_planetario.delete(1.0, tk.END)
             self.text_planetario.insert(1.0, texto)
         self.root.after(0, actualizar)
     
-    def actualizar_resultado_estelar(self, texto):
+    def actualizar_resultado_estelar(self, texto, trabajo=None):
         def actualizar():
+            if trabajo is not None and not self.trabajo_vigente(trabajo):
+                return
             self.text_estelar.delete(1.0, tk.END)
             self.text_estelar.insert(1.0, texto)
         self.root.after(0, actualizar)
     
-    def actualizar_resultado_avanzado(self, texto):
+    def actualizar_resultado_avanzado(self, texto, trabajo=None):
         def actualizar():
+            if trabajo is not None and not self.trabajo_vigente(trabajo):
+                return
             self.text_avanzado.delete(1.0, tk.END)
             self.text_avanzado.insert(1.0, texto)
         self.root.after(0, actualizar)
     
-    def limpiar_resultados_texto(self):
-        self.text_basico.delete(1.0, tk.END)
-        self.text_planetario.delete(1.0, tk.END)
-        self.text_estelar.delete(1.0, tk.END)
-        self.text_avanzado.delete(1.0, tk.END)
+    def limpiar_resultados_texto(self, trabajo=None):
+        def limpiar():
+            if trabajo is not None and not self.trabajo_vigente(trabajo):
+                return
+            self.text_basico.delete(1.0, tk.END)
+            self.text_planetario.delete(1.0, tk.END)
+            self.text_estelar.delete(1.0, tk.END)
+            self.text_avanzado.delete(1.0, tk.END)
+        self.root.after(0, limpiar)
 
 class FilterExplorerWindow:
     def __init__(self, parent, cv_image, apply_callback):
@@ -2178,52 +2515,1591 @@ class FilterExplorerWindow:
             self.apply_callback(filter_name)
             self.root.destroy()
 
-class AnalizadorEspecializadoNASA:
-    def __init__(self):
-        self.modelos = {}
-        self.cargar_todos_modelos()
-    
-    def cargar_todos_modelos(self):
-        try:
-            self.modelos['descripcion'] = pipeline("image-to-text", 
-                                                 model="Salesforce/blip-image-captioning-large")
-            self.modelos['clasificacion'] = pipeline("image-classification", 
-                                                   model="microsoft/resnet-50")
-            print("✅ Modelos IA cargados correctamente")
-        except Exception as e:
-            print(f"❌ Error cargando modelos: {e}")
+class CachePlanosImagen:
+    """Caché perezosa de planos de color (gris, HSV, LAB, YCrCb, RGB) de una imagen BGR
 
-    def analisis_basico_con_internet(self, imagen):
-        resultado = "1️⃣  BASIC ANALYSIS WITH INTERNET SEARCH\n" + "="*60 + "\n\n"
+    Los planos completos se guardan mientras viva la caché; las teselas sueltas, como mucho
+    `max_teselas`, y las menos usadas salen primero.
+    """
+
+    CONVERSIONES = {
+        "gris": cv2.COLOR_BGR2GRAY,
+        "hsv": cv2.COLOR_BGR2HSV,
+        "lab": cv2.COLOR_BGR2LAB,
+        "ycrcb": cv2.COLOR_BGR2YCrCb,
+        "rgb": cv2.COLOR_BGR2RGB,
+    }
+
+    def __init__(self, imagen, tile_size=512, max_teselas=64):
+        self.imagen = imagen
+        self.tile_size = tile_size
+        self.max_teselas = max_teselas
+        self.planos = {}
+        self.teselas = {}
+        self.lock = threading.RLock()
+
+    def _convertir(self, imagen, nombre):
+        if nombre == "hsv_float":
+            imagen_float = imagen.astype(np.float32) / 255.0
+            if imagen_float.ndim == 2:
+                imagen_float = cv2.cvtColor(imagen_float, cv2.COLOR_GRAY2BGR)
+            plano = cv2.cvtColor(imagen_float, cv2.COLOR_BGR2HSV)
+        elif nombre not in self.CONVERSIONES:
+            raise KeyError(f"Plano de color desconocido: {nombre}")
+        elif imagen.ndim == 2:
+            plano = imagen.copy() if nombre == "gris" else cv2.cvtColor(
+                cv2.cvtColor(imagen, cv2.COLOR_GRAY2BGR), self.CONVERSIONES[nombre])
+        else:
+            plano = cv2.cvtColor(imagen, self.CONVERSIONES[nombre])
+        # Los planos se comparten entre filtros: nadie debe modificarlos en sitio
+        plano.flags.writeable = False
+        return plano
+
+    def plano(self, nombre):
+        """Devuelve el plano completo, calculándolo una sola vez"""
+        with self.lock:
+            if nombre not in self.planos:
+                self.planos[nombre] = self._convertir(self.imagen, nombre)
+                # Las teselas sueltas de este plano ya no hacen falta
+                for clave in [c for c in self.teselas if c[0] == nombre]:
+                    del self.teselas[clave]
+            return self.planos[nombre]
+
+    def tesela(self, nombre, x, y):
+        """Devuelve el plano de la tesela con origen (x, y) sin convertir la imagen entera"""
+        with self.lock:
+            if nombre in self.planos:
+                return self.planos[nombre][y:y + self.tile_size, x:x + self.tile_size]
+            clave = (nombre, x, y)
+            plano = self.teselas.pop(clave, None)
+            if plano is None:
+                region = self.imagen[y:y + self.tile_size, x:x + self.tile_size]
+                plano = self._convertir(region, nombre)
+            self.teselas[clave] = plano
+            while len(self.teselas) > self.max_teselas:
+                del self.teselas[next(iter(self.teselas))]
+            return plano
+
+
+    def derivado(self, nombre, calcular):
+        """Guarda un plano derivado (p. ej. etiquetas de color) calculado a partir de esta caché"""
+        with self.lock:
+            if nombre not in self.planos:
+                plano = calcular(self)
+                plano.flags.writeable = False
+                self.planos[nombre] = plano
+            return self.planos[nombre]
+
+    def gris(self):
+        return self.plano("gris")
+
+    def hsv(self):
+        return self.plano("hsv")
+
+    def lab(self):
+        return self.plano("lab")
+
+    def ycrcb(self):
+        return self.plano("ycrcb")
+
+class ClasificadorColorHSV:
+    """Compila los rangos HSV de rangos_color en tablas de búsqueda para etiquetar la imagen en una pasada
+
+    La etiqueta de cada píxel es una máscara de bits (un bit por color), así un píxel que cae
+    en dos rangos solapados cuenta para ambos colores igual que con cv2.inRange por separado.
+    """
+
+    def __init__(self, rangos_color):
+        if len(rangos_color) > 8:
+            raise ValueError("La etiqueta uint8 admite como máximo 8 rangos de color")
+        
+        self.nombres = list(rangos_color.keys())
+        self.bits = {nombre: 1 << i for i, nombre in enumerate(self.nombres)}
+        self.colores = {nombre: config["color_bgr"] for nombre, config in rangos_color.items()}
+        
+        self.lut_h = np.zeros(256, dtype=np.uint8)
+        self.lut_s = np.zeros(256, dtype=np.uint8)
+        self.lut_v = np.zeros(256, dtype=np.uint8)
+        
+        for nombre, config in rangos_color.items():
+            bit = self.bits[nombre]
+            if "hsv_bajo" in config:
+                rangos = [(config["hsv_bajo"], config["hsv_alto"])]
+            else:
+                rangos = [(config["hsv_bajo1"], config["hsv_alto1"]), (config["hsv_bajo2"], config["hsv_alto2"])]
+            
+            limites_sv = {(tuple(bajo[1:]), tuple(alto[1:])) for bajo, alto in rangos}
+            if len(limites_sv) > 1:
+                raise ValueError(f"Los subrangos de {nombre} deben compartir los límites de S y V")
+            
+            for bajo, alto in rangos:
+                self.lut_h[int(bajo[0]):int(alto[0]) + 1] |= bit
+            bajo, alto = rangos[0]
+            self.lut_s[int(bajo[1]):int(alto[1]) + 1] |= bit
+            self.lut_v[int(bajo[2]):int(alto[2]) + 1] |= bit
+        
+        # Pertenencia de cada etiqueta (0-255) a cada color, para contar desde un histograma
+        valores = np.arange(256)
+        self.pertenencia = np.stack([(valores & self.bits[n]) > 0 for n in self.nombres], axis=1)
+        
+        # Códigos de "color dominante": uno por color más los dos casos sin color
+        self.colores_dominantes = self.nombres + ["Sin color definido", "Desconocido"]
+        self.codigo_sin_color = len(self.nombres)
+        self.codigo_desconocido = len(self.nombres) + 1
+
+    def etiquetar(self, imagen_hsv):
+        """Devuelve la imagen de etiquetas uint8 (máscara de bits por color) de un plano HSV"""
+        h, s, v = cv2.split(imagen_hsv)
+        etiquetas = cv2.LUT(h, self.lut_h)
+        cv2.bitwise_and(etiquetas, cv2.LUT(s, self.lut_s), dst=etiquetas)
+        cv2.bitwise_and(etiquetas, cv2.LUT(v, self.lut_v), dst=etiquetas)
+        return etiquetas
+
+    def bits_seleccion(self, seleccion):
+        bits = 0
+        for nombre in seleccion:
+            bits |= self.bits[nombre]
+        return bits
+
+    def mascara(self, etiquetas, nombre):
+        """Máscara 0/255 de un color, equivalente a la de cv2.inRange"""
+        lut = np.where(np.arange(256) & self.bits[nombre], 255, 0).astype(np.uint8)
+        return cv2.LUT(etiquetas, lut)
+
+    def paleta(self, seleccion):
+        """Color BGR de cada etiqueta sumando (con saturación) los colores seleccionados"""
+        paleta = np.zeros((256, 3), dtype=np.int32)
+        for nombre in seleccion:
+            paleta[(np.arange(256) & self.bits[nombre]) > 0] += self.colores[nombre]
+        return np.clip(paleta, 0, 255).astype(np.uint8)
+
+    def histograma(self, etiquetas):
+        return np.bincount(etiquetas.ravel(), minlength=256)
+
+    def conteos(self, histograma):
+        """Píxeles de cada color a partir del histograma de etiquetas"""
+        por_color = histograma @ self.pertenencia
+        return {nombre: int(conteo) for nombre, conteo in zip(self.nombres, por_color)}
+
+    def histogramas_teselas(self, etiquetas, tile_size):
+        """Histograma de etiquetas de cada tesela, con la misma clave (x, y) que las teselas de la imagen"""
+        height, width = etiquetas.shape[:2]
+        histogramas = {}
+        for y in range(0, height, tile_size):
+            for x in range(0, width, tile_size):
+                histogramas[(x, y)] = self.histograma(etiquetas[y:y + tile_size, x:x + tile_size])
+        return histogramas
+
+class IntegralColores:
+    """Tablas de áreas sumadas por color: el color dominante de un rectángulo cuesta O(colores)"""
+
+    def __init__(self, etiquetas, clasificador):
+        self.clasificador = clasificador
+        self.alto, self.ancho = etiquetas.shape[:2]
+        self.tablas = np.empty((len(clasificador.nombres), self.alto + 1, self.ancho + 1), dtype=np.int32)
+        
+        for i, nombre in enumerate(clasificador.nombres):
+            lut = ((np.arange(256) & clasificador.bits[nombre]) > 0).astype(np.uint8)
+            self.tablas[i] = cv2.integral(cv2.LUT(etiquetas, lut), sdepth=cv2.CV_32S)
+
+    def conteos_rectangulos(self, x1, y1, x2, y2):
+        """Píxeles de cada color en los rectángulos [x1, x2) x [y1, y2); devuelve (colores, N)"""
+        t = self.tablas
+        return t[:, y2, x2] - t[:, y1, x2] - t[:, y2, x1] + t[:, y1, x1]
+
+    def codigos_dominantes_lote(self, xs, ys, radios):
+        """Código de color dominante (índice en clasificador.colores_dominantes) de todos los centros a la vez"""
+        xs = np.asarray(xs, dtype=np.int64).ravel()
+        ys = np.asarray(ys, dtype=np.int64).ravel()
+        radios = np.broadcast_to(np.asarray(radios, dtype=np.int64), xs.shape)
+        if xs.size == 0:
+            return np.zeros(0, dtype=np.int16)
+        
+        x1 = np.clip(xs - radios, 0, self.ancho)
+        y1 = np.clip(ys - radios, 0, self.alto)
+        x2 = np.clip(xs + radios, 0, self.ancho)
+        y2 = np.clip(ys + radios, 0, self.alto)
+        vacios = (x2 <= x1) | (y2 <= y1)
+        x2 = np.maximum(x2, x1)
+        y2 = np.maximum(y2, y1)
+        
+        conteos = self.conteos_rectangulos(x1, y1, x2, y2)
+        codigos = np.argmax(conteos, axis=0).astype(np.int16)
+        codigos[conteos.max(axis=0) == 0] = self.clasificador.codigo_sin_color
+        codigos[vacios] = self.clasificador.codigo_desconocido
+        return codigos
+
+    def color_dominante_lote(self, xs, ys, radios):
+        """Color dominante alrededor de todos los centros a la vez (mismo criterio que analizar_color_area)"""
+        nombres = self.clasificador.colores_dominantes
+        return [nombres[codigo] for codigo in self.codigos_dominantes_lote(xs, ys, radios)]
+
+    def color_dominante(self, x, y, radio):
+        return self.color_dominante_lote([x], [y], radio)[0]
+
+class HistogramasColorTeselas:
+    """Etiquetas, histogramas y superposición de color por tesela de una imagen
+
+    Las etiquetas no dependen de la selección de colores: al cambiarla se reagregan los
+    histogramas y solo se repintan las teselas que contienen algún color añadido o quitado.
+    """
+
+    def __init__(self, planos, clasificador, tile_size=512):
+        self.planos = planos
+        self.clasificador = clasificador
+        self.tile_size = tile_size
+        
+        height, width = planos.imagen.shape[:2]
+        self.etiquetas = np.zeros((height, width), dtype=np.uint8)
+        self.histogramas = {}
+        self.pendientes = {(x, y) for y in range(0, height, tile_size) for x in range(0, width, tile_size)}
+        self.superpuesta = None
+        self.bits_superpuestos = 0
+        self.lock = threading.RLock()
+
+    def actualizar(self):
+        """Calcula etiquetas e histograma de las teselas pendientes; devuelve cuántas se calcularon"""
+        with self.lock:
+            recalculadas = len(self.pendientes)
+            for x, y in self.pendientes:
+                etiquetas = self.clasificador.etiquetar(self.planos.tesela("hsv", x, y))
+                alto, ancho = etiquetas.shape
+                self.etiquetas[y:y + alto, x:x + ancho] = etiquetas
+                self.histogramas[(x, y)] = self.clasificador.histograma(etiquetas)
+            self.pendientes.clear()
+            return recalculadas
+
+    def estadisticas(self, seleccion):
+        self.actualizar()
+        return EstadisticasColor.desde_histogramas(self.clasificador, seleccion, self.histogramas)
+
+    def superposicion(self, seleccion, peso_imagen=0.3):
+        """Imagen con los colores seleccionados superpuestos; devuelve (imagen, teselas repintadas)
+
+        Si la selección no cambia ningún píxel se devuelve la misma imagen. Si cambia, la
+        imagen es nueva: la anterior no se modifica aunque alguien la siga usando.
+        """
+        with self.lock:
+            self.actualizar()
+            bits = self.clasificador.bits_seleccion(seleccion)
+            if self.superpuesta is None:
+                repintar = list(self.histogramas)
+                resultado = np.empty_like(self.planos.imagen)
+            else:
+                # Una etiqueta sin ninguno de los colores cambiados conserva su color de paleta
+                afectadas = (np.arange(256) & (bits ^ self.bits_superpuestos)) > 0
+                repintar = [clave for clave, histograma in self.histogramas.items() if histograma[afectadas].any()]
+                if not repintar:
+                    self.bits_superpuestos = bits
+                    return self.superpuesta, repintar
+                resultado = self.superpuesta.copy()
+            
+            paleta = self.clasificador.paleta(seleccion)
+            for x, y in repintar:
+                ventana = (slice(y, y + self.tile_size), slice(x, x + self.tile_size))
+                resultado[ventana] = cv2.addWeighted(self.planos.imagen[ventana], peso_imagen,
+                                                     paleta[self.etiquetas[ventana]], 1 - peso_imagen, 0)
+            resultado.flags.writeable = False
+            self.superpuesta = resultado
+            self.bits_superpuestos = bits
+            return resultado, repintar
+
+class EstadisticasColor:
+    """Estadísticas de rangos de color: conteos, porcentajes y desglose por tesela"""
+
+    def __init__(self, colores, conteos, total_pixeles, no_detectados, conteos_teselas=None):
+        self.colores = list(colores)
+        self.conteos = conteos
+        self.total_pixeles = total_pixeles
+        self.no_detectados = no_detectados
+        self.conteos_teselas = conteos_teselas or {}
+
+    @classmethod
+    def desde_histogramas(cls, clasificador, seleccion, histogramas_teselas):
+        """Agrega los histogramas por tesela sin volver a recorrer la imagen"""
+        seleccion = [nombre for nombre in clasificador.nombres if nombre in seleccion]
+        claves = list(histogramas_teselas.keys())
+        if claves:
+            matriz = np.stack([histogramas_teselas[clave] for clave in claves])
+        else:
+            matriz = np.zeros((0, 256), dtype=np.int64)
+        total = matriz.sum(axis=0)
         
-        try:
-            descripcion_local = "No se pudo generar descripción local"
-            if 'descripcion' in self.modelos:
-                try:
-                    descripcion_local = self.modelos['descripcion'](imagen)[0]['generated_text']
-                except:
-                    pass
-            
-            resultado += f"📝 LOCAL ANALYSIS:\n{descripcion_local}\n\n"
-            
-            internet_info = self.buscar_informacion_internet(descripcion_local)
-            resultado += f"🌐 INTERNET RESEARCH:\n{internet_info}\n\n"
-            
-            resultado += "🔍 DETECTED FEATURES:\n" + "-"*25 + "\n"
-            if 'clasificacion' in self.modelos:
-                try:
-                    clasificaciones = self.modelos['clasificacion'](imagen)
-                    for i, clasif in enumerate(clasificaciones[:5], 1):
-                        if clasif['score'] > 0.1:
-                            resultado += f"{i}. {clasif['label']}: {clasif['score']*100:.1f}%\n"
-                except:
-                    resultado += "No se pudieron analizar características\n"
+        columnas = [clasificador.nombres.index(nombre) for nombre in seleccion]
+        pertenencia = clasificador.pertenencia[:, columnas]
+        por_tesela = matriz @ pertenencia
+        
+        bits = clasificador.bits_seleccion(seleccion)
+        sin_color = (np.arange(256) & bits) == 0
+        
+        conteos = {nombre: int(conteo) for nombre, conteo in zip(seleccion, total @ pertenencia)}
+        conteos_teselas = {clave: {nombre: int(conteo) for nombre, conteo in zip(seleccion, fila)}
+                           for clave, fila in zip(claves, por_tesela)}
+        return cls(seleccion, conteos, int(total.sum()), int(total[sin_color].sum()), conteos_teselas)
+
+    def porcentaje(self, pixeles):
+        if self.total_pixeles == 0:
+            return 0.0
+        return (pixeles / self.total_pixeles) * 100
+
+    @property
+    def porcentajes(self):
+        return {nombre: self.porcentaje(conteo) for nombre, conteo in self.conteos.items()}
+
+    @property
+    def porcentaje_no_detectado(self):
+        return self.porcentaje(self.no_detectados)
+
+    def a_dict(self):
+        """Representación serializable (JSON) para exportar o procesar en lote"""
+        return {
+            "total_pixeles": self.total_pixeles,
+            "no_detectados": self.no_detectados,
+            "colores": {nombre: {"pixeles": self.conteos[nombre], "porcentaje": self.porcentaje(self.conteos[nombre])}
+                        for nombre in self.colores},
+            "teselas": {f"{x}_{y}": conteos for (x, y), conteos in self.conteos_teselas.items()},
+        }
+
+class IndiceEspacial:
+    """Rejilla uniforme sobre cajas (x1, y1, x2, y2) en coordenadas de imagen
+
+    Cada elemento se guarda en todas las celdas que toca, de modo que las consultas por
+    rectángulo, por radio y de vecino más cercano solo recorren las celdas cercanas y su coste
+    no depende del número total de elementos. Los puntos son cajas de tamaño cero.
+    """
+
+    def __init__(self, tamano_celda=256):
+        self.tamano_celda = tamano_celda
+        self.celdas = {}
+        self.cajas = {}
+        self.limites = None
+
+    def __len__(self):
+        return len(self.cajas)
+
+    def _celdas_de(self, x1, y1, x2, y2):
+        c = self.tamano_celda
+        return [(cx, cy) for cy in range(int(y1 // c), int(y2 // c) + 1)
+                for cx in range(int(x1 // c), int(x2 // c) + 1)]
+
+    def _ampliar_limites(self, cx1, cy1, cx2, cy2):
+        if self.limites is None:
+            self.limites = [cx1, cy1, cx2, cy2]
+        else:
+            self.limites = [min(self.limites[0], cx1), min(self.limites[1], cy1),
+                            max(self.limites[2], cx2), max(self.limites[3], cy2)]
+
+    def insertar(self, ident, x1, y1, x2=None, y2=None):
+        if ident in self.cajas:
+            self.eliminar(ident)
+        x2 = x1 if x2 is None else x2
+        y2 = y1 if y2 is None else y2
+        caja = (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+        self.cajas[ident] = caja
+        celdas = self._celdas_de(*caja)
+        for celda in celdas:
+            self.celdas.setdefault(celda, []).append(ident)
+        self._ampliar_limites(*celdas[0], *celdas[-1])
+
+    def insertar_puntos(self, idents, xs, ys):
+        """Inserción en bloque de puntos (p. ej. todas las filas de un catálogo) agrupados por celda"""
+        idents = np.asarray(idents)
+        xs = np.asarray(xs, dtype=np.int64)
+        ys = np.asarray(ys, dtype=np.int64)
+        if not idents.size:
+            return
+        cx = xs // self.tamano_celda
+        cy = ys // self.tamano_celda
+        orden = np.lexsort((cx, cy))
+        claves = np.stack([cx[orden], cy[orden]], axis=1)
+        cortes = np.flatnonzero(np.any(np.diff(claves, axis=0) != 0, axis=1)) + 1
+        for grupo in np.split(orden, cortes):
+            self.celdas.setdefault((int(cx[grupo[0]]), int(cy[grupo[0]])), []).extend(idents[grupo].tolist())
+        for ident, x, y in zip(idents.tolist(), xs.tolist(), ys.tolist()):
+            self.cajas[ident] = (x, y, x, y)
+        self._ampliar_limites(int(cx.min()), int(cy.min()), int(cx.max()), int(cy.max()))
+
+    def eliminar(self, ident):
+        caja = self.cajas.pop(ident, None)
+        if caja is None:
+            return
+        for celda in self._celdas_de(*caja):
+            elementos = self.celdas.get(celda)
+            if elementos is not None:
+                elementos.remove(ident)
+                if not elementos:
+                    del self.celdas[celda]
+
+    def limpiar(self):
+        self.celdas.clear()
+        self.cajas.clear()
+        self.limites = None
+
+    def en_rectangulo(self, x1, y1, x2, y2):
+        """Elementos cuya caja corta el rectángulo (bordes incluidos)"""
+        x1, x2 = min(x1, x2), max(x1, x2)
+        y1, y2 = min(y1, y2), max(y1, y2)
+        encontrados = []
+        vistos = set()
+        for celda in self._celdas_de(x1, y1, x2, y2):
+            for ident in self.celdas.get(celda, ()):
+                if ident in vistos:
+                    continue
+                vistos.add(ident)
+                bx1, by1, bx2, by2 = self.cajas[ident]
+                if bx1 <= x2 and bx2 >= x1 and by1 <= y2 and by2 >= y1:
+                    encontrados.append(ident)
+        return encontrados
+
+    def distancia(self, ident, x, y):
+        bx1, by1, bx2, by2 = self.cajas[ident]
+        dx = max(bx1 - x, 0, x - bx2)
+        dy = max(by1 - y, 0, y - by2)
+        return math.hypot(dx, dy)
+
+    def en_radio(self, x, y, radio):
+        """Elementos a distancia <= radio de (x, y), ordenados del más cercano al más lejano"""
+        candidatos = self.en_rectangulo(x - radio, y - radio, x + radio, y + radio)
+        distancias = [(self.distancia(ident, x, y), ident) for ident in candidatos]
+        return [ident for d, ident in sorted(distancias, key=lambda par: par[0]) if d <= radio]
+
+    @staticmethod
+    def _anillo(cx, cy, anillo):
+        if anillo == 0:
+            return [(cx, cy)]
+        lado = range(-anillo, anillo + 1)
+        celdas = [(cx + d, cy - anillo) for d in lado] + [(cx + d, cy + anillo) for d in lado]
+        celdas += [(cx - anillo, cy + d) for d in lado[1:-1]] + [(cx + anillo, cy + d) for d in lado[1:-1]]
+        return celdas
+
+    def mas_cercano(self, x, y, radio_max=None):
+        """(ident, distancia) del elemento más cercano, buscando en anillos de celdas crecientes"""
+        if not self.cajas:
+            return None
+        c = self.tamano_celda
+        cx, cy = int(x // c), int(y // c)
+        lx1, ly1, lx2, ly2 = self.limites
+        alcance = max(abs(cx - lx1), abs(cx - lx2), abs(cy - ly1), abs(cy - ly2))
+        
+        mejor = None
+        vistos = set()
+        # Los anillos que no llegan a los límites ocupados están vacíos
+        primero = max(0, lx1 - cx, cx - lx2, ly1 - cy, cy - ly2)
+        if radio_max is not None and (primero - 1) * c > radio_max:
+            return None
+        for anillo in range(primero, alcance + 1):
+            for celda in self._anillo(cx, cy, anillo):
+                for ident in self.celdas.get(celda, ()):
+                    if ident in vistos:
+                        continue
+                    vistos.add(ident)
+                    d = self.distancia(ident, x, y)
+                    if mejor is None or d < mejor[1]:
+                        mejor = (ident, d)
+            # Todo lo que queda fuera del anillo está al menos a esta distancia
+            cota = anillo * c
+            if mejor is not None and mejor[1] <= cota:
+                break
+            if radio_max is not None and cota > radio_max:
+                break
+        
+        if mejor is None or (radio_max is not None and mejor[1] > radio_max):
+            return None
+        return mejor
+
+class CatalogoPatrones:
+    """Catálogo columnar de patrones detectados sobre un array estructurado de NumPy
+
+    Cada fila es un patrón anclado en (x, y): centro del círculo, cráter o rectángulo, centroide del
+    contorno, punto medio de la línea o centroide redondeado de la estrella (el subpíxel va en
+    xc, yc). Tipo y color se guardan como códigos (índices en TIPOS y en `colores`); las
+    magnitudes que no aplican a un tipo quedan en NaN y los extremos de segmento en -1.
+    """
+
+    TIPOS = ("Círculo", "Contorno", "Rectángulo", "Línea", "Estrella", "Cráter")
+    DTYPE = np.dtype([
+        ("tipo", np.uint8), ("x", np.int32), ("y", np.int32), ("radio", np.float32),
+        ("area", np.float64), ("longitud", np.float64), ("color", np.int16), ("esquinas", np.int8),
+        ("x1", np.int32), ("y1", np.int32), ("x2", np.int32), ("y2", np.int32),
+        ("xc", np.float64), ("yc", np.float64), ("flujo", np.float64),
+    ])
+
+    def __init__(self, datos, colores):
+        self.datos = datos
+        self.colores = list(colores)
+
+    @classmethod
+    def vacio(cls, colores=()):
+        return cls(np.zeros(0, dtype=cls.DTYPE), colores)
+
+    @classmethod
+    def crear(cls, tipo, xs, ys, codigos_color, colores, radio=None, area=None, longitud=None,
+              esquinas=None, segmentos=None, flujo=None, centroide=None):
+        """Construye un catálogo de un solo tipo a partir de columnas; `centroide` es (xc, yc) subpíxel"""
+        xs = np.asarray(xs).ravel()
+        datos = np.zeros(xs.size, dtype=cls.DTYPE)
+        datos["tipo"] = cls.TIPOS.index(tipo)
+        datos["x"] = xs
+        datos["y"] = np.asarray(ys).ravel()
+        datos["color"] = np.asarray(codigos_color).ravel()
+        for campo, valores in (("radio", radio), ("area", area), ("longitud", longitud), ("flujo", flujo)):
+            datos[campo] = np.nan if valores is None else valores
+        datos["xc"], datos["yc"] = (np.nan, np.nan) if centroide is None else centroide
+        datos["esquinas"] = 0 if esquinas is None else esquinas
+        if segmentos is None:
+            for campo in ("x1", "y1", "x2", "y2"):
+                datos[campo] = -1
+        else:
+            segmentos = np.asarray(segmentos).reshape(-1, 4)
+            for i, campo in enumerate(("x1", "y1", "x2", "y2")):
+                datos[campo] = segmentos[:, i]
+        return cls(datos, colores)
+
+    @classmethod
+    def concatenar(cls, catalogos, colores=None):
+        catalogos = [catalogo for catalogo in catalogos if catalogo is not None]
+        if colores is None:
+            colores = catalogos[0].colores if catalogos else []
+        if not catalogos:
+            return cls.vacio(colores)
+        return cls(np.concatenate([catalogo.datos for catalogo in catalogos]), colores)
+
+    def __len__(self):
+        return len(self.datos)
+
+    def __getitem__(self, indice):
+        """Índices, cortes o máscaras booleanas devuelven otro catálogo"""
+        return CatalogoPatrones(np.atleast_1d(self.datos[indice]), self.colores)
+
+    @property
+    def nombres_tipo(self):
+        return np.array(self.TIPOS)[self.datos["tipo"]]
+
+    @property
+    def nombres_color(self):
+        return np.array(self.colores)[self.datos["color"]]
+
+    def mascara(self, tipo=None, color=None, area_min=None, area_max=None, region=None):
+        """Máscara booleana vectorizada; `region` es (x1, y1, x2, y2) con x2, y2 exclusivos"""
+        mascara = np.ones(len(self.datos), dtype=bool)
+        if tipo is not None:
+            mascara &= self.datos["tipo"] == self.TIPOS.index(tipo)
+        if color is not None:
+            mascara &= self.datos["color"] == self.colores.index(color)
+        if area_min is not None:
+            mascara &= self.datos["area"] >= area_min
+        if area_max is not None:
+            mascara &= self.datos["area"] <= area_max
+        if region is not None:
+            x1, y1, x2, y2 = region
+            x, y = self.datos["x"], self.datos["y"]
+            mascara &= (x >= x1) & (x < x2) & (y >= y1) & (y < y2)
+        return mascara
+
+    def filtrar(self, **criterios):
+        return self[self.mascara(**criterios)]
+
+    def desplazar(self, dx, dy):
+        """Copia con las coordenadas trasladadas (p. ej. de una región a la imagen completa)"""
+        datos = self.datos.copy()
+        datos["x"] += dx
+        datos["y"] += dy
+        datos["xc"] += dx
+        datos["yc"] += dy
+        segmentos = datos["tipo"] == self.TIPOS.index("Línea")
+        for campo, delta in (("x1", dx), ("y1", dy), ("x2", dx), ("y2", dy)):
+            datos[campo][segmentos] += delta
+        return CatalogoPatrones(datos, self.colores)
+
+    def escalar(self, factor):
+        """Copia con posiciones y magnitudes multiplicadas por `factor` (de un proxy reducido a la imagen)"""
+        datos = self.datos.copy()
+        segmentos = datos["tipo"] == self.TIPOS.index("Línea")
+        for campo in ("x", "y"):
+            datos[campo] = np.rint(datos[campo] * factor)
+        for campo in ("x1", "y1", "x2", "y2"):
+            datos[campo][segmentos] = np.rint(datos[campo][segmentos] * factor)
+        for campo in ("radio", "longitud", "xc", "yc"):
+            datos[campo] *= factor
+        datos["area"] *= factor ** 2
+        datos["flujo"] *= factor ** 2
+        return CatalogoPatrones(datos, self.colores)
+
+    def ordenar(self, campo, descendente=False):
+        """Orden estable por una columna; los NaN quedan siempre al final"""
+        valores = self.datos[campo]
+        if descendente:
+            valores = -valores.astype(np.float64)
+        return self[np.argsort(valores, kind="stable")]
+
+    def pagina(self, numero, tamano=100):
+        inicio = numero * tamano
+        return self[inicio:inicio + tamano]
+
+    def conteos_por_tipo(self):
+        conteos = np.bincount(self.datos["tipo"], minlength=len(self.TIPOS))
+        return {tipo: int(conteo) for tipo, conteo in zip(self.TIPOS, conteos)}
+
+    def a_columnas(self):
+        """Columnas con tipo y color como texto, listas para exportar o mostrar"""
+        columnas = {"tipo": self.nombres_tipo, "color": self.nombres_color}
+        for campo in self.DTYPE.names:
+            if campo not in columnas:
+                columnas[campo] = self.datos[campo]
+        return columnas
+
+    def exportar_csv(self, ruta):
+        columnas = self.a_columnas()
+        texto = []
+        for campo, valores in columnas.items():
+            if valores.dtype.kind == "f":
+                texto.append(np.where(np.isnan(valores), "", np.char.mod("%.2f", valores)))
+            else:
+                texto.append(valores.astype(str))
+        filas = np.column_stack(texto) if texto and len(self) else np.empty((0, len(columnas)), dtype=str)
+        np.savetxt(ruta, filas, fmt="%s", delimiter=",", header=",".join(columnas),
+                   comments="", encoding="utf-8")
+
+    def exportar_npz(self, ruta):
+        np.savez_compressed(ruta, patrones=self.datos, tipos=np.array(self.TIPOS), colores=np.array(self.colores))
+
+    @classmethod
+    def cargar_npz(cls, ruta):
+        with np.load(ruta) as archivo:
+            return cls(archivo["patrones"], [str(c) for c in archivo["colores"]])
+
+    def describir(self, i):
+        """Texto de un patrón para el panel de resultados"""
+        fila = self.datos[i]
+        texto = f"{self.TIPOS[fila['tipo']]}:\n"
+        texto += f"   - Color dominante: {self.colores[fila['color']]}\n"
+        if not np.isnan(fila["area"]):
+            texto += f"   - Área: {fila['area']:.1f}\n"
+        if not np.isnan(fila["longitud"]):
+            texto += f"   - Longitud: {fila['longitud']:.1f} px\n"
+        texto += f"   - Centro: ({fila['x']}, {fila['y']})\n"
+        if not np.isnan(fila["radio"]):
+            texto += f"   - Radio: {fila['radio']:.0f} px\n"
+        if not np.isnan(fila["flujo"]):
+            texto += f"   - Centroide: ({fila['xc']:.2f}, {fila['yc']:.2f})\n"
+            texto += f"   - Flujo: {fila['flujo']:.1f}\n"
+        return texto
+
+class EtapaDeteccion:
+    """Productos intermedios de la detección de patrones, calculados una sola vez y compartidos
+
+    Gris suavizado, máscara binaria, contornos con sus áreas y momentos, bordes, resultados de
+    Hough y tablas de color se calculan la primera vez que un detector los pide. Los detectores
+    de DETECTORES_PATRONES son consumidores de esta etapa.
+
+    `ventana` y `nucleo` (x1, y1, x2, y2 en la imagen completa) permiten usarla por teselas: todas
+    las coordenadas son de la imagen completa y los detectores solo conservan lo anclado en el núcleo.
+    """
+
+    # Productos que hay que recalcular cuando cambia alguno de estos parámetros
+    DEPENDENCIAS = {
+        "binaria": ("umbral_binario",),
+        "contornos": ("umbral_binario",),
+        "areas": ("umbral_binario",),
+        "centroides": ("umbral_binario", "area_min_contorno"),
+        "cortados": ("umbral_binario",),
+        "bordes": ("canny_bajo", "canny_alto"),
+        "circulos": ("hough_param1", "hough_param2", "radio_min", "radio_max", "distancia_circulos"),
+        "segmentos": ("canny_bajo", "canny_alto", "lineas_votos", "lineas_longitud_min", "lineas_hueco_max"),
+        "fuentes": ("estrellas_sigma",),
+    }
+
+    def __init__(self, imagen, clasificador, ventana=None, nucleo=None, gris_suavizado=None,
+                 binaria=None, contornos=None, circulos_gruesos=None, usar_integral=True, parametros=None):
+        self.imagen = imagen
+        self.clasificador = clasificador
+        self.parametros = {**PARAMETROS_DETECCION, **(parametros or {})}
+        self.alto, self.ancho = imagen.shape[:2]
+        self.ventana = ventana or (0, 0, self.ancho, self.alto)
+        self.nucleo = nucleo or self.ventana
+        self.usar_integral = usar_integral
+        self.excluidos = set()
+        
+        self.productos = {}
+        if gris_suavizado is not None:
+            self.productos["gris_suavizado"] = gris_suavizado
+        if binaria is not None:
+            self.productos["binaria"] = binaria
+        if contornos is not None:
+            self.productos["contornos"] = list(contornos)
+            self.productos["cortados"] = np.zeros(len(contornos), dtype=bool)
+        if circulos_gruesos is not None:
+            self.productos["circulos_gruesos"] = circulos_gruesos
+
+    def _producto(self, nombre, calcular):
+        if nombre not in self.productos:
+            self.productos[nombre] = calcular()
+        return self.productos[nombre]
+
+    @property
+    def origen(self):
+        return self.ventana[0], self.ventana[1]
+
+    @property
+    def planos(self):
+        vx1, vy1, vx2, vy2 = self.ventana
+        return self._producto("planos", lambda: CachePlanosImagen(self.imagen[vy1:vy2, vx1:vx2]))
+
+    @property
+    def gris_suavizado(self):
+        return self._producto("gris_suavizado", lambda: gris_suavizado_deteccion(self.planos.gris()))
+
+    @property
+    def binaria(self):
+        return self._producto("binaria",
+                              lambda: binarizar_deteccion(self.gris_suavizado, self.parametros["umbral_binario"]))
+
+    @property
+    def contornos(self):
+        def calcular():
+            contornos, _ = cv2.findContours(self.binaria, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE,
+                                            offset=self.origen)
+            return contornos
+        return self._producto("contornos", calcular)
+
+    @property
+    def areas(self):
+        return self._producto("areas", lambda: np.array([cv2.contourArea(cnt) for cnt in self.contornos]))
+
+    @property
+    def centroides(self):
+        """Centroide entero de cada contorno con área suficiente y momento m00 no nulo"""
+        def calcular():
+            centroides = {}
+            for i in np.flatnonzero(self.areas > self.parametros["area_min_contorno"]):
+                M = cv2.moments(self.contornos[i])
+                if M["m00"] != 0:
+                    centroides[i] = (int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"]))
+            return centroides
+        return self._producto("centroides", calcular)
+
+    @property
+    def cortados(self):
+        """Contornos que tocan un borde de la ventana que no es borde de la imagen (componente truncado)"""
+        def calcular():
+            vx1, vy1, vx2, vy2 = self.ventana
+            cortados = np.zeros(len(self.contornos), dtype=bool)
+            for i, cnt in enumerate(self.contornos):
+                bx, by, bw, bh = cv2.boundingRect(cnt)
+                cortados[i] = ((bx == vx1 and vx1 > 0) or (by == vy1 and vy1 > 0) or
+                               (bx + bw == vx2 and vx2 < self.ancho) or (by + bh == vy2 and vy2 < self.alto))
+            return cortados
+        return self._producto("cortados", calcular)
+
+    @property
+    def bordes(self):
+        p = self.parametros
+        return self._producto("bordes", lambda: bordes_canny(self.gris_suavizado, p["canny_bajo"], p["canny_alto"]))
+
+    @property
+    def circulos(self):
+        p = self.parametros
+        return self._producto("circulos", lambda: circulos_hough(
+            self.gris_suavizado, p["radio_min"], p["radio_max"], p["distancia_circulos"],
+            p["hough_param1"], p["hough_param2"]) + (*self.origen, 0))
+
+    @property
+    def circulos_gruesos(self):
+        """Círculos (x, y, r, nivel) de los niveles 1.. de la pirámide del gris suavizado"""
+        return self._producto("circulos_gruesos",
+                              lambda: circulos_multiescala(self.gris_suavizado, param1=self.parametros["hough_param1"],
+                                                           param2=self.parametros["hough_param2"]) + (*self.origen, 0, 0))
+
+    @property
+    def segmentos(self):
+        p = self.parametros
+        return self._producto("segmentos", lambda: lineas_hough(
+            self.bordes, p["lineas_votos"], p["lineas_longitud_min"], p["lineas_hueco_max"]) + (*self.origen, *self.origen))
+
+    @property
+    def fuentes(self):
+        """Fuentes puntuales de la ventana en coordenadas globales (pico y centroide)"""
+        def calcular():
+            fuentes = fuentes_puntuales(self.planos.gris(), self.parametros["estrellas_sigma"])
+            ox, oy = self.origen
+            fuentes["px"] = fuentes["px"] + ox
+            fuentes["py"] = fuentes["py"] + oy
+            fuentes["xc"] = fuentes["xc"] + ox
+            fuentes["yc"] = fuentes["yc"] + oy
+            return fuentes
+        return self._producto("fuentes", calcular)
+
+    @property
+    def integral(self):
+        return self._producto("integral", lambda: IntegralColores(
+            self.clasificador.etiquetar(self.planos.hsv()), self.clasificador))
+
+    def en_nucleo(self, xs, ys):
+        x1, y1, x2, y2 = self.nucleo
+        return (xs >= x1) & (xs < x2) & (ys >= y1) & (ys < y2)
+
+    def contornos_propios(self):
+        """Índices de los contornos medibles que pertenecen a esta etapa (enteros, anclados en el núcleo)"""
+        cortados = self.cortados
+        return [i for i in self.centroides
+                if not cortados[i] and i not in self.excluidos
+                and self.en_nucleo(*self.contornos[i][0, 0])]
+
+    def colores(self, xs, ys, radio):
+        """Códigos de color dominante en coordenadas globales; lo que sale de la ventana se consulta sobre la ROI completa"""
+        xs = np.asarray(xs, dtype=np.int64).ravel()
+        ys = np.asarray(ys, dtype=np.int64).ravel()
+        radios = np.broadcast_to(np.asarray(radio, dtype=np.int64), xs.shape)
+        if not self.usar_integral:
+            return np.array([codigo_dominante_roi(self.imagen, self.clasificador, int(x), int(y), int(r))
+                             for x, y, r in zip(xs, ys, radios)], dtype=np.int16)
+        
+        vx1, vy1, vx2, vy2 = self.ventana
+        codigos = self.integral.codigos_dominantes_lote(xs - vx1, ys - vy1, radios)
+        fuera = (((xs - radios < vx1) & (vx1 > 0)) | ((ys - radios < vy1) & (vy1 > 0)) |
+                 ((xs + radios > vx2) & (vx2 < self.ancho)) | ((ys + radios > vy2) & (vy2 < self.alto)))
+        for i in np.flatnonzero(fuera):
+            codigos[i] = codigo_dominante_roi(self.imagen, self.clasificador, int(xs[i]), int(ys[i]), int(radios[i]))
+        return codigos
+
+    def ajustar_parametros(self, parametros):
+        """Cambia los parámetros descartando solo los productos que dependen de los que cambiaron"""
+        nuevos = {**PARAMETROS_DETECCION, **parametros}
+        cambiados = {nombre for nombre, valor in nuevos.items() if self.parametros.get(nombre) != valor}
+        for producto, dependencias in self.DEPENDENCIAS.items():
+            if cambiados.intersection(dependencias):
+                self.productos.pop(producto, None)
+        self.parametros = nuevos
+
+    def liberar(self):
+        """Descarta los productos pesados de color y conserva la geometría"""
+        for nombre in ("planos", "integral"):
+            self.productos.pop(nombre, None)
+
+class CacheDeteccion:
+    """Resultados de detección por tesela, para no repetir el análisis al desplazar la vista
+
+    Guarda la EtapaDeteccion de cada tesela (la geometría que comparten los detectores) y el
+    catálogo de cada detector por tesela y firma (detector, parámetros). Se vacía al cambiar la
+    imagen filtrada (otro objeto) o el teselado; las teselas menos usadas salen primero.
+    """
+
+    def __init__(self, max_teselas=64):
+        self.max_teselas = max_teselas
+        self.imagen = None
+        self.teselado = None
+        self.etapas = {}
+        self.resultados = {}
+        self.lock = threading.Lock()
+
+    def preparar(self, imagen, tile_size, halo):
+        with self.lock:
+            if imagen is not self.imagen or (tile_size, halo) != self.teselado:
+                self.etapas.clear()
+                self.resultados.clear()
+                self.imagen = imagen
+                self.teselado = (tile_size, halo)
+
+    def etapa(self, tesela):
+        with self.lock:
+            etapa = self.etapas.pop(tesela, None)
+            if etapa is not None:
+                self.etapas[tesela] = etapa
+            return etapa
+
+    def guardar_etapa(self, tesela, etapa):
+        with self.lock:
+            self.etapas.pop(tesela, None)
+            self.etapas[tesela] = etapa
+            while len(self.etapas) > self.max_teselas:
+                antigua = next(iter(self.etapas))
+                del self.etapas[antigua]
+                self.resultados.pop(antigua, None)
+
+    def resultado(self, tesela, firma):
+        with self.lock:
+            return self.resultados.get(tesela, {}).get(firma)
+
+    def guardar_resultado(self, tesela, firma, catalogo):
+        with self.lock:
+            if tesela in self.etapas:
+                self.resultados.setdefault(tesela, {})[firma] = catalogo
+
+    def limpiar(self):
+        with self.lock:
+            self.etapas.clear()
+            self.resultados.clear()
+            self.imagen = None
+
+class DetectorTeselado:
+    """Detección de patrones en la imagen completa por teselas solapadas procesadas en paralelo
+
+    Cada tesela es una EtapaDeteccion con un halo alrededor de su núcleo y solo conserva los
+    patrones anclados en el núcleo, de modo que cada patrón pertenece a una única tesela.
+    Los contornos cortados por el borde de una ventana se reconstruyen sobre la imagen completa,
+    los círculos duplicados entre teselas vecinas se suprimen con la misma distancia mínima que
+    HoughCircles y los segmentos colineales que cruzan una costura se fusionan. Los niveles
+    gruesos de los cráteres se buscan una vez en la pirámide de la zona analizada.
+    """
+
+    def __init__(self, clasificador, opciones, tile_size=1024, halo=128, max_workers=None, parametros=None):
+        self.clasificador = clasificador
+        self.opciones = dict(opciones)
+        self.parametros = {**PARAMETROS_DETECCION, **(parametros or {})}
+        self.tile_size = tile_size
+        self.halo = halo
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+
+    def ejecutar(self, imagen, progreso=None, cancelar=None, region=None, cache=None):
+        """Devuelve (patrones, info) en coordenadas de la imagen completa, o None si se cancela
+
+        `progreso(fraccion)` se llama desde los hilos de trabajo; `cancelar` es un threading.Event.
+        Con `region` (x1, y1, x2, y2) solo se analizan las teselas que la cortan; con `cache`
+        (CacheDeteccion) no se repiten las teselas ni los detectores ya analizados.
+        """
+        self.imagen = imagen
+        alto, ancho = imagen.shape[:2]
+        self.alto, self.ancho = alto, ancho
+        rx1, ry1, rx2, ry2 = region or (0, 0, ancho, alto)
+        rx1, ry1, rx2, ry2 = max(0, rx1), max(0, ry1), min(ancho, rx2), min(alto, ry2)
+        if rx2 <= rx1 or ry2 <= ry1:
+            # Región vacía o fuera de la imagen: no hay ninguna tesela que analizar
+            self.teselas_nuevas = 0
+            if progreso:
+                progreso(1.0)
+            catalogo = CatalogoPatrones.vacio(self.clasificador.colores_dominantes)
+            return catalogo, resumen_patrones(catalogo, self.opciones)
+        inicio_x, inicio_y = rx1 - rx1 % self.tile_size, ry1 - ry1 % self.tile_size
+        teselas = [(x, y, min(x + self.tile_size, ancho), min(y + self.tile_size, alto))
+                   for y in range(inicio_y, ry2, self.tile_size) for x in range(inicio_x, rx2, self.tile_size)]
+        self.area = (inicio_x, inicio_y, teselas[-1][2], teselas[-1][3])
+        self.zona = self._ventana(self.area, self.halo)
+        
+        if cache is None:
+            cache = CacheDeteccion(max_teselas=len(teselas))
+        cache.preparar(imagen, self.tile_size, self.halo)
+        self.cache = cache
+        etapas = [cache.etapa(tesela) for tesela in teselas]
+        for etapa in etapas:
+            if etapa is not None:
+                etapa.ajustar_parametros(self.parametros)
+        nuevas = [tesela for tesela, etapa in zip(teselas, etapas) if etapa is None]
+        self.teselas_nuevas = len(nuevas)
+        
+        total = len(nuevas) + 2 * len(teselas) + 1
+        completadas = [0]
+        lock = threading.Lock()
+        
+        def avanzar():
+            with lock:
+                completadas[0] += 1
+                if progreso:
+                    progreso(completadas[0] / total)
+        
+        def ejecutar_fase(funcion, elementos):
+            resultados = []
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futuros = [executor.submit(funcion, elemento) for elemento in elementos]
+                for futuro in futuros:
+                    if cancelar is not None and cancelar.is_set():
+                        for pendiente in futuros:
+                            pendiente.cancel()
+                        return None
+                    resultados.append(futuro.result())
+                    avanzar()
+            return resultados
+        
+        # Fase 1: gris suavizado y máscara binaria de las teselas que no están en la caché
+        creadas = ejecutar_fase(self._etapa_tesela, nuevas)
+        if creadas is None:
+            return None
+        creadas = iter(creadas)
+        etapas = [etapa if etapa is not None else next(creadas) for etapa in etapas]
+        for tesela, etapa in zip(teselas, etapas):
+            cache.guardar_etapa(tesela, etapa)
+        
+        # Fase 2: geometría que piden los detectores activos (contornos, Hough, fuentes puntuales);
+        # las etapas de la caché ya tienen la de los detectores usados antes
+        if ejecutar_fase(self._geometria_tesela, etapas) is None:
+            return None
+        
+        extra = None
+        if self.opciones.get("contornos") or self.opciones.get("rectangulos"):
+            extra = self._resolver_contornos(etapas)
+        
+        # Fase 3: los detectores consumen cada etapa (o se toma su resultado de la caché)
+        resultados = ejecutar_fase(self._patrones_tesela, etapas)
+        if resultados is None:
+            return None
+        
+        catalogos = []
+        for clave, (_, _, detector) in DETECTORES_PATRONES.items():
+            if clave == "circulos":
+                catalogos.append(self._fusionar_circulos(etapas, resultados, clave))
+            elif clave == "crateres":
+                nivel_cero = self._fusionar_circulos(etapas, resultados, clave)
+                catalogos.append(nivel_cero)
+                if self.opciones.get(clave):
+                    catalogos.append(self._crateres_gruesos(etapas, nivel_cero))
+            elif clave == "lineas":
+                catalogos.append(self._fusionar_lineas(etapas, resultados))
             else:
-                resultado += "Modelo de clasificación no disponible\n"
+                catalogos.extend(resultado.get(clave) for resultado in resultados)
+                if extra is not None and clave in ("contornos", "rectangulos") and self.opciones.get(clave):
+                    catalogos.append(detector(extra))
+        catalogo = CatalogoPatrones.concatenar(catalogos, self.clasificador.colores_dominantes)
+        avanzar()
+        return catalogo, resumen_patrones(catalogo, self.opciones)
+
+    def _ventana(self, tesela, halo):
+        x1, y1, x2, y2 = tesela
+        return (max(0, x1 - halo), max(0, y1 - halo), min(self.ancho, x2 + halo), min(self.alto, y2 + halo))
+
+    def _etapa_tesela(self, tesela):
+        """Etapa de la tesela con su halo; la mediana 5x5 se calcula con 2 px más para ser exacta en la ventana"""
+        ventana = self._ventana(tesela, self.halo)
+        vx1, vy1, vx2, vy2 = ventana
+        ex1, ey1, ex2, ey2 = self._ventana(ventana, 2)
+        gris = CachePlanosImagen(self.imagen[ey1:ey2, ex1:ex2]).gris()
+        suavizado = gris_suavizado_deteccion(gris)[vy1 - ey1:vy2 - ey1, vx1 - ex1:vx2 - ex1]
+        binaria = binarizar_deteccion(suavizado, self.parametros["umbral_binario"])
+        # Los niveles gruesos de la pirámide se buscan una sola vez sobre toda la zona
+        return EtapaDeteccion(self.imagen, self.clasificador, ventana, tesela,
+                              gris_suavizado=suavizado, binaria=binaria,
+                              circulos_gruesos=np.empty((0, 4), dtype=int), parametros=self.parametros)
+
+    def _geometria_tesela(self, etapa):
+        if self.opciones.get("circulos") or self.opciones.get("crateres"):
+            etapa.circulos
+        if self.opciones.get("contornos") or self.opciones.get("rectangulos"):
+            etapa.centroides
+            etapa.cortados
+        if self.opciones.get("lineas"):
+            etapa.segmentos
+        if self.opciones.get("estrellas"):
+            etapa.fuentes
+        return etapa
+
+    def _mosaico(self, etapas, producto):
+        """Une un producto por ventana (gris suavizado o binaria) en un array de toda la zona"""
+        zx1, zy1, zx2, zy2 = self.zona
+        mosaico = np.empty((zy2 - zy1, zx2 - zx1), dtype=np.uint8)
+        for etapa in etapas:
+            vx1, vy1, vx2, vy2 = etapa.ventana
+            mosaico[vy1 - zy1:vy2 - zy1, vx1 - zx1:vx2 - zx1] = getattr(etapa, producto)
+        return mosaico
+
+    def _patrones_tesela(self, etapa):
+        resultado = {}
+        for clave, (_, _, detector) in DETECTORES_PATRONES.items():
+            if not self.opciones.get(clave):
+                continue
+            # Contornos y rectángulos dependen además de lo que excluyeron las teselas vecinas
+            firma = (clave, tuple(self.parametros[nombre] for nombre in PARAMETROS_DETECTORES[clave]))
+            if clave in ("contornos", "rectangulos"):
+                firma += (tuple(sorted(etapa.excluidos)),)
+            resultado[clave] = self.cache.resultado(etapa.nucleo, firma)
+            if resultado[clave] is None:
+                resultado[clave] = detector(etapa)
+                self.cache.guardar_resultado(etapa.nucleo, firma, resultado[clave])
+        etapa.liberar()
+        return resultado
+
+    def _resolver_contornos(self, etapas):
+        """Reconstruye los componentes truncados y excluye duplicados y contornos anidados en otro
+
+        Devuelve una etapa sin tablas de color con los contornos reconstruidos. La reconstrucción
+        se hace sobre la zona analizada (toda la imagen salvo con `region`), que la acota.
+        """
+        for etapa in etapas:
+            etapa.excluidos.clear()
+        zx, zy = self.zona[:2]
+        binaria = None
+        mascara = np.zeros((self.zona[3] - zy + 2, self.zona[2] - zx + 2), dtype=np.uint8)
+        completos = []
+        for etapa in etapas:
+            for i in np.flatnonzero(etapa.cortados):
+                sx, sy = (int(v) for v in etapa.contornos[i][0, 0])
+                if mascara[sy - zy + 1, sx - zx + 1]:
+                    continue
+                if binaria is None:
+                    binaria = self._mosaico(etapas, "binaria")
+                _, _, _, (rx, ry, rw, rh) = cv2.floodFill(binaria, mascara, (sx - zx, sy - zy), 255,
+                                                         flags=8 | cv2.FLOODFILL_MASK_ONLY | (1 << 8))
+                recorte = cv2.copyMakeBorder(binaria[ry:ry + rh, rx:rx + rw], 1, 1, 1, 1,
+                                             cv2.BORDER_CONSTANT, value=0)
+                contornos, _ = cv2.findContours(recorte, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE,
+                                                offset=(rx - 1 + zx, ry - 1 + zy))
+                for cnt in contornos:
+                    if cv2.pointPolygonTest(cnt, (float(sx), float(sy)), False) >= 0:
+                        completos.append(cnt)
+                        break
+        extra = EtapaDeteccion(self.imagen, self.clasificador, nucleo=self.area, contornos=completos,
+                               usar_integral=False, parametros=self.parametros)
+        
+        # Los componentes ya reconstruidos se excluyen de las teselas que los veían enteros
+        candidatos = []
+        for etapa in etapas:
+            for i in etapa.contornos_propios():
+                sx, sy = etapa.contornos[i][0, 0]
+                if mascara[sy - zy + 1, sx - zx + 1]:
+                    etapa.excluidos.add(i)
+                else:
+                    candidatos.append((etapa, i))
+        candidatos.extend((extra, i) for i in extra.contornos_propios())
+        if not completos or not candidatos:
+            return extra
+        
+        # Un contorno entero dentro de su ventana solo puede estar anidado en un componente que la cruza
+        inicios = np.array([etapa.contornos[i][0, 0] for etapa, i in candidatos])
+        orden = np.argsort(inicios[:, 0], kind="stable")
+        xs_ordenados = inicios[orden, 0]
+        for envolvente in completos:
+            bx, by, bw, bh = cv2.boundingRect(envolvente)
+            inicio, fin = np.searchsorted(xs_ordenados, [bx, bx + bw])
+            for k in orden[inicio:fin]:
+                etapa, i = candidatos[k]
+                px, py = inicios[k]
+                if by <= py < by + bh and etapa.contornos[i] is not envolvente:
+                    if cv2.pointPolygonTest(envolvente, (float(px), float(py)), False) > 0:
+                        etapa.excluidos.add(i)
+        return extra
+
+    def _fusionar_circulos(self, etapas, resultados, clave):
+        """Supresión por distancia mínima entre círculos de teselas distintas; gana el más alejado de su borde"""
+        partes = [resultado.get(clave) for resultado in resultados]
+        if not any(parte is not None and len(parte) for parte in partes):
+            return None
+        catalogo = CatalogoPatrones.concatenar(partes)
+        origenes = np.repeat(np.arange(len(partes)), [len(parte) if parte is not None else 0 for parte in partes])
+        nucleos = np.array([etapa.nucleo for etapa in etapas])[origenes]
+        x, y = catalogo.datos["x"], catalogo.datos["y"]
+        margenes = np.minimum.reduce([x - nucleos[:, 0], nucleos[:, 2] - 1 - x, y - nucleos[:, 1], nucleos[:, 3] - 1 - y])
+        
+        celda = self.parametros["distancia_circulos"]
+        rejilla = {}
+        aceptados = []
+        for k in np.argsort(-margenes, kind="stable"):
+            px, py, origen = int(x[k]), int(y[k]), origenes[k]
+            cx, cy = px // celda, py // celda
+            conflicto = False
+            for vecino_x in (cx - 1, cx, cx + 1):
+                for vecino_y in (cy - 1, cy, cy + 1):
+                    for otro_origen, ox, oy in rejilla.get((vecino_x, vecino_y), ()):
+                        if otro_origen != origen and (px - ox) ** 2 + (py - oy) ** 2 < celda ** 2:
+                            conflicto = True
+            if not conflicto:
+                rejilla.setdefault((cx, cy), []).append((origen, px, py))
+                aceptados.append(k)
+        return catalogo[np.sort(aceptados)]
+
+    def _crateres_gruesos(self, etapas, nivel_cero):
+        """Niveles 1.. de la pirámide del gris de la zona, sin los que repiten un cráter del nivel 0"""
+        gruesos = circulos_multiescala(self._mosaico(etapas, "gris_suavizado"), param1=self.parametros["hough_param1"],
+                                       param2=self.parametros["hough_param2"]) + (*self.zona[:2], 0, 0)
+        ax1, ay1, ax2, ay2 = self.area
+        gruesos = gruesos[(gruesos[:, 0] >= ax1) & (gruesos[:, 0] < ax2) & (gruesos[:, 1] >= ay1) & (gruesos[:, 1] < ay2)]
+        if nivel_cero is not None:
+            datos = nivel_cero.datos
+            nivel_cero = np.column_stack([datos["x"], datos["y"], np.rint(datos["radio"]).astype(int),
+                                          np.zeros(len(datos), dtype=int)])
+        else:
+            nivel_cero = np.empty((0, 4), dtype=int)
+        indices = fusionar_escalas(np.vstack([nivel_cero, gruesos]))
+        gruesos = gruesos[indices[indices >= len(nivel_cero)] - len(nivel_cero)]
+        return catalogo_crateres(gruesos, EtapaDeteccion(self.imagen, self.clasificador, usar_integral=False,
+                                                         parametros=self.parametros))
+
+    def _fusionar_lineas(self, etapas, resultados):
+        """Fusiona segmentos colineales de teselas distintas que se solapan o casi tocan en una costura"""
+        internas = []
+        cruzan = []
+        for origen, (etapa, resultado) in enumerate(zip(etapas, resultados)):
+            lineas = resultado.get("lineas")
+            if lineas is None or not len(lineas):
+                continue
+            d = lineas.datos
+            dentro = etapa.en_nucleo(d["x1"], d["y1"]) & etapa.en_nucleo(d["x2"], d["y2"])
+            internas.append(lineas[dentro])
+            for fila in d[~dentro]:
+                cruzan.append((origen, np.array([fila["x1"], fila["y1"], fila["x2"], fila["y2"]], dtype=np.float64)))
+        
+        padres = list(range(len(cruzan)))
+        
+        def raiz(i):
+            while padres[i] != i:
+                padres[i] = padres[padres[i]]
+                i = padres[i]
+            return i
+        
+        for a in range(len(cruzan)):
+            for b in range(a + 1, len(cruzan)):
+                if cruzan[a][0] != cruzan[b][0] and self._colineales(cruzan[a][1], cruzan[b][1]):
+                    padres[raiz(a)] = raiz(b)
+        
+        grupos = {}
+        for i, (_, segmento) in enumerate(cruzan):
+            grupos.setdefault(raiz(i), []).append(segmento)
+        
+        segmentos = np.array([[int(round(v)) for v in self._unir_segmentos(grupo)] for grupo in grupos.values()],
+                             dtype=np.int64).reshape(-1, 4)
+        codigos = [codigo_dominante_roi(self.imagen, self.clasificador, (x1 + x2) // 2, (y1 + y2) // 2, 5)
+                   for x1, y1, x2, y2 in segmentos]
+        internas.append(catalogo_lineas(segmentos, codigos, self.clasificador.colores_dominantes))
+        return CatalogoPatrones.concatenar(internas)
+
+    def _colineales(self, a, b, tolerancia_angulo=np.pi / 90, tolerancia_distancia=2.0):
+        hueco_max = self.parametros["lineas_hueco_max"]
+        if (max(a[0], a[2]) + hueco_max < min(b[0], b[2]) or
+                max(b[0], b[2]) + hueco_max < min(a[0], a[2]) or
+                max(a[1], a[3]) + hueco_max < min(b[1], b[3]) or
+                max(b[1], b[3]) + hueco_max < min(a[1], a[3])):
+            return False
+        
+        da = a[2:] - a[:2]
+        db = b[2:] - b[:2]
+        la, lb = np.hypot(*da), np.hypot(*db)
+        if la == 0 or lb == 0:
+            return False
+        coseno = abs(np.dot(da, db)) / (la * lb)
+        if coseno < np.cos(tolerancia_angulo):
+            return False
+        
+        # Distancia perpendicular de los extremos del más corto a la recta del más largo
+        largo, corto, direccion, longitud = (a, b, da, la) if la >= lb else (b, a, db, lb)
+        normal = np.array([-direccion[1], direccion[0]]) / longitud
+        for punto in (corto[:2], corto[2:]):
+            if abs(np.dot(punto - largo[:2], normal)) > tolerancia_distancia:
+                return False
+        
+        unidad = direccion / longitud
+        proy_largo = sorted([0.0, longitud])
+        proy_corto = sorted([np.dot(corto[:2] - largo[:2], unidad), np.dot(corto[2:] - largo[:2], unidad)])
+        hueco = max(proy_corto[0] - proy_largo[1], proy_largo[0] - proy_corto[1])
+        return hueco <= hueco_max
+
+    @staticmethod
+    def _unir_segmentos(segmentos):
+        """Segmento que cubre todos los extremos, orientado como el más largo del grupo"""
+        largo = max(segmentos, key=lambda s: np.hypot(s[2] - s[0], s[3] - s[1]))
+        direccion = largo[2:] - largo[:2]
+        direccion = direccion / np.hypot(*direccion)
+        puntos = np.array([p for s in segmentos for p in (s[:2], s[2:])])
+        proyecciones = (puntos - largo[:2]) @ direccion
+        inicio, fin = puntos[np.argmin(proyecciones)], puntos[np.argmax(proyecciones)]
+        return (*inicio, *fin)
+
+class TrabajoAnalisis:
+    """Un análisis IA pedido por una ventana, ligado a la versión de imagen para la que se pidió"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, version, opciones=()):
+        self.id = next(self._ids)
+        self.version = version
+        self.opciones = opciones
+        self.cancelado = threading.Event()
+        self.etapas = {}
+
+    @property
+    def clave(self):
+        return self.version, self.opciones
+
+    def cancelar(self):
+        self.cancelado.set()
+
+class ColaAnalisis:
+    """Cola de análisis IA de una ventana: un trabajo en curso y como mucho uno pendiente
+
+    Volver a pedir lo mismo (misma versión de imagen y opciones) devuelve el trabajo que ya está
+    en curso o esperando; pedir otra cosa cancela los anteriores, que ya no interesan. Un único
+    hilo ejecuta los trabajos en orden con `ejecutar(trabajo)`; si falla se llama a
+    `al_fallar(trabajo, error)` desde ese hilo.
+    """
+
+    def __init__(self, ejecutar, al_fallar):
+        self.ejecutar = ejecutar
+        self.al_fallar = al_fallar
+        self.en_curso = None
+        self.pendiente = None
+        self.hilo = None
+        self.lock = threading.Lock()
+
+    def encolar(self, version, opciones=()):
+        """Devuelve (trabajo, nuevo); nuevo es False si se ha unido a uno igual"""
+        with self.lock:
+            for trabajo in (self.pendiente, self.en_curso):
+                if trabajo is not None and trabajo.clave == (version, opciones) and not trabajo.cancelado.is_set():
+                    return trabajo, False
+            for trabajo in (self.pendiente, self.en_curso):
+                if trabajo is not None:
+                    trabajo.cancelar()
+            self.pendiente = TrabajoAnalisis(version, opciones)
+            if self.hilo is None:
+                self.hilo = threading.Thread(target=self._procesar, daemon=True)
+                self.hilo.start()
+            return self.pendiente, True
+
+    def cancelar(self):
+        with self.lock:
+            for trabajo in (self.pendiente, self.en_curso):
+                if trabajo is not None:
+                    trabajo.cancelar()
+            self.pendiente = None
+
+    def _procesar(self):
+        while True:
+            with self.lock:
+                trabajo, self.pendiente = self.pendiente, None
+                self.en_curso = trabajo
+                if trabajo is None:
+                    self.hilo = None
+                    return
+            try:
+                if not trabajo.cancelado.is_set():
+                    self.ejecutar(trabajo)
+            except Exception as e:
+                self.al_fallar(trabajo, e)
+            with self.lock:
+                self.en_curso = None
+
+class GrafoTareas:
+    """Tareas con dependencias ejecutadas en un ThreadPoolExecutor
+
+    Cada tarea arranca en cuanto acaban aquellas de las que depende y recibe sus resultados como
+    argumentos, en el orden declarado. Su `al_terminar` se llama desde el hilo que ejecuta el grafo
+    según van acabando, sin esperar a la más lenta. Si una tarea falla, sus dependientes no se ejecutan.
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.tareas = {}
+
+    def agregar(self, nombre, funcion, dependencias=(), al_terminar=None):
+        # Las dependencias tienen que estar ya en el grafo: así no puede haber ciclos
+        desconocidas = [d for d in dependencias if d not in self.tareas]
+        if desconocidas:
+            raise ValueError(f"Dependencias desconocidas para {nombre}: {desconocidas}")
+        self.tareas[nombre] = (funcion, tuple(dependencias), al_terminar)
+
+    def ejecutar(self, progreso=None, cancelar=None):
+        """Ejecuta todas las tareas; devuelve (resultados, errores) por nombre de tarea
+
+        Si `cancelar` (un threading.Event) se activa, no arranca nada más y vuelve sin esperar
+        a las tareas en marcha, cuyos resultados se descartan.
+        """
+        resultados, errores = {}, {}
+        pendientes = dict(self.tareas)
+        en_curso = {}
+        terminadas = 0
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while pendientes or en_curso:
+                if cancelar is not None and cancelar.is_set():
+                    break
+                # En orden de inserción: un fallo se propaga a toda la cadena en una sola pasada
+                for nombre, (funcion, dependencias, _) in list(pendientes.items()):
+                    fallidas = [d for d in dependencias if d in errores]
+                    if fallidas:
+                        errores[nombre] = RuntimeError(f"Depende de tareas fallidas: {fallidas}")
+                        del pendientes[nombre]
+                    elif all(d in resultados for d in dependencias):
+                        en_curso[executor.submit(funcion, *(resultados[d] for d in dependencias))] = nombre
+                        del pendientes[nombre]
+                if not en_curso:
+                    continue
                 
+                # Con tiempo límite para comprobar la cancelación aunque ninguna tarea acabe
+                hechos, _ = wait(en_curso, timeout=0.1, return_when=FIRST_COMPLETED)
+                for futuro in hechos:
+                    nombre = en_curso.pop(futuro)
+                    al_terminar = self.tareas[nombre][2]
+                    try:
+                        resultados[nombre] = futuro.result()
+                        if al_terminar:
+                            al_terminar(resultados[nombre])
+                    except Exception as e:
+                        errores[nombre] = e
+                    terminadas += 1
+                    if progreso:
+                        progreso(nombre, terminadas, len(self.tareas))
+        finally:
+            # Las que aún esperan en la cola del executor no llegan a arrancar (cancel_futures es de 3.9)
+            for futuro in en_curso:
+                futuro.cancel()
+            executor.shutdown(wait=cancelar is None or not cancelar.is_set())
+        return resultados, errores
+
+class MapaEtiquetasIA:
+    """Clasificación IA por teselas: etiqueta principal, puntuación y descripción de cada tesela
+
+    `bordes_x` y `bordes_y` son los límites de las teselas en píxeles de la imagen original;
+    `codigos` (filas x columnas) indexa `etiquetas`, con -1 donde no hubo clasificación.
+    """
+
+    def __init__(self, bordes_x, bordes_y, etiquetas, codigos, puntuaciones, descripciones=None, segundos=0.0):
+        self.bordes_x = np.asarray(bordes_x)
+        self.bordes_y = np.asarray(bordes_y)
+        self.etiquetas = etiquetas
+        self.codigos = codigos
+        self.puntuaciones = puntuaciones
+        self.descripciones = descripciones
+        self.segundos = segundos
+
+    @property
+    def filas(self):
+        return len(self.bordes_y) - 1
+
+    @property
+    def columnas(self):
+        return len(self.bordes_x) - 1
+
+    def etiqueta_en(self, x, y):
+        """Etiqueta y puntuación de la tesela que contiene el píxel (x, y), o (None, 0.0)"""
+        fila = int(np.searchsorted(self.bordes_y, y, side="right")) - 1
+        columna = int(np.searchsorted(self.bordes_x, x, side="right")) - 1
+        if not (0 <= fila < self.filas and 0 <= columna < self.columnas) or self.codigos[fila, columna] < 0:
+            return None, 0.0
+        return self.etiquetas[self.codigos[fila, columna]], float(self.puntuaciones[fila, columna])
+
+    def teselas_en(self, x1, y1, x2, y2):
+        """(fila, columna, (x1, y1, x2, y2)) de las teselas que cortan el rectángulo"""
+        f1 = max(int(np.searchsorted(self.bordes_y, y1, side="right")) - 1, 0)
+        f2 = min(int(np.searchsorted(self.bordes_y, y2, side="left")), self.filas)
+        c1 = max(int(np.searchsorted(self.bordes_x, x1, side="right")) - 1, 0)
+        c2 = min(int(np.searchsorted(self.bordes_x, x2, side="left")), self.columnas)
+        for fila in range(f1, f2):
+            for columna in range(c1, c2):
+                yield fila, columna, (self.bordes_x[columna], self.bordes_y[fila],
+                                      self.bordes_x[columna + 1], self.bordes_y[fila + 1])
+
+    def informe(self, max_descripciones=20):
+        n = self.filas * self.columnas
+        resultado = "5️⃣  TILED AI ANALYSIS\n" + "="*50 + "\n\n"
+        resultado += f"🧩 Grid: {self.columnas} x {self.filas} tiles of ~{int(np.diff(self.bordes_x).mean())} px\n"
+        if self.segundos > 0:
+            resultado += f"⚡ Throughput: {n / self.segundos:.1f} tiles/s ({self.segundos:.1f} s)\n\n"
+
+        validos = self.codigos >= 0
+        if validos.any():
+            conteos = np.bincount(self.codigos[validos], minlength=len(self.etiquetas))
+            medias = np.bincount(self.codigos[validos], weights=self.puntuaciones[validos],
+                                 minlength=len(self.etiquetas)) / np.maximum(conteos, 1)
+            orden = np.argsort(-conteos)
+            resultado += "🏷️ LABELS BY AREA:\n" + "-"*20 + "\n"
+            for codigo in orden[conteos[orden] > 0]:
+                resultado += (f"{chr(65 + codigo % 26)}  {self.etiquetas[codigo]}: {conteos[codigo]} tiles "
+                              f"({100 * conteos[codigo] / n:.0f}%), mean score {medias[codigo] * 100:.0f}%\n")
+
+            # Mapa con una letra por tesela (la de la leyenda anterior)
+            resultado += "\n🗺️ LABEL MAP:\n"
+            for fila in range(self.filas):
+                resultado += " ".join(chr(65 + c % 26) if c >= 0 else "." for c in self.codigos[fila]) + "\n"
+        else:
+            resultado += "Modelo de clasificación no disponible\n"
+
+        if self.descripciones:
+            resultado += "\n📝 TILE DESCRIPTIONS:\n" + "-"*20 + "\n"
+            for i, texto in enumerate(self.descripciones[:max_descripciones]):
+                resultado += f"[{i // self.columnas},{i % self.columnas}] {texto}\n"
+            if len(self.descripciones) > max_descripciones:
+                resultado += f"... {len(self.descripciones) - max_descripciones} more\n"
+        return resultado
+
+_pool_remoto = None
+
+def pool_modelos():
+    """Pool de las ventanas: el del proceso o, con AI_CONFIG['model_server'], el del servidor de modelos"""
+    global _pool_remoto
+    if not AI_CONFIG.get('model_server'):
+        return POOL_MODELOS
+    if _pool_remoto is None:
+        from servidor_modelos import PoolRemoto
+        _pool_remoto = PoolRemoto(AI_CONFIG['model_server'])
+    return _pool_remoto
+
+class AnalizadorEspecializadoNASA:
+    def __init__(self, pool=None, cache=None):
+        self.pool = pool or POOL_MODELOS
+        self.cache = cache if cache is not None else (CACHE_INFERENCIA if AI_CONFIG.get('inference_cache', True) else None)
+        self.ultima_huella = (None, None)
+
+    def huella(self, imagen):
+        """huella_imagen, recordando la última: cada paso del análisis pregunta por la misma imagen"""
+        if self.ultima_huella[0] is not imagen:
+            self.ultima_huella = (imagen, huella_imagen(imagen))
+        return self.ultima_huella[1]
+
+    def inferir(self, nombre, imagenes, lote=1, huellas=None):
+        """Salidas del modelo `nombre` para una lista de imágenes, tomando de la caché las ya vistas
+
+        El modelo solo se carga si falta alguna; devuelve None si no está disponible. Sin firma
+        conocida (servidor de modelos inaccesible) no se lee ni se escribe la caché.
+        """
+        firma = self.pool.firma(nombre) if self.cache is not None else None
+        if firma is None:
+            with self.pool.usar(nombre) as modelo, self.pool.llamadas[nombre]:
+                return None if modelo is None else list(modelo(imagenes, batch_size=lote))
+
+        huellas = huellas or [self.huella(imagen) for imagen in imagenes]
+        salidas = self.cache.obtener(huellas, firma)
+        faltan = [i for i, huella in enumerate(huellas) if huella not in salidas]
+        if faltan:
+            with self.pool.usar(nombre) as modelo, self.pool.llamadas[nombre]:
+                if modelo is None:
+                    return None
+                nuevas = modelo([imagenes[i] for i in faltan], batch_size=lote)
+            nuevas = {huellas[i]: salida for i, salida in zip(faltan, nuevas)}
+            self.cache.guardar(nuevas, firma)
+            salidas.update(nuevas)
+        return [salidas[huella] for huella in huellas]
+
+    def en_cache(self, imagen):
+        """True si las salidas de todos los modelos para esta imagen ya están en la caché"""
+        if self.cache is None:
+            return False
+        firmas = [self.pool.firma(nombre) for nombre in self.pool.MODELOS]
+        if None in firmas:
+            return False
+        huella = self.huella(imagen)
+        return all(self.cache.obtener([huella], firma) for firma in firmas)
+
+    def analisis_basico_con_internet(self, imagen):
+        descripcion = self.describir(imagen)
+        return self.informe_basico(descripcion, self.buscar_informacion_internet(descripcion), self.clasificar(imagen))
+
+    def describir(self, imagen):
+        descripcion_local = "No se pudo generar descripción local"
+        try:
+            salidas = self.inferir('descripcion', [imagen])
+            if salidas is not None:
+                descripcion_local = salidas[0][0]['generated_text']
+        except:
+            pass
+        return descripcion_local
+
+    def clasificar(self, imagen):
+        """Clases de la imagen completa; None si no hay modelo y la excepción si ha fallado"""
+        try:
+            salidas = self.inferir('clasificacion', [imagen])
         except Exception as e:
-            resultado += f"❌ Error in analysis: {e}\n"
-            
+            return e
+        return None if salidas is None else salidas[0]
+
+    def informe_basico(self, descripcion_local, internet_info, clasificaciones):
+        resultado = "1️⃣  BASIC ANALYSIS WITH INTERNET SEARCH\n" + "="*60 + "\n\n"
+        resultado += f"📝 LOCAL ANALYSIS:\n{descripcion_local}\n\n"
+        resultado += f"🌐 INTERNET RESEARCH:\n{internet_info}\n\n"
+        
+        resultado += "🔍 DETECTED FEATURES:\n" + "-"*25 + "\n"
+        if clasificaciones is None:
+            resultado += "Modelo de clasificación no disponible\n"
+        elif isinstance(clasificaciones, Exception):
+            resultado += "No se pudieron analizar características\n"
+        else:
+            for i, clasif in enumerate(clasificaciones[:5], 1):
+                if clasif['score'] > 0.1:
+                    resultado += f"{i}. {clasif['label']}: {clasif['score']*100:.1f}%\n"
         return resultado
 
     def buscar_informacion_internet(self, descripcion):
@@ -2278,6 +4154,43 @@ uso de suelo, y fenómenos meteorológicos."""
         
         return info
 
+    def analisis_por_teselas(self, imagen, lado_tesela=384, max_teselas=64, lote=8, descripciones=True,
+                             progreso=None, cancelar=None):
+        """Clasifica (y describe) la imagen BGR por teselas, enviando a los modelos lotes de `lote` teselas
+
+        Devuelve None si `cancelar` (un threading.Event) se activa entre dos lotes.
+        """
+        bordes_x, bordes_y, teselas = teselas_inferencia(imagen, lado_tesela, max_teselas)
+        filas, columnas = len(bordes_y) - 1, len(bordes_x) - 1
+        etiquetas, indices = [], {}
+        codigos = np.full((filas, columnas), -1, dtype=np.int32)
+        puntuaciones = np.zeros((filas, columnas), dtype=np.float32)
+        textos = [] if descripciones else None
+
+        inicio = time.perf_counter()
+        huellas = [huella_imagen(tesela) for tesela in teselas] if self.cache is not None else None
+        for i in range(0, len(teselas), lote):
+            if cancelar is not None and cancelar.is_set():
+                return None
+            grupo = teselas[i:i + lote]
+            huellas_grupo = huellas[i:i + lote] if huellas else None
+            clases_grupo = self.inferir('clasificacion', grupo, lote, huellas_grupo)
+            for j, clases in enumerate(clases_grupo or [], i):
+                mejor = clases[0]
+                if mejor['label'] not in indices:
+                    indices[mejor['label']] = len(etiquetas)
+                    etiquetas.append(mejor['label'])
+                codigos[j // columnas, j % columnas] = indices[mejor['label']]
+                puntuaciones[j // columnas, j % columnas] = mejor['score']
+            if textos is not None:
+                salidas = self.inferir('descripcion', grupo, lote, huellas_grupo)
+                if salidas is not None:
+                    textos.extend(salida[0]['generated_text'] for salida in salidas)
+            if progreso:
+                progreso(min(i + lote, len(teselas)), len(teselas))
+        return MapaEtiquetasIA(bordes_x, bordes_y, etiquetas, codigos, puntuaciones, textos,
+                               time.perf_counter() - inicio)
+
     def analisis_planetario(self, imagen, ruta_imagen):
         resultado = "2️⃣  PLANETARY ANALYSIS\n" + "="*50 + "\n\n"
         resultado += "🪐 Análisis planetario requiere imágenes específicas de planetas.\n"
@@ -2307,8 +4220,9 @@ uso de suelo, y fenómenos meteorológicos."""
     def analisis_basico(self, imagen, ruta_imagen):
         resultado = "1️⃣  BASIC ANALYSIS\n" + "="*50 + "\n\n"
         try:
-            if 'descripcion' in self.modelos:
-                descripcion = self.modelos['descripcion'](imagen)[0]['generated_text']
+            salidas = self.inferir('descripcion', [imagen])
+            if salidas is not None:
+                descripcion = salidas[0][0]['generated_text']
                 resultado += f"📝 DESCRIPTION:\n{descripcion}\n\n"
             else:
                 resultado += "📝 Modelo de descripción no disponible\n\n"
@@ -2318,6 +4232,344 @@ uso de suelo, y fenómenos meteorológicos."""
             
         return resultado
 
+def teselas_inferencia(imagen, lado_tesela=384, max_teselas=64):
+    """Corta en teselas PIL RGB de ~lado_tesela px la imagen BGR o, si salen más de max_teselas,
+    el primer nivel de su pirámide que cumpla; devuelve también los bordes en píxeles originales"""
+    nivel, factor = imagen, 1
+    while (max(1, round(nivel.shape[1] / lado_tesela)) * max(1, round(nivel.shape[0] / lado_tesela)) > max_teselas):
+        nivel = cv2.resize(nivel, ((nivel.shape[1] + 1) // 2, (nivel.shape[0] + 1) // 2), interpolation=cv2.INTER_AREA)
+        factor *= 2
+    if nivel.ndim == 2:
+        nivel = cv2.cvtColor(nivel, cv2.COLOR_GRAY2BGR)
+    rgb = cv2.cvtColor(nivel, cv2.COLOR_BGR2RGB)
+
+    # Bordes repartidos por igual: sin teselas finas en el margen
+    alto, ancho = rgb.shape[:2]
+    xs = np.linspace(0, ancho, max(1, round(ancho / lado_tesela)) + 1).astype(int)
+    ys = np.linspace(0, alto, max(1, round(alto / lado_tesela)) + 1).astype(int)
+    teselas = [Image.fromarray(rgb[y1:y2, x1:x2]) for y1, y2 in zip(ys[:-1], ys[1:]) for x1, x2 in zip(xs[:-1], xs[1:])]
+    escala_x = imagen.shape[1] / ancho
+    escala_y = imagen.shape[0] / alto
+    return np.round(xs * escala_x).astype(int), np.round(ys * escala_y).astype(int), teselas
+
+def estadisticas_rangos_color(imagen, clasificador, seleccion=None, tile_size=512):
+    """Calcula las estadísticas de rangos de color de una imagen BGR sin interfaz (uso en lote)"""
+    if seleccion is None:
+        seleccion = clasificador.nombres
+    etiquetas = clasificador.etiquetar(cv2.cvtColor(imagen, cv2.COLOR_BGR2HSV))
+    histogramas = clasificador.histogramas_teselas(etiquetas, tile_size)
+    return EstadisticasColor.desde_histogramas(clasificador, seleccion, histogramas)
+
+def codigo_dominante_roi(imagen, clasificador, x, y, radio):
+    """Código de color dominante en el cuadrado de lado 2*radio centrado en (x, y), clasificando solo esa ROI"""
+    h, w = imagen.shape[:2]
+    x1 = max(0, x - radio)
+    y1 = max(0, y - radio)
+    x2 = min(w, x + radio)
+    y2 = min(h, y + radio)
+    
+    roi = imagen[y1:y2, x1:x2]
+    
+    if roi.size == 0:
+        return clasificador.codigo_desconocido
+    
+    roi_etiquetas = clasificador.etiquetar(cv2.cvtColor(roi, cv2.COLOR_BGR2HSV))
+    conteos = clasificador.histograma(roi_etiquetas) @ clasificador.pertenencia
+    
+    if conteos.max() > 0:
+        return int(np.argmax(conteos))
+    else:
+        return clasificador.codigo_sin_color
+
+def color_dominante_roi(imagen, clasificador, x, y, radio):
+    return clasificador.colores_dominantes[codigo_dominante_roi(imagen, clasificador, x, y, radio)]
+
+def gris_suavizado_deteccion(gris):
+    return cv2.medianBlur(gris, 5)
+
+def binarizar_deteccion(gris_suavizado, umbral=127):
+    return cv2.threshold(gris_suavizado, umbral, 255, cv2.THRESH_BINARY)[1]
+
+def circulos_hough(gris_suavizado, radio_min=5, radio_max=100, distancia_min=30, param1=50, param2=30):
+    """Círculos (x, y, r) enteros; array vacío si no hay ninguno"""
+    circles = cv2.HoughCircles(
+        gris_suavizado,
+        cv2.HOUGH_GRADIENT,
+        dp=1,
+        minDist=distancia_min,
+        param1=param1,
+        param2=param2,
+        minRadius=radio_min,
+        maxRadius=radio_max
+    )
+    if circles is None:
+        return np.empty((0, 3), dtype=int)
+    return np.round(circles.reshape(-1, 3)).astype("int")
+
+def circulos_multiescala(gris_suavizado, radio_min=50, radio_max=100, param1=50, param2=30):
+    """Círculos grandes en los niveles 1.. de una pirámide gaussiana, en coordenadas del nivel 0
+
+    El nivel k busca radios de `radio_min` a `radio_max` px del nivel (x2**k en el nivel 0); con
+    circulos_hough en el nivel 0 (5-100 px) las octavas quedan contiguas. Devuelve filas
+    (x, y, r, nivel) enteras.
+    """
+    resultados = [np.empty((0, 4), dtype=int)]
+    nivel, imagen = 0, gris_suavizado
+    while min(imagen.shape) // 2 >= 2 * radio_min:
+        imagen = cv2.pyrDown(imagen)
+        nivel += 1
+        escala = 2 ** nivel
+        circulos = circulos_hough(imagen, radio_min, radio_max, radio_min, param1, param2)
+        # El píxel i del nivel cubre los píxeles [i * escala, (i + 1) * escala) del nivel 0
+        centros = circulos[:, :2] * escala + (escala - 1) // 2
+        resultados.append(np.column_stack([centros, circulos[:, 2] * escala, np.full(len(circulos), nivel)]))
+    return np.vstack(resultados)
+
+def fusionar_escalas(circulos, solape=0.5, razon_radios=1.5):
+    """Índices de los círculos (x, y, r, nivel) que no repiten uno de un nivel más fino
+
+    Dos detecciones de niveles distintos son el mismo cráter si sus centros distan menos de
+    `solape` veces el radio menor y los radios difieren menos de `razon_radios`.
+    """
+    if len(circulos) == 0:
+        return np.empty(0, dtype=int)
+    niveles = circulos[:, 3]
+    # El nivel más fino no se compara consigo mismo: Hough ya impone su distancia mínima
+    aceptados = list(np.flatnonzero(niveles == niveles.min()))
+    gruesos = np.flatnonzero(niveles > niveles.min())
+    for k in gruesos[np.argsort(niveles[gruesos], kind="stable")]:
+        x, y, r, nivel = circulos[k]
+        previos = circulos[aceptados]
+        menor = np.minimum(previos[:, 2], r)
+        mayor = np.maximum(previos[:, 2], r)
+        duplicado = ((previos[:, 3] != nivel) & (np.hypot(previos[:, 0] - x, previos[:, 1] - y) < solape * menor)
+                     & (mayor < razon_radios * menor))
+        if not duplicado.any():
+            aceptados.append(k)
+    return np.sort(aceptados)
+
+def bordes_canny(gris_suavizado, bajo=50, alto=150):
+    return cv2.Canny(gris_suavizado, bajo, alto, apertureSize=3)
+
+def lineas_hough(bordes, votos=50, longitud_min=30, hueco_max=10):
+    """Segmentos (x1, y1, x2, y2); array vacío si no hay ninguno"""
+    lineas = cv2.HoughLinesP(bordes, 1, np.pi/180, threshold=votos, 
+                             minLineLength=longitud_min, maxLineGap=hueco_max)
+    if lineas is None:
+        return np.empty((0, 4), dtype=np.int32)
+    return lineas.reshape(-1, 4)
+
+def fondo_y_ruido(gris, bloque=64):
+    """Fondo (mediana) y ruido (1.4826 * MAD) por bloques, interpolados a resolución completa"""
+    alto, ancho = gris.shape
+    filas, columnas = -(-alto // bloque), -(-ancho // bloque)
+    relleno = np.full((filas * bloque, columnas * bloque), np.nan, dtype=np.float32)
+    relleno[:alto, :ancho] = gris
+    bloques = relleno.reshape(filas, bloque, columnas, bloque).transpose(0, 2, 1, 3).reshape(filas, columnas, -1)
+    
+    mediana = np.nanmedian(bloques, axis=2)
+    mad = np.nanmedian(np.abs(bloques - mediana[..., None]), axis=2)
+    # Suelo de ruido: en imágenes de 8 bits con fondo plano la MAD puede ser 0
+    ruido = np.maximum(1.4826 * mad, 0.5)
+    
+    # Se interpola al tamaño relleno y se recorta: cada bloque ocupa siempre `bloque` píxeles, así
+    # ventanas alineadas a la rejilla de bloques obtienen el mismo fondo que la imagen completa
+    tamano = (columnas * bloque, filas * bloque)
+    fondo = cv2.resize(mediana.astype(np.float32), tamano, interpolation=cv2.INTER_LINEAR)[:alto, :ancho]
+    ruido = cv2.resize(ruido.astype(np.float32), tamano, interpolation=cv2.INTER_LINEAR)[:alto, :ancho]
+    return fondo, ruido
+
+def fuentes_puntuales(gris, umbral_sigma=5.0, sigma_psf=1.5, bloque=64, apertura=2):
+    """Extractor de fuentes puntuales: fondo robusto, filtro gaussiano, máximos locales y centroides
+
+    Devuelve un dict de arrays (una entrada por fuente): pixel del pico (px, py), centroide
+    ponderado por flujo (xc, yc), flujo en apertura cuadrada de lado 2*apertura+1 con el fondo
+    restado y significancia del pico.
+    """
+    gris = gris.astype(np.float32)
+    fondo, ruido = fondo_y_ruido(gris, bloque)
+    residuo = gris - fondo
+    
+    # Filtro adaptado a una PSF gaussiana; el ruido del mapa filtrado baja en 1 / (2 * sqrt(pi) * sigma)
+    suavizado = cv2.GaussianBlur(residuo, (0, 0), sigma_psf)
+    significancia = suavizado / (ruido / (2 * np.sqrt(np.pi) * sigma_psf))
+    
+    # Máximo local: >= que los 8 vecinos y > que los 4 anteriores en orden de barrido (una fuente por meseta)
+    maximo = cv2.dilate(suavizado, np.ones((3, 3), np.uint8))
+    anteriores = np.array([[1, 1, 1], [1, 0, 0], [0, 0, 0]], dtype=np.uint8)
+    maximo_anterior = cv2.dilate(suavizado, anteriores, borderType=cv2.BORDER_CONSTANT, borderValue=-np.inf)
+    picos = (suavizado >= maximo) & (suavizado > maximo_anterior) & (significancia > umbral_sigma)
+    py, px = np.nonzero(picos)
+    
+    # Ventanas alrededor de cada pico recogidas de una vez: (N, lado, lado)
+    desplazamientos = np.arange(-apertura, apertura + 1)
+    con_borde = np.pad(residuo, apertura, mode="constant")
+    ventanas = con_borde[py[:, None, None] + apertura + desplazamientos[None, :, None],
+                         px[:, None, None] + apertura + desplazamientos[None, None, :]]
+    
+    flujo = ventanas.sum(axis=(1, 2))
+    positivo = np.maximum(ventanas, 0)
+    peso = positivo.sum(axis=(1, 2))
+    peso_seguro = np.where(peso > 0, peso, 1)
+    xc = px + (positivo.sum(axis=1) @ desplazamientos) / peso_seguro
+    yc = py + (positivo.sum(axis=2) @ desplazamientos) / peso_seguro
+    
+    return {"px": px, "py": py, "xc": xc, "yc": yc, "flujo": flujo,
+            "significancia": significancia[py, px]}
+
+def detector_circulos(etapa):
+    circulos = etapa.circulos
+    circulos = circulos[etapa.en_nucleo(circulos[:, 0], circulos[:, 1])]
+    x, y, r = circulos[:, 0], circulos[:, 1], circulos[:, 2]
+    return CatalogoPatrones.crear("Círculo", x, y, etapa.colores(x, y, r), etapa.clasificador.colores_dominantes,
+                                  radio=r, area=np.pi * r * r)
+
+def detector_crateres(etapa):
+    """Barrido multiescala: Hough del nivel 0 (compartido con detector_circulos) más los niveles de la pirámide"""
+    nivel_cero = np.column_stack([etapa.circulos, np.zeros(len(etapa.circulos), dtype=int)])
+    circulos = np.vstack([nivel_cero, etapa.circulos_gruesos])
+    circulos = circulos[fusionar_escalas(circulos)]
+    circulos = circulos[etapa.en_nucleo(circulos[:, 0], circulos[:, 1])]
+    return catalogo_crateres(circulos, etapa)
+
+def catalogo_crateres(circulos, etapa):
+    x, y, r = circulos[:, 0], circulos[:, 1], circulos[:, 2]
+    return CatalogoPatrones.crear("Cráter", x, y, etapa.colores(x, y, r), etapa.clasificador.colores_dominantes,
+                                  radio=r, area=np.pi * r * r)
+
+def detector_contornos(etapa):
+    indices = etapa.contornos_propios()
+    centroides = np.array([etapa.centroides[i] for i in indices], dtype=np.int64).reshape(-1, 2)
+    x, y = centroides[:, 0], centroides[:, 1]
+    return CatalogoPatrones.crear("Contorno", x, y, etapa.colores(x, y, 10), etapa.clasificador.colores_dominantes,
+                                  area=etapa.areas[indices])
+
+def detector_rectangulos(etapa):
+    indices = []
+    esquinas = []
+    for i in etapa.contornos_propios():
+        if etapa.areas[i] > etapa.parametros["area_min_rectangulo"]:
+            cnt = etapa.contornos[i]
+            peri = cv2.arcLength(cnt, True)
+            approx = cv2.approxPolyDP(cnt, 0.02 * peri, True)
+            if len(approx) == 4:
+                indices.append(i)
+                esquinas.append(len(approx))
+    
+    centroides = np.array([etapa.centroides[i] for i in indices], dtype=np.int64).reshape(-1, 2)
+    x, y = centroides[:, 0], centroides[:, 1]
+    return CatalogoPatrones.crear("Rectángulo", x, y, etapa.colores(x, y, 15), etapa.clasificador.colores_dominantes,
+                                  area=etapa.areas[indices], esquinas=esquinas)
+
+def catalogo_lineas(segmentos, codigos_color, colores):
+    segmentos = np.asarray(segmentos).reshape(-1, 4)
+    medios_x = (segmentos[:, 0] + segmentos[:, 2]) // 2
+    medios_y = (segmentos[:, 1] + segmentos[:, 3]) // 2
+    longitud = np.hypot(segmentos[:, 2] - segmentos[:, 0], segmentos[:, 3] - segmentos[:, 1])
+    return CatalogoPatrones.crear("Línea", medios_x, medios_y, codigos_color, colores,
+                                  longitud=longitud, segmentos=segmentos)
+
+def detector_lineas(etapa):
+    segmentos = etapa.segmentos
+    medios_x = (segmentos[:, 0] + segmentos[:, 2]) // 2
+    medios_y = (segmentos[:, 1] + segmentos[:, 3]) // 2
+    propios = etapa.en_nucleo(medios_x, medios_y)
+    codigos = etapa.colores(medios_x[propios], medios_y[propios], 5)
+    return catalogo_lineas(segmentos[propios], codigos, etapa.clasificador.colores_dominantes)
+
+def detector_estrellas(etapa):
+    fuentes = etapa.fuentes
+    propias = etapa.en_nucleo(fuentes["px"], fuentes["py"])
+    xc, yc = fuentes["xc"][propias], fuentes["yc"][propias]
+    x, y = np.rint(xc).astype(np.int64), np.rint(yc).astype(np.int64)
+    return CatalogoPatrones.crear("Estrella", x, y, etapa.colores(x, y, 3), etapa.clasificador.colores_dominantes,
+                                  flujo=fuentes["flujo"][propias], centroide=(xc, yc))
+
+# Consumidores de EtapaDeteccion: clave de opciones -> (título del resumen, tipo de patrón, detector)
+DETECTORES_PATRONES = {
+    "circulos": ("Círculos detectados", "Círculo", detector_circulos),
+    "crateres": ("Cráteres (multiescala)", "Cráter", detector_crateres),
+    "contornos": ("Contornos detectados", "Contorno", detector_contornos),
+    "rectangulos": ("Rectángulos detectados", "Rectángulo", detector_rectangulos),
+    "lineas": ("Líneas detectadas", "Línea", detector_lineas),
+    "estrellas": ("Estrellas detectadas", "Estrella", detector_estrellas),
+}
+
+# Valores por defecto de los umbrales de detección (los que estaban fijos en el código)
+PARAMETROS_DETECCION = {
+    "umbral_binario": 127,
+    "area_min_contorno": 100,
+    "area_min_rectangulo": 500,
+    "hough_param1": 50,
+    "hough_param2": 30,
+    "radio_min": 5,
+    "radio_max": 100,
+    "distancia_circulos": 30,
+    "canny_bajo": 50,
+    "canny_alto": 150,
+    "lineas_votos": 50,
+    "lineas_longitud_min": 30,
+    "lineas_hueco_max": 10,
+    "estrellas_sigma": 5.0,
+}
+
+# Parámetros de los que depende el resultado de cada detector (firma en CacheDeteccion)
+PARAMETROS_DETECTORES = {
+    "circulos": ("hough_param1", "hough_param2", "radio_min", "radio_max", "distancia_circulos"),
+    "crateres": ("hough_param1", "hough_param2", "radio_min", "radio_max", "distancia_circulos"),
+    "contornos": ("umbral_binario", "area_min_contorno"),
+    "rectangulos": ("umbral_binario", "area_min_contorno", "area_min_rectangulo"),
+    "lineas": ("canny_bajo", "canny_alto", "lineas_votos", "lineas_longitud_min", "lineas_hueco_max"),
+    "estrellas": ("estrellas_sigma",),
+}
+
+def escalar_parametros(parametros, factor):
+    """Parámetros equivalentes sobre una imagen reducida `factor` veces (distancias y áreas)"""
+    escalados = dict(parametros)
+    for nombre in ("radio_min", "radio_max", "distancia_circulos", "lineas_longitud_min", "lineas_hueco_max"):
+        escalados[nombre] = max(1, int(round(parametros[nombre] / factor)))
+    for nombre in ("area_min_contorno", "area_min_rectangulo"):
+        escalados[nombre] = parametros[nombre] / factor ** 2
+    return escalados
+
+def resumen_patrones(catalogo, opciones):
+    """Líneas de resumen por tipo, en el mismo formato que la detección en la región visible"""
+    conteos = catalogo.conteos_por_tipo()
+    return [f"{titulo}: {conteos[tipo]}" for clave, (titulo, tipo, _) in DETECTORES_PATRONES.items()
+            if opciones.get(clave)]
+
+def dibujar_patrones(imagen, catalogo, rangos_color, radio=5):
+    """Marca cada patrón con un punto del color de su color dominante"""
+    for codigo in np.unique(catalogo.datos["color"]):
+        nombre = catalogo.colores[codigo]
+        color_bgr = rangos_color.get(nombre, {}).get("color_bgr", (0, 255, 0))
+        puntos = catalogo.datos[catalogo.datos["color"] == codigo]
+        for x, y in zip(puntos["x"], puntos["y"]):
+            cv2.circle(imagen, (int(x), int(y)), radio, color_bgr, -1)
+    return imagen
+
+def detectar_patrones(imagen, clasificador, opciones, parametros=None):
+    """Detección de patrones en una sola pasada sobre `imagen` (BGR); devuelve (CatalogoPatrones, info)
+
+    `opciones` indica qué detectores de DETECTORES_PATRONES ejecutar; todos comparten la misma etapa.
+    `parametros` sustituye valores de PARAMETROS_DETECCION.
+    """
+    catalogos = []
+    info_patrones = []
+    etapa = EtapaDeteccion(imagen, clasificador, parametros=parametros)
+    
+    for clave, (titulo, _, detector) in DETECTORES_PATRONES.items():
+        if not opciones.get(clave):
+            continue
+        try:
+            encontrados = detector(etapa)
+            catalogos.append(encontrados)
+            info_patrones.append(f"{titulo}: {len(encontrados)}")
+        except Exception as e:
+            info_patrones.append(f"Error en {clave}: {str(e)}")
+    
+    return CatalogoPatrones.concatenar(catalogos, clasificador.colores_dominantes), info_patrones
+
 def aplicar_filtros_rapidos(imagen):
     img_original = imagen.copy()
     transformaciones = []
@@ -0,0 +1,120 @@
+"""
+Presupuesto de arranque del NASA Image Explorer
+
+Mide, cada vez en un proceso nuevo:
+- tiempo de `import app` y memoria residente (RSS) justo después
+- tiempo hasta la primera ventana (desde que arranca el proceso hasta que Tk la dibuja)
+- qué dependencias pesadas se importaron sin que ninguna función las pidiera
+
+Uso: python benchmark_arranque.py [repeticiones]
+Sale con código 1 si alguna mediana supera el presupuesto.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PRESUPUESTO = {
+    "import_s": 1.5,
+    "rss_mb": 300,
+    "primera_ventana_s": 3.0,
+}
+
+# Módulos que solo deben cargarse al usar la función que los necesita
+PESADOS = ["torch", "transformers", "matplotlib", "bs4", "requests"]
+
+MEDIR_MEMORIA = """
+def memoria_mb():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024 ** 2
+    except ImportError:
+        pass
+    try:
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss viene en KB en Linux y en bytes en macOS
+        return pico / 1024 ** 2 if sys.platform == "darwin" else pico / 1024
+    except ImportError:
+        return None
+"""
+
+HIJO_IMPORT = MEDIR_MEMORIA + """
+t0 = time.perf_counter()
+import app
+segundos = time.perf_counter() - t0
+print(json.dumps({"import_s": segundos, "rss_mb": memoria_mb(),
+                  "pesados": [m for m in PESADOS if m in sys.modules]}))
+"""
+
+HIJO_VENTANA = """
+import tkinter as tk
+import app
+root = tk.Tk()
+app.NASAImageExplorerPro(root)
+root.update()
+print(json.dumps({"fin": time.time()}))
+root.destroy()
+"""
+
+def ejecutar(codigo):
+    """Ejecuta `codigo` en un intérprete nuevo desde la carpeta del proyecto y devuelve su JSON"""
+    cabecera = f"import json, sys, time\nPESADOS = {PESADOS!r}\n"
+    inicio = time.time()
+    salida = subprocess.run([sys.executable, "-c", cabecera + codigo], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if salida.returncode != 0:
+        raise RuntimeError(salida.stderr.strip().splitlines()[-1] if salida.stderr.strip() else "sin salida")
+    return inicio, json.loads(salida.stdout.strip().splitlines()[-1])
+
+def medir(repeticiones):
+    imports, memorias, ventanas, pesados = [], [], [], set()
+    for _ in range(repeticiones):
+        _, datos = ejecutar(HIJO_IMPORT)
+        imports.append(datos["import_s"])
+        if datos["rss_mb"] is not None:
+            memorias.append(datos["rss_mb"])
+        pesados.update(datos["pesados"])
+
+    try:
+        for _ in range(repeticiones):
+            inicio, datos = ejecutar(HIJO_VENTANA)
+            ventanas.append(datos["fin"] - inicio)
+    except RuntimeError as e:
+        # Sin pantalla (CI, SSH) no hay ventana que medir
+        print(f"⚠️ First window not measured: {e}")
+
+    return {
+        "import_s": statistics.median(imports),
+        "rss_mb": statistics.median(memorias) if memorias else None,
+        "primera_ventana_s": statistics.median(ventanas) if ventanas else None,
+        "pesados": sorted(pesados),
+    }
+
+def main():
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    resultados = medir(repeticiones)
+
+    print(f"\n🚀 STARTUP BUDGET (median of {repeticiones} runs)\n" + "=" * 50)
+    excedido = False
+    for clave, limite in PRESUPUESTO.items():
+        valor = resultados[clave]
+        if valor is None:
+            print(f"⚪ {clave:<20} n/a (budget {limite})")
+            continue
+        dentro = valor <= limite
+        excedido |= not dentro
+        print(f"{'✅' if dentro else '❌'} {clave:<20} {valor:8.2f} (budget {limite})")
+
+    if resultados["pesados"]:
+        excedido = True
+        print(f"❌ Heavy modules imported at startup: {', '.join(resultados['pesados'])}")
+    else:
+        print("✅ No heavy module imported at startup")
+
+    sys.exit(1 if excedido else 0)
+
+if __name__ == "__main__":
+    main()
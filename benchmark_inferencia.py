@@ -0,0 +1,100 @@
+"""
+Comparativa de backends de inferencia IA en CPU
+
+Para cada modelo del pool (descripción BLIP y clasificación ResNet) y cada backend de
+`crear_pipeline` ('pipeline', 'cpu', 'cpu_int8') mide:
+- latencia mediana por imagen (tras una pasada de calentamiento)
+- concordancia con el pipeline float32 actual: misma clase top-1 y diferencia media de
+  puntuación, o misma descripción y solapamiento medio de palabras
+
+Las imágenes son las de img/ más un campo estelar y una superficie simulados.
+Uso: python benchmark_inferencia.py [repeticiones] [backend ...]
+"""
+import glob
+import os
+import statistics
+import sys
+import time
+
+import cv2
+from PIL import Image
+
+from modelos_ia import PoolModelos, configurar_hilos_torch, crear_pipeline
+from config_multiwindow import AI_CONFIG
+from simulacion import campo_estelar, superficie_craterizada
+
+BACKENDS = ["pipeline", "cpu", "cpu_int8"]
+
+def imagenes_prueba():
+    carpeta = os.path.join(os.path.dirname(os.path.abspath(__file__)), "img")
+    imagenes = [Image.open(ruta).convert("RGB") for ruta in sorted(glob.glob(os.path.join(carpeta, "*.png")))]
+    simuladas = [
+        campo_estelar(1024, 768, 800, semilla=1),
+        superficie_craterizada(1024, 768, 60, 5, 40, (90, 90, 90), (60, 60, 60), (160, 160, 160), semilla=2),
+    ]
+    imagenes += [Image.fromarray(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)) for bgr in simuladas]
+    return imagenes
+
+def resumir(tarea, salida):
+    """Lo que se compara entre backends: (clase, puntuación) o el texto generado"""
+    if tarea == "image-classification":
+        return salida[0]["label"], salida[0]["score"]
+    return salida[0]["generated_text"]
+
+def medir(tarea, modelo, backend, imagenes, repeticiones):
+    inicio = time.perf_counter()
+    tuberia = crear_pipeline(tarea, modelo, backend)
+    carga = time.perf_counter() - inicio
+
+    tuberia(imagenes[0])  # Calentamiento
+    tiempos, salidas = [], []
+    for _ in range(repeticiones):
+        salidas = []
+        for imagen in imagenes:
+            t0 = time.perf_counter()
+            salidas.append(resumir(tarea, tuberia(imagen)))
+            tiempos.append(time.perf_counter() - t0)
+    return {"carga_s": carga, "latencia_s": statistics.median(tiempos), "salidas": salidas}
+
+def concordancia(tarea, referencia, salidas):
+    if tarea == "image-classification":
+        iguales = sum(a[0] == b[0] for a, b in zip(referencia, salidas))
+        diferencia = statistics.mean(abs(a[1] - b[1]) for a, b in zip(referencia, salidas))
+        return f"top-1 {iguales}/{len(referencia)}, mean |Δscore| {diferencia:.3f}"
+
+    def palabras(texto):
+        return set(texto.lower().split())
+    iguales = sum(a == b for a, b in zip(referencia, salidas))
+    solape = statistics.mean(len(palabras(a) & palabras(b)) / max(len(palabras(a) | palabras(b)), 1)
+                             for a, b in zip(referencia, salidas))
+    return f"identical {iguales}/{len(referencia)}, word overlap {solape * 100:.0f}%"
+
+def main():
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    # El pipeline actual va siempre primero: es la referencia de concordancia
+    backends = ["pipeline"] + [b for b in (sys.argv[2:] or BACKENDS) if b != "pipeline"]
+
+    configurar_hilos_torch(AI_CONFIG.get("torch_threads", 0), AI_CONFIG.get("interop_threads", 0))
+    imagenes = imagenes_prueba()
+    print(f"\n⚡ CPU INFERENCE BENCHMARK ({len(imagenes)} images x {repeticiones} runs)\n" + "=" * 60)
+
+    for tarea, modelo in PoolModelos.MODELOS.values():
+        print(f"\n🧠 {modelo} ({tarea})")
+        referencia = None
+        for backend in backends:
+            try:
+                datos = medir(tarea, modelo, backend, imagenes, repeticiones)
+            except Exception as e:
+                print(f"  ❌ {backend:<10} {e}")
+                continue
+            if referencia is None:
+                referencia = datos
+                comparacion = "reference"
+            else:
+                comparacion = concordancia(tarea, referencia["salidas"], datos["salidas"])
+            acelerado = referencia["latencia_s"] / datos["latencia_s"]
+            print(f"  {backend:<10} load {datos['carga_s']:6.1f} s  latency {datos['latencia_s'] * 1000:7.1f} ms "
+                  f"(x{acelerado:.2f})  {comparacion}")
+
+if __name__ == "__main__":
+    main()
@@ -29,4 +29,16 @@ PERFORMANCE_CONFIG = {
     'use_tiling': True,      # Usar sistema de tiles para imágenes grandes
     'tile_size': 512,        # Tamaño de tiles
     'cache_size': 10,        # Número de imágenes en caché
-}
\ No newline at end of file
+}
+
+# Configuración de inferencia IA
+AI_CONFIG = {
+    'backend': 'pipeline',   # 'pipeline' (transformers float32), 'cpu' o 'cpu_int8' (cuantización dinámica)
+    'torch_threads': 0,      # Hilos intra-operación de torch (0 = valor por defecto de torch)
+    'interop_threads': 0,    # Hilos inter-operación de torch (0 = valor por defecto de torch)
+    'model_revision': 'main',  # Revisión de los modelos en el Hub (fijar un commit para resultados estables)
+    'inference_cache': True,   # Guardar en disco las salidas de los modelos por huella de imagen
+    'cache_path': None,        # Ruta de la caché (None = ~/.nasa_image_explorer/cache_ia.sqlite3)
+    'model_server': None,      # "host:puerto" de servidor_modelos.py (None = modelos en el proceso de la interfaz)
+    'model_server_key_file': None,  # Clave del servidor (None = ~/.nasa_image_explorer/servidor_modelos.key, se crea sola)
+}
@@ -0,0 +1,303 @@
+"""
+Modelos de IA del NASA Image Explorer, sin interfaz
+
+Creación de los pipelines de transformers (con el backend de AI_CONFIG), el pool de modelos
+compartido por las ventanas de un proceso y la caché en disco de sus salidas. Lo importan
+app.py, servidor_modelos.py y los scripts por lotes; torch y transformers solo se importan
+al crear el primer pipeline.
+"""
+import gc
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from config_multiwindow import AI_CONFIG
+
+class InferenciaCPU:
+    """Envuelve un pipeline de transformers para ejecutarlo en CPU dentro de torch.inference_mode"""
+
+    def __init__(self, tuberia, backend):
+        self.tuberia = tuberia
+        self.backend = backend
+
+    def __call__(self, *args, **kwargs):
+        import torch
+        with torch.inference_mode():
+            return self.tuberia(*args, **kwargs)
+
+    @property
+    def model(self):
+        return self.tuberia.model
+
+_hilos_torch_configurados = False
+
+def configurar_hilos_torch(hilos=0, hilos_interop=0):
+    """Fija los hilos de torch una sola vez por proceso (0 deja el valor por defecto)"""
+    global _hilos_torch_configurados
+    if _hilos_torch_configurados:
+        return
+    import torch
+    if hilos:
+        torch.set_num_threads(hilos)
+    if hilos_interop:
+        try:
+            torch.set_num_interop_threads(hilos_interop)
+        except RuntimeError:
+            # Solo se puede fijar antes del primer trabajo paralelo de torch
+            pass
+    _hilos_torch_configurados = True
+
+def crear_pipeline(tarea, modelo, backend=None):
+    """Pipeline de transformers; torch y transformers se importan aquí y no al abrir la aplicación
+
+    backend (por defecto AI_CONFIG['backend']):
+    - 'pipeline': el pipeline float32 tal cual
+    - 'cpu': en CPU, con los hilos de AI_CONFIG y torch.inference_mode
+    - 'cpu_int8': como 'cpu', con las capas Linear cuantizadas dinámicamente a int8
+    """
+    from transformers import pipeline
+    backend = backend or AI_CONFIG.get('backend', 'pipeline')
+    revision = AI_CONFIG.get('model_revision', 'main')
+    if backend == 'pipeline':
+        return pipeline(tarea, model=modelo, revision=revision)
+    if backend not in ('cpu', 'cpu_int8'):
+        raise ValueError(f"Backend de inferencia desconocido: {backend}")
+
+    import torch
+    configurar_hilos_torch(AI_CONFIG.get('torch_threads', 0), AI_CONFIG.get('interop_threads', 0))
+    tuberia = pipeline(tarea, model=modelo, revision=revision, device=-1)
+    tuberia.model.eval()
+    if backend == 'cpu_int8':
+        tuberia.model = torch.ao.quantization.quantize_dynamic(tuberia.model, {torch.nn.Linear}, dtype=torch.qint8)
+    return InferenciaCPU(tuberia, backend)
+
+class PoolModelos:
+    """Modelos de IA compartidos por todas las ventanas del proceso
+
+    Cada modelo se carga una sola vez y al primer uso, no al abrir la ventana. Las ventanas se
+    registran con adquirir/liberar: al cerrarse la última se descargan todos. Un modelo que nadie
+    usa durante `segundos_inactivo` también se descarga y se vuelve a cargar si hace falta; uno
+    que no se pudo cargar se reintenta pasados `segundos_reintento` o tras descargar().
+    Las cargas, descargas y errores se avisan con `aviso(mensaje)` a cada usuario registrado,
+    desde el hilo que los produce.
+    """
+
+    MODELOS = {
+        "descripcion": ("image-to-text", "Salesforce/blip-image-captioning-large"),
+        "clasificacion": ("image-classification", "microsoft/resnet-50"),
+    }
+    FABRICAS = {nombre: (lambda tarea=tarea, modelo=modelo: crear_pipeline(tarea, modelo))
+                for nombre, (tarea, modelo) in MODELOS.items()}
+
+    def __init__(self, segundos_inactivo=600, intervalo_revision=30, segundos_reintento=60):
+        self.segundos_inactivo = segundos_inactivo
+        self.intervalo_revision = intervalo_revision
+        self.segundos_reintento = segundos_reintento
+        self.modelos = {}
+        self.errores = {}
+        self.avisos = []
+        self.en_uso = {}
+        self.ultimo_uso = {}
+        self.usuarios = 0
+        self.cargas = {nombre: threading.Lock() for nombre in self.FABRICAS}
+        # Un mismo pipeline no admite llamadas simultáneas (el tokenizador no es reentrante)
+        self.llamadas = {nombre: threading.Lock() for nombre in self.FABRICAS}
+        self.revisor = None
+        self.lock = threading.Lock()
+
+    def firma(self, nombre):
+        """Identifica las salidas de un modelo: id, revisión y backend con que se carga"""
+        return (f"{self.MODELOS[nombre][1]}@{AI_CONFIG.get('model_revision', 'main')}"
+                f"/{AI_CONFIG.get('backend', 'pipeline')}")
+
+    def adquirir(self, aviso=None):
+        with self.lock:
+            self.usuarios += 1
+            if aviso is not None:
+                self.avisos.append(aviso)
+
+    def liberar(self, aviso=None):
+        with self.lock:
+            self.usuarios = max(0, self.usuarios - 1)
+            if aviso in self.avisos:
+                self.avisos.remove(aviso)
+            if self.usuarios:
+                return
+        for nombre in list(self.modelos):
+            self.descargar(nombre)
+
+    def _avisar(self, mensaje):
+        with self.lock:
+            avisos = list(self.avisos)
+        for aviso in avisos:
+            aviso(mensaje)
+
+    def _fallo_reciente(self, nombre):
+        return nombre in self.errores and time.monotonic() - self.errores[nombre][1] < self.segundos_reintento
+
+    def cargado(self, nombre):
+        return nombre in self.modelos
+
+    def obtener(self, nombre):
+        """El modelo, cargándolo si hace falta; None si no se pudo cargar"""
+        with self.lock:
+            if nombre in self.modelos:
+                self.ultimo_uso[nombre] = time.monotonic()
+                return self.modelos[nombre]
+            if self._fallo_reciente(nombre):
+                return None
+        # Un cerrojo por modelo: dos ventanas no cargan el mismo y una carga no frena al resto
+        with self.cargas[nombre]:
+            with self.lock:
+                pendiente = nombre not in self.modelos and not self._fallo_reciente(nombre)
+            if pendiente:
+                try:
+                    modelo = self.FABRICAS[nombre]()
+                except Exception as e:
+                    # Puede ser pasajero (p. ej. la red en la primera descarga): se reintenta más tarde
+                    with self.lock:
+                        self.errores[nombre] = (e, time.monotonic())
+                    self._avisar(f"❌ Error cargando modelo {nombre}: {e}")
+                    return None
+                with self.lock:
+                    self.errores.pop(nombre, None)
+                    self.modelos[nombre] = modelo
+                    self.ultimo_uso[nombre] = time.monotonic()
+                self._avisar(f"✅ Modelo IA cargado: {nombre}")
+                self._iniciar_revisor()
+        with self.lock:
+            return self.modelos.get(nombre)
+
+    @contextmanager
+    def usar(self, nombre):
+        """Presta el modelo (o None) y evita que se descargue mientras se usa"""
+        with self.lock:
+            self.en_uso[nombre] = self.en_uso.get(nombre, 0) + 1
+        try:
+            yield self.obtener(nombre)
+        finally:
+            with self.lock:
+                self.en_uso[nombre] -= 1
+                self.ultimo_uso[nombre] = time.monotonic()
+
+    def descargar(self, nombre):
+        with self.lock:
+            # Descargar también olvida un fallo de carga: el siguiente uso lo vuelve a intentar
+            self.errores.pop(nombre, None)
+            if self.en_uso.get(nombre, 0) or nombre not in self.modelos:
+                return
+            del self.modelos[nombre]
+        gc.collect()
+        # torch solo está importado si algún modelo llegó a cargarse
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        self._avisar(f"♻️ Modelo IA descargado: {nombre}")
+
+    def descargar_inactivos(self):
+        ahora = time.monotonic()
+        with self.lock:
+            inactivos = [nombre for nombre in self.modelos
+                         if not self.en_uso.get(nombre, 0) and ahora - self.ultimo_uso[nombre] > self.segundos_inactivo]
+        for nombre in inactivos:
+            self.descargar(nombre)
+
+    def _iniciar_revisor(self):
+        with self.lock:
+            if self.revisor is not None and self.revisor.is_alive():
+                return
+            self.revisor = threading.Thread(target=self._revisar, daemon=True)
+            self.revisor.start()
+
+    def _revisar(self):
+        while True:
+            time.sleep(self.intervalo_revision)
+            self.descargar_inactivos()
+            with self.lock:
+                if not self.modelos:
+                    self.revisor = None
+                    return
+
+POOL_MODELOS = PoolModelos()
+
+def huella_imagen(imagen):
+    """Hash del contenido de una imagen PIL o array: mismos píxeles, misma huella, venga del formato que venga"""
+    pixeles = np.ascontiguousarray(np.asarray(imagen))
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{pixeles.shape}{pixeles.dtype}".encode())
+    h.update(pixeles.data)
+    return h.hexdigest()
+
+class CacheInferencia:
+    """Salidas de los modelos en disco (SQLite), por huella de imagen o tesela y firma del modelo
+
+    La firma junta id del modelo, revisión y backend de AI_CONFIG, así que cambiar cualquiera
+    invalida sus entradas. La comparten las ventanas del proceso y las sesiones siguientes;
+    pasadas `max_entradas` se borran las menos usadas.
+    """
+
+    def __init__(self, ruta=None, max_entradas=200000):
+        self.ruta = ruta or AI_CONFIG.get('cache_path') or os.path.join(
+            os.path.expanduser("~"), ".nasa_image_explorer", "cache_ia.sqlite3")
+        self.max_entradas = max_entradas
+        self.conexion = None
+        self.escrituras = 0
+        self.lock = threading.Lock()
+
+    def _conectar(self):
+        if self.conexion is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+            self.conexion = sqlite3.connect(self.ruta, timeout=10, check_same_thread=False)
+            self.conexion.execute("""CREATE TABLE IF NOT EXISTS salidas (
+                huella TEXT, firma TEXT, salida TEXT, usado REAL, PRIMARY KEY (huella, firma))""")
+        return self.conexion
+
+    def obtener(self, huellas, firma):
+        """{huella: salida} de las que ya están en la caché"""
+        if not huellas:
+            return {}
+        with self.lock:
+            conexion = self._conectar()
+            encontradas = {}
+            unicas = list(dict.fromkeys(huellas))
+            for i in range(0, len(unicas), 500):
+                grupo = unicas[i:i + 500]
+                filas = conexion.execute(
+                    f"SELECT huella, salida FROM salidas WHERE firma = ? AND huella IN ({','.join('?' * len(grupo))})",
+                    [firma, *grupo])
+                encontradas.update((huella, json.loads(salida)) for huella, salida in filas)
+            if encontradas:
+                conexion.executemany("UPDATE salidas SET usado = ? WHERE huella = ? AND firma = ?",
+                                     [(time.time(), huella, firma) for huella in encontradas])
+                conexion.commit()
+            return encontradas
+
+    def guardar(self, salidas, firma):
+        """Guarda {huella: salida} (salidas serializables a JSON)"""
+        if not salidas:
+            return
+        with self.lock:
+            conexion = self._conectar()
+            conexion.executemany("INSERT OR REPLACE INTO salidas VALUES (?, ?, ?, ?)",
+                                 [(huella, firma, json.dumps(salida, default=float), time.time())
+                                  for huella, salida in salidas.items()])
+            self.escrituras += len(salidas)
+            if self.escrituras >= 1000:
+                self.escrituras = 0
+                conexion.execute("""DELETE FROM salidas WHERE rowid IN (
+                    SELECT rowid FROM salidas ORDER BY usado DESC LIMIT -1 OFFSET ?)""", (self.max_entradas,))
+            conexion.commit()
+
+    def limpiar(self):
+        with self.lock:
+            self._conectar().execute("DELETE FROM salidas")
+            self.conexion.commit()
+
+CACHE_INFERENCIA = CacheInferencia()
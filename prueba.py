@@ -1,17 +1,16 @@
 # nasa_explorer.py
 import cv2
 import numpy as np
+from simulacion import (salpicar_psf, campo_estelar, superficie_craterizada,
+                        CampoEstelarProcedural, SuperficieProcedural)
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog, scrolledtext
 from PIL import Image, ImageTk, ImageDraw
 import json
 import os
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import threading
 import time
 import math
-import requests
 from io import BytesIO
 from datetime import datetime
 import warnings
@@ -38,6 +37,8 @@ class NASADataFetcher:
             if date:
                 params['date'] = date
             
+            import requests
+            
             response = requests.get(self.apis["earth"], params=params, timeout=30)
             if response.status_code == 200:
                 return Image.open(BytesIO(response.content))
@@ -46,34 +47,217 @@ class NASADataFetcher:
             print(f"Error fetching Earth imagery: {e}")
             return None
 
+def a_bgr(pixeles, rgb=True):
+    """Normaliza gris, RGB(A) o BGR(A) de 8 bits a BGR de 3 canales"""
+    if pixeles.ndim == 2 or pixeles.shape[2] == 1:
+        return cv2.cvtColor(pixeles, cv2.COLOR_GRAY2BGR)
+    if pixeles.shape[2] == 4:
+        return cv2.cvtColor(pixeles, cv2.COLOR_RGBA2BGR if rgb else cv2.COLOR_BGRA2BGR)
+    return cv2.cvtColor(pixeles, cv2.COLOR_RGB2BGR) if rgb else np.ascontiguousarray(pixeles)
+
+class CargadorArray:
+    """Sirve regiones de un array en memoria o mapeado a disco (np.memmap, .npy con mmap_mode)
+
+    Los niveles de una imagen en memoria se reducen por área y se guardan al pedirlos; los de
+    un memmap se muestrean con paso 2**nivel para no recorrer el archivo entero.
+    """
+
+    def __init__(self, imagen, rgb=False, tile_size=256):
+        self.imagen = imagen
+        self.rgb = rgb
+        self.alto, self.ancho = imagen.shape[:2]
+        self.niveles = max(1, math.ceil(math.log2(max(self.ancho, self.alto) / tile_size)) + 1)
+        self.piramide = None if isinstance(imagen, np.memmap) else [imagen]
+        self.lock = threading.Lock()
+
+    def tamano(self, nivel):
+        escala = 1 << nivel
+        return -(-self.ancho // escala), -(-self.alto // escala)
+
+    def _nivel(self, nivel):
+        with self.lock:
+            while len(self.piramide) <= nivel:
+                anterior = self.piramide[-1]
+                ancho, alto = self.tamano(len(self.piramide))
+                self.piramide.append(cv2.resize(anterior, (ancho, alto), interpolation=cv2.INTER_AREA))
+            return self.piramide[nivel]
+
+    def region(self, x, y, ancho, alto, nivel=0):
+        if self.piramide is None:
+            paso = 1 << nivel
+            pixeles = self.imagen[y * paso:(y + alto) * paso:paso, x * paso:(x + ancho) * paso:paso]
+        else:
+            pixeles = self._nivel(nivel)[y:y + alto, x:x + ancho]
+        return a_bgr(pixeles, self.rgb)
+
+class CargadorTIFFTeselado:
+    """Sirve regiones de un TIFF teselado de 8 bits decodificando solo las teselas del archivo que tocan
+
+    Si el archivo trae pirámide (SubIFDs) se usa el nivel guardado más cercano por debajo y el
+    resto se muestrea con paso, así la memoria no depende del tamaño del archivo.
+    """
+
+    def __init__(self, ruta, tile_size=256):
+        import tifffile
+
+        self.archivo = tifffile.TiffFile(ruta)
+        serie = self.archivo.series[0]
+        pagina = serie.levels[0].pages[0]
+        if not pagina.is_tiled or pagina.planarconfig != 1 or pagina.dtype != np.uint8:
+            self.archivo.close()
+            raise ValueError("Only tiled, interleaved 8-bit TIFF files can be streamed")
+        self.alto, self.ancho = pagina.imagelength, pagina.imagewidth
+        self.niveles = max(1, math.ceil(math.log2(max(self.ancho, self.alto) / tile_size)) + 1)
+
+        # Niveles guardados en el archivo cuyo factor de reducción es una potencia de 2
+        self.paginas = {}
+        for nivel in serie.levels:
+            pagina = nivel.pages[0]
+            factor = self.ancho / pagina.imagewidth
+            potencia = round(math.log2(factor))
+            if pagina.is_tiled and abs(factor - (1 << potencia)) < 1e-6 * factor:
+                self.paginas.setdefault(potencia, pagina)
+        self.lock = threading.Lock()
+
+    def tamano(self, nivel):
+        escala = 1 << nivel
+        return -(-self.ancho // escala), -(-self.alto // escala)
+
+    def region(self, x, y, ancho, alto, nivel=0):
+        ancho_nivel, alto_nivel = self.tamano(nivel)
+        ancho = max(0, min(ancho, ancho_nivel - x))
+        alto = max(0, min(alto, alto_nivel - y))
+        guardado = max(p for p in self.paginas if p <= nivel)
+        pagina = self.paginas[guardado]
+        paso = 1 << (nivel - guardado)
+        muestras = pagina.samplesperpixel
+        salida = np.zeros((alto, ancho, muestras), dtype=np.uint8)
+        if salida.size == 0:
+            return a_bgr(salida)
+
+        # Filas y columnas de la página que caen en la región: (y + i) * paso, (x + j) * paso
+        alto_t, ancho_t = pagina.tilelength, pagina.tilewidth
+        por_fila = -(-pagina.imagewidth // ancho_t)
+        y0, y1 = y * paso, min((y + alto - 1) * paso + 1, pagina.imagelength)
+        x0, x1 = x * paso, min((x + ancho - 1) * paso + 1, pagina.imagewidth)
+        for fila in range(y0 // alto_t, (y1 - 1) // alto_t + 1):
+            for columna in range(x0 // ancho_t, (x1 - 1) // ancho_t + 1):
+                indice = fila * por_fila + columna
+                with self.lock:
+                    self.archivo.filehandle.seek(pagina.dataoffsets[indice])
+                    datos = self.archivo.filehandle.read(pagina.databytecounts[indice])
+                segmento = pagina.decode(datos, indice, jpegtables=pagina.jpegtables)[0]
+                segmento = segmento.reshape(alto_t, ancho_t, muestras)
+                # Primera fila/columna de la tesela que es múltiplo de paso dentro de la región
+                ty, tx = fila * alto_t, columna * ancho_t
+                fy = max(y0, -(-ty // paso) * paso)
+                fx = max(x0, -(-tx // paso) * paso)
+                filas = segmento[fy - ty:min(y1, ty + alto_t) - ty:paso]
+                bloque = filas[:, fx - tx:min(x1, tx + ancho_t) - tx:paso]
+                oy, ox = fy // paso - y, fx // paso - x
+                salida[oy:oy + bloque.shape[0], ox:ox + bloque.shape[1]] = bloque
+        return a_bgr(salida)
+
+    def cerrar(self):
+        self.archivo.close()
+
 class GigapixelImageHandler:
-    def __init__(self):
+    """Proveedor de teselas (nivel, tx, ty) con caché LRU limitada en bytes
+
+    Las teselas se leen a través de un cargador: cualquier objeto con `ancho`, `alto`,
+    `niveles`, `tamano(nivel)` y `region(x, y, ancho, alto, nivel)`, que devuelve BGR uint8 en
+    coordenadas del nivel (escala 1 / 2**nivel). Sirven CargadorArray, CargadorTIFFTeselado y
+    las fuentes procedurales de simulacion.
+    """
+
+    def __init__(self, tile_size=256, max_cache_bytes=256 * 1024 ** 2):
+        self.tile_size = tile_size
         self.tile_cache = {}
-        self.max_cache_size = 100
+        self.max_cache_bytes = max_cache_bytes
+        self.cache_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.loader = None
+        self.lock = threading.Lock()
+
+    def set_loader(self, loader):
+        """Cambia el origen de las teselas; la caché del anterior ya no sirve"""
+        with self.lock:
+            if self.loader is not None and hasattr(self.loader, "cerrar"):
+                self.loader.cerrar()
+            self.loader = loader
+        self.clear_cache()
+
+    def get_tile(self, level, tx, ty):
+        """Tesela (tx, ty) del nivel, de solo lectura; se carga y se guarda si no está en caché"""
+        clave = (level, tx, ty)
+        with self.lock:
+            tesela = self.tile_cache.pop(clave, None)
+            if tesela is not None:
+                self.tile_cache[clave] = tesela
+                self.hits += 1
+                return tesela
+            self.misses += 1
+            loader = self.loader
+
+        # La carga va fuera del cerrojo para no bloquear a quien lee teselas ya cacheadas
+        tesela = loader.region(tx * self.tile_size, ty * self.tile_size, self.tile_size, self.tile_size, level)
+        tesela.flags.writeable = False
+        with self.lock:
+            if loader is self.loader and clave not in self.tile_cache:
+                self.tile_cache[clave] = tesela
+                self.cache_bytes += tesela.nbytes
+                while self.cache_bytes > self.max_cache_bytes and len(self.tile_cache) > 1:
+                    antigua = self.tile_cache.pop(next(iter(self.tile_cache)))
+                    self.cache_bytes -= antigua.nbytes
+        return tesela
+
+    def overview(self, max_side=1024):
+        """Nivel completo más grande cuyo lado mayor no pasa de max_side (sin pasar por la caché)"""
+        nivel = next(n for n in range(64) if max(self.loader.tamano(n)) <= max_side)
+        return self.loader.region(0, 0, *self.loader.tamano(nivel), nivel)
+
+    def cache_stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "tiles": len(self.tile_cache),
+                "bytes": self.cache_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def clear_cache(self):
+        with self.lock:
+            self.tile_cache.clear()
+            self.cache_bytes = 0
+            self.hits = 0
+            self.misses = 0
         
     def create_simulated_gigapixel(self, width=10000, height=5000):
         """Crea una imagen simulada de alta resolución para demostración"""
         image = np.zeros((height, width, 3), dtype=np.uint8)
         
-        # Añadir estrellas
-        np.random.seed(42)
+        # Añadir estrellas: solo las de tamaño > 1 son visibles, con brillo proporcional al tamaño
+        rng = np.random.default_rng(42)
         n_stars = 50000
-        star_positions = np.random.randint(0, [width, height], (n_stars, 2))
-        star_sizes = np.random.exponential(0.5, n_stars) + 0.1
-        
-        for (x, y), size in zip(star_positions, star_sizes):
-            if size > 1:
-                brightness = min(255, int(size * 80))
-                cv2.circle(image, (x, y), int(size), (brightness, brightness, brightness), -1)
+        xs = rng.uniform(0, width, n_stars)
+        ys = rng.uniform(0, height, n_stars)
+        star_sizes = rng.exponential(0.5, n_stars) + 0.1
+        visibles = star_sizes > 1
+        salpicar_psf(image, xs[visibles], ys[visibles],
+                     np.minimum(255, star_sizes[visibles] * 80), star_sizes[visibles] / 2)
         
         # Añadir galaxia espiral simulada
         center_x, center_y = width // 2, height // 2
-        for angle in np.linspace(0, 2*np.pi, 1000):
-            radius = 800 + 500 * np.sin(angle * 5)
-            x = int(center_x + radius * np.cos(angle))
-            y = int(center_y + radius * np.sin(angle) * 0.3)
-            if 0 <= x < width and 0 <= y < height:
-                cv2.circle(image, (x, y), 2, (200, 150, 100), -1)
+        angles = np.linspace(0, 2*np.pi, 1000)
+        radius = 800 + 500 * np.sin(angles * 5)
+        xs = (center_x + radius * np.cos(angles)).astype(int)
+        ys = (center_y + radius * np.sin(angles) * 0.3).astype(int)
+        dentro = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        for x, y in zip(xs[dentro].tolist(), ys[dentro].tolist()):
+            cv2.circle(image, (x, y), 2, (200, 150, 100), -1)
         
         return image
 
@@ -189,6 +373,13 @@ class NASAImageExplorerPro:
         self.cv_image = None
         self.current_filtered_image = None
         
+        # Imagen virtual generada por teselas (datasets gigapíxel simulados)
+        self.fuente_virtual = None
+        self.tile_size = 256
+        self.fotos_teselas = []
+        self.vista_virtual = None
+        self.teselas_pendientes = False
+        
         # Sistemas de filtros y capas
         self.transformaciones = {}
         self.active_filters = []
@@ -205,7 +396,7 @@ class NASAImageExplorerPro:
         
         # Sistemas NASA
         self.nasa_fetcher = NASADataFetcher()
-        self.gigapixel_handler = GigapixelImageHandler()
+        self.gigapixel_handler = GigapixelImageHandler(self.tile_size)
         self.collab_annotations = CollaborativeAnnotationSystem()
         self.temporal_analyzer = TemporalAnalysis()
         self.museum_mode = MuseumMode(self)
@@ -220,7 +411,7 @@ class NASAImageExplorerPro:
             "Hubble_Andromeda": {
                 "description": "Hubble Andromeda Galaxy 2.5 Gigapixels Simulation",
                 "type": "stellar",
-                "simulated_size": (10000, 5000),
+                "simulated_size": (70000, 35000),
             },
             "MRO_Mars_Global": {
                 "description": "Mars Reconnaissance Orbiter Global Map Simulation", 
@@ -358,8 +549,8 @@ class NASAImageExplorerPro:
         
         self.canvas = tk.Canvas(canvas_container, 
                                bg="black",
-                               yscrollcommand=self.v_scrollbar.set,
-                               xscrollcommand=self.h_scrollbar.set,
+                               yscrollcommand=lambda *vista: self.on_canvas_scroll(self.v_scrollbar, *vista),
+                               xscrollcommand=lambda *vista: self.on_canvas_scroll(self.h_scrollbar, *vista),
                                cursor="crosshair")
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
@@ -411,6 +602,7 @@ class NASAImageExplorerPro:
         self.canvas.bind("<ButtonRelease-1>", self.on_button_release)
         self.canvas.bind("<Motion>", self.on_mouse_move)
         self.canvas.bind("<Double-Button-1>", self.on_double_click)
+        self.canvas.bind("<Configure>", lambda e: self.programar_teselas_virtuales())
         
         # Atajos de teclado
         self.root.bind("<Control-o>", lambda e: self.load_image())
@@ -444,45 +636,28 @@ class NASAImageExplorerPro:
     def load_simulated_nasa_dataset(self, dataset_name):
         if dataset_name in self.nasa_datasets:
             dataset = self.nasa_datasets[dataset_name]
+            width, height = dataset["simulated_size"]
             
+            # Se generan a su tamaño real, tesela a tesela, sin materializar la imagen
             if dataset_name == "Hubble_Andromeda":
-                image_array = self.gigapixel_handler.create_simulated_gigapixel(5000, 2500)
+                fuente = CampoEstelarProcedural(width, height)
             elif dataset_name == "MRO_Mars_Global":
-                image_array = self.create_simulated_mars_surface(4000, 2000)
+                fuente = SuperficieProcedural(width, height, fondo=(120, 60, 20), relleno=(100, 50, 15),
+                                              borde=(140, 70, 25), grosor=2)
             else:  # LRO_Lunar_Mosaic
-                image_array = self.create_simulated_lunar_surface(6000, 3000)
+                fuente = SuperficieProcedural(width, height, fondo=(100, 100, 100), relleno=(80, 80, 80),
+                                              borde=(150, 150, 150))
             
-            image = Image.fromarray(cv2.cvtColor(image_array, cv2.COLOR_BGR2RGB))
-            self.set_image(image)
-            self.mostrar_estado(f"✅ Loaded {dataset_name}")
+            self.set_virtual_image(fuente)
+            self.mostrar_estado(f"✅ Loaded {dataset_name} ({width}x{height}, virtual)")
 
     def create_simulated_mars_surface(self, width, height):
-        image = np.zeros((height, width, 3), dtype=np.uint8)
-        image[:, :] = (120, 60, 20)  # Color marciano
-        
-        np.random.seed(42)
-        for _ in range(100):
-            x = np.random.randint(0, width)
-            y = np.random.randint(0, height)
-            radius = np.random.randint(10, 50)
-            cv2.circle(image, (x, y), radius, (100, 50, 15), -1)
-            cv2.circle(image, (x, y), radius, (140, 70, 25), 2)
-        
-        return image
+        return superficie_craterizada(width, height, 100, 10, 50, fondo=(120, 60, 20),
+                                      relleno=(100, 50, 15), borde=(140, 70, 25), grosor=2)
 
     def create_simulated_lunar_surface(self, width, height):
-        image = np.zeros((height, width, 3), dtype=np.uint8)
-        image[:, :] = (100, 100, 100)  # Color lunar
-        
-        np.random.seed(42)
-        for _ in range(200):
-            x = np.random.randint(0, width)
-            y = np.random.randint(0, height)
-            radius = np.random.randint(5, 30)
-            cv2.circle(image, (x, y), radius, (80, 80, 80), -1)
-            cv2.circle(image, (x, y), radius, (150, 150, 150), 1)
-        
-        return image
+        return superficie_craterizada(width, height, 200, 5, 30, fondo=(100, 100, 100),
+                                      relleno=(80, 80, 80), borde=(150, 150, 150))
 
     def load_simulated_image(self, mission):
         width, height = 800, 800
@@ -499,18 +674,8 @@ class NASAImageExplorerPro:
         self.set_image(image)
 
     def create_simulated_starfield(self, width, height):
-        image = Image.new('RGB', (width, height), color='black')
-        draw = ImageDraw.Draw(image)
-        
-        np.random.seed(42)
-        for _ in range(100):
-            x = np.random.randint(0, width)
-            y = np.random.randint(0, height)
-            size = np.random.exponential(1) + 0.5
-            color = (255, 255, 255)
-            draw.ellipse([x-size, y-size, x+size, y+size], fill=color)
-            
-        return image
+        image = campo_estelar(width, height, 100, colores=((255, 255, 255),))
+        return Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
 
     def create_simulated_earth_view(self, width, height):
         image = Image.new('RGB', (width, height), color=(0, 0, 50))
@@ -534,18 +699,36 @@ class NASAImageExplorerPro:
     def load_image(self):
         file_path = filedialog.askopenfilename(
             title="Select Image",
-            filetypes=[("Image files", "*.jpg *.jpeg *.png *.tiff *.tif *.bmp")]
+            filetypes=[("Image files", "*.jpg *.jpeg *.png *.tiff *.tif *.bmp *.npy")]
         )
         
         if file_path:
             try:
-                image = Image.open(file_path)
-                self.set_image(image)
+                cargador = self.cargador_virtual(file_path)
+                if cargador is not None:
+                    self.set_virtual_image(cargador)
+                else:
+                    image = Image.open(file_path)
+                    self.set_image(image)
                 self.mostrar_estado(f"Loaded: {os.path.basename(file_path)}")
             except Exception as e:
                 messagebox.showerror("Error", f"Could not load image: {str(e)}")
 
+    def cargador_virtual(self, file_path):
+        """Cargador de teselas para archivos que no conviene leer enteros (.npy mapeado, TIFF teselado)"""
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension == ".npy":
+            return CargadorArray(np.load(file_path, mmap_mode="r"), tile_size=self.tile_size)
+        if extension in (".tif", ".tiff"):
+            try:
+                return CargadorTIFFTeselado(file_path, self.tile_size)
+            except (ImportError, ValueError):
+                return None
+        return None
+
     def set_image(self, image):
+        self.fuente_virtual = None
+        self.gigapixel_handler.set_loader(None)
         self.original_image = image
         self.original_size = image.size
         self.scale = 1.0
@@ -559,9 +742,111 @@ class NASAImageExplorerPro:
         self.center_image()
         self.clear_all_filters()
 
+    def set_virtual_image(self, fuente):
+        """Muestra una imagen virtual servida por teselas; filtros y análisis trabajan sobre su vista general"""
+        self.gigapixel_handler.set_loader(fuente)
+        vista_general = self.gigapixel_handler.overview(1024)
+        
+        self.fuente_virtual = fuente
+        self.original_image = Image.fromarray(cv2.cvtColor(vista_general, cv2.COLOR_BGR2RGB))
+        self.original_size = (fuente.ancho, fuente.alto)
+        self.cv_image = vista_general
+        self.current_filtered_image = vista_general.copy()
+        self.canvas_image = None
+        self.vista_virtual = None
+        
+        canvas_width = max(self.canvas.winfo_width(), 800)
+        canvas_height = max(self.canvas.winfo_height(), 600)
+        self.scale = max(0.01, min(canvas_width / fuente.ancho, canvas_height / fuente.alto, 1.0))
+        self.canvas.delete("all")
+        self.zoom_slider.set(self.scale * 100)
+        
+        self.generar_todos_filtros_automatico()
+        self.display_current_image()
+        self.clear_all_filters()
+
+    def on_canvas_scroll(self, scrollbar, *vista):
+        scrollbar.set(*vista)
+        self.programar_teselas_virtuales()
+
+    def programar_teselas_virtuales(self):
+        """Agrupa los desplazamientos y redibuja las teselas una vez cuando la interfaz quede libre"""
+        if self.fuente_virtual is not None and not self.teselas_pendientes:
+            self.teselas_pendientes = True
+            self.root.after_idle(self.display_virtual_tiles)
+
+    def display_virtual_tiles(self):
+        """Pinta solo la parte visible, desde el nivel de la pirámide más cercano al zoom actual"""
+        self.teselas_pendientes = False
+        fuente = self.fuente_virtual
+        if fuente is None:
+            return
+        
+        canvas_width = self.canvas.winfo_width()
+        canvas_height = self.canvas.winfo_height()
+        ancho_total = int(fuente.ancho * self.scale)
+        alto_total = int(fuente.alto * self.scale)
+        
+        # Al cambiar el zoom se conserva el centro de la vista
+        if self.vista_virtual is not None and self.vista_virtual[0] != self.scale:
+            factor = self.scale / self.vista_virtual[0]
+            centro_x = (self.canvas.canvasx(0) + canvas_width / 2) * factor
+            centro_y = (self.canvas.canvasy(0) + canvas_height / 2) * factor
+            self.canvas.config(scrollregion=(0, 0, ancho_total, alto_total))
+            self.canvas.xview_moveto((centro_x - canvas_width / 2) / max(ancho_total, 1))
+            self.canvas.yview_moveto((centro_y - canvas_height / 2) / max(alto_total, 1))
+        elif self.vista_virtual is None:
+            self.canvas.config(scrollregion=(0, 0, ancho_total, alto_total))
+        
+        x1 = max(0, self.canvas.canvasx(0))
+        y1 = max(0, self.canvas.canvasy(0))
+        x2 = min(ancho_total, x1 + canvas_width)
+        y2 = min(alto_total, y1 + canvas_height)
+        vista = (self.scale, x1, y1, x2, y2)
+        if vista == self.vista_virtual:
+            return
+        self.vista_virtual = vista
+        
+        nivel = min(fuente.niveles - 1, max(0, math.floor(math.log2(1 / self.scale)))) if self.scale < 1 else 0
+        escala = self.scale * (1 << nivel)  # píxeles de pantalla por píxel del nivel
+        ancho_nivel, alto_nivel = fuente.tamano(nivel)
+        nx1, ny1 = int(x1 / escala), int(y1 / escala)
+        nx2 = min(ancho_nivel, math.ceil(x2 / escala))
+        ny2 = min(alto_nivel, math.ceil(y2 / escala))
+        
+        self.canvas.delete("tesela_virtual")
+        self.fotos_teselas = []
+        interpolacion = cv2.INTER_AREA if escala < 1 else cv2.INTER_NEAREST
+        for ty in range(ny1 // self.tile_size * self.tile_size, ny2, self.tile_size):
+            for tx in range(nx1 // self.tile_size * self.tile_size, nx2, self.tile_size):
+                tesela = self.gigapixel_handler.get_tile(nivel, tx // self.tile_size, ty // self.tile_size)
+                # Solo la parte visible de la tesela se escala a pantalla
+                ax1, ay1 = max(tx, nx1), max(ty, ny1)
+                ax2, ay2 = min(tx + tesela.shape[1], nx2), min(ty + tesela.shape[0], ny2)
+                sx1, sy1 = round(ax1 * escala), round(ay1 * escala)
+                sx2, sy2 = round(ax2 * escala), round(ay2 * escala)
+                if sx2 <= sx1 or sy2 <= sy1:
+                    continue
+                recorte = tesela[ay1 - ty:ay2 - ty, ax1 - tx:ax2 - tx]
+                pantalla = cv2.resize(recorte, (sx2 - sx1, sy2 - sy1), interpolation=interpolacion)
+                foto = ImageTk.PhotoImage(Image.fromarray(cv2.cvtColor(pantalla, cv2.COLOR_BGR2RGB)))
+                self.canvas.create_image(sx1, sy1, anchor=tk.NW, image=foto, tags="tesela_virtual")
+                self.fotos_teselas.append(foto)
+        self.canvas.tag_lower("tesela_virtual")
+        
+        cache = self.gigapixel_handler.cache_stats()
+        self.zoom_label.config(text=f"{int(self.scale * 100)}%")
+        self.mostrar_estado(f"Virtual {fuente.ancho}x{fuente.alto} | Level {nivel} | "
+                            f"{len(self.fotos_teselas)} tiles | Zoom: {self.scale * 100:.1f}% | "
+                            f"Cache: {cache['tiles']} tiles, {cache['bytes'] / 1024 ** 2:.0f} MB, "
+                            f"{cache['hit_rate']:.0%} hits")
+
     def display_current_image(self):
         if self.current_filtered_image is None:
             return
+        if self.fuente_virtual is not None:
+            self.display_virtual_tiles()
+            return
             
         if len(self.current_filtered_image.shape) == 3:
             if self.current_filtered_image.shape[2] == 3:
@@ -649,6 +934,9 @@ class NASAImageExplorerPro:
             self.apply_filter_to_main(filter_name)
 
     def apply_filter_to_main(self, filter_name):
+        if self.fuente_virtual is not None:
+            self.mostrar_estado("⚠️ Quick filters are not available on virtual datasets")
+            return
         if filter_name in self.transformaciones:
             self.current_filtered_image = self.transformaciones[filter_name]
             self.display_current_image()
@@ -0,0 +1,380 @@
+"""
+Servidor de modelos IA del NASA Image Explorer
+
+Un proceso aparte carga los modelos de AnalizadorEspecializadoNASA (un PoolModelos) y atiende
+las peticiones de inferencia de todas las ventanas y trabajos por lotes de la máquina. La
+interfaz no comparte memoria ni GIL con torch, y si un modelo revienta solo cae el servidor.
+
+Protocolo: multiprocessing.connection, un diccionario por mensaje. Los mensajes se deserializan
+con pickle, así que solo se aceptan conexiones autenticadas con la clave aleatoria de esta
+instalación (un fichero 0600 en ~/.nasa_image_explorer que el servidor crea al arrancar y los
+clientes leen) y el servidor solo escucha en loopback salvo que se pida --allow-remote.
+Mensajes:
+- {'op': 'estado'} -> {'ok': True, 'firmas': {modelo: firma}, 'cargados': [modelo, ...]}
+- {'op': 'cargar', 'modelo': m} -> {'ok': True, 'disponible': bool}
+- {'op': 'inferir', 'modelo': m, 'memoria': bloque, 'imagenes': [(offset, forma), ...], 'lote': n}
+  -> {'ok': True, 'salidas': [...]}, o 'salidas': None si el modelo no está disponible
+Cualquier error responde {'ok': False, 'error': texto}. Los píxeles (uint8, RGB o gris) no van
+por el socket: el cliente los copia en un bloque de memoria compartida que reutiliza.
+
+Servidor:   python servidor_modelos.py [host:puerto] [--allow-remote]
+Ventanas:   AI_CONFIG['model_server'] = "127.0.0.1:6010"
+Por lotes:  with ClienteModelos("127.0.0.1:6010") as cliente:
+                salidas = cliente.inferir("clasificacion", [imagen_rgb])
+"""
+import ipaddress
+import os
+import secrets
+import socket
+import stat
+import sys
+import threading
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+from PIL import Image
+
+from modelos_ia import PoolModelos
+from config_multiwindow import AI_CONFIG
+
+DIRECCION_POR_DEFECTO = "127.0.0.1:6010"
+
+def direccion(texto):
+    host, puerto = texto.rsplit(":", 1)
+    return host, int(puerto)
+
+RUTA_CLAVE = os.path.join(os.path.expanduser("~"), ".nasa_image_explorer", "servidor_modelos.key")
+LONGITUD_MINIMA_CLAVE = 16
+# La clave fija que traían versiones anteriores de config_multiwindow.py es pública
+CLAVES_PUBLICAS = {b"nasa-image-explorer"}
+
+def ruta_clave():
+    return AI_CONFIG.get("model_server_key_file") or RUTA_CLAVE
+
+def crear_clave(ruta=None):
+    """Crea la clave de la instalación (32 bytes aleatorios, fichero 0600) si aún no existe"""
+    ruta = ruta or ruta_clave()
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), mode=0o700, exist_ok=True)
+    try:
+        descriptor = os.open(ruta, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return
+    with os.fdopen(descriptor, "wb") as f:
+        f.write(secrets.token_bytes(32))
+
+def clave_autenticacion(authkey=None):
+    """La clave explícita o la del fichero de la instalación; rechaza claves vacías o cortas"""
+    if authkey is None:
+        ruta = ruta_clave()
+        try:
+            if os.name == "posix" and os.stat(ruta).st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+                raise ValueError(f"Model server key {ruta} is readable by other users, run chmod 600")
+            with open(ruta, "rb") as f:
+                authkey = f.read()
+        except FileNotFoundError:
+            raise ValueError(f"No model server key at {ruta}: start servidor_modelos.py first")
+    authkey = authkey.encode() if isinstance(authkey, str) else authkey
+    if len(authkey) < LONGITUD_MINIMA_CLAVE or authkey in CLAVES_PUBLICAS:
+        raise ValueError(f"Model server key must be a private key of at least {LONGITUD_MINIMA_CLAVE} bytes")
+    return authkey
+
+def es_loopback(host):
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+def adjuntar_memoria(nombre):
+    """Abre el bloque de memoria compartida de un cliente sin hacerse dueño de él"""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=nombre, track=False)
+    memoria = shared_memory.SharedMemory(name=nombre)
+    if os.name == "posix":
+        # Antes de 3.13 el resource_tracker de este proceso lo borraría al salir
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(memoria._name, "shared_memory")
+    return memoria
+
+class ServidorModelos:
+    """Atiende cada conexión en su hilo; las llamadas a un mismo modelo se serializan en el pool"""
+
+    def __init__(self, direccion_servidor=DIRECCION_POR_DEFECTO, authkey=None, pool=None, permitir_remoto=False):
+        self.direccion = direccion(direccion_servidor)
+        if not permitir_remoto and not es_loopback(self.direccion[0]):
+            # Quien se conecte puede ejecutar código en este proceso si conoce la clave
+            raise ValueError(f"Refusing to listen on non-loopback host {self.direccion[0]} without --allow-remote")
+        if authkey is None:
+            crear_clave()
+        self.authkey = clave_autenticacion(authkey)
+        self.pool = pool or PoolModelos()
+        # El servidor es un usuario permanente: solo descarga los modelos inactivos; sus avisos van a la consola
+        self.pool.adquirir(print)
+
+    def servir(self, precargar=True):
+        if precargar:
+            for nombre in self.pool.MODELOS:
+                threading.Thread(target=self.pool.obtener, args=(nombre,), daemon=True).start()
+        with Listener(self.direccion, authkey=self.authkey) as escucha:
+            print(f"🚀 Model server listening on {self.direccion[0]}:{self.direccion[1]}")
+            while True:
+                try:
+                    conexion = escucha.accept()
+                except Exception as e:
+                    # Clave equivocada o cliente que se va a mitad del saludo
+                    print(f"⚠️ Connection rejected: {e}")
+                    continue
+                threading.Thread(target=self.atender, args=(conexion,), daemon=True).start()
+
+    def atender(self, conexion):
+        memorias = {}
+        try:
+            while True:
+                try:
+                    peticion = conexion.recv()
+                except (EOFError, OSError):
+                    break
+                try:
+                    respuesta = self.responder(peticion, memorias)
+                except Exception as e:
+                    respuesta = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                conexion.send(respuesta)
+        finally:
+            for memoria in memorias.values():
+                memoria.close()
+            conexion.close()
+
+    def responder(self, peticion, memorias):
+        op = peticion["op"]
+        if op == "estado":
+            return {"ok": True, "firmas": {nombre: self.pool.firma(nombre) for nombre in self.pool.MODELOS},
+                    "cargados": [nombre for nombre in self.pool.MODELOS if self.pool.cargado(nombre)]}
+        if op == "cargar":
+            return {"ok": True, "disponible": self.pool.obtener(peticion["modelo"]) is not None}
+        if op == "inferir":
+            nombre = peticion["modelo"]
+            with self.pool.usar(nombre) as modelo, self.pool.llamadas[nombre]:
+                if modelo is None:
+                    return {"ok": True, "salidas": None}
+                imagenes = self.leer_imagenes(peticion, memorias)
+                salidas = modelo(imagenes, batch_size=peticion.get("lote", 1))
+            return {"ok": True, "salidas": list(salidas)}
+        raise ValueError(f"Operación desconocida: {op}")
+
+    def leer_imagenes(self, peticion, memorias):
+        # El cliente crea un bloque nuevo cuando se le queda pequeño: los anteriores ya no sirven
+        if peticion["memoria"] not in memorias:
+            for memoria in memorias.values():
+                memoria.close()
+            memorias.clear()
+            memorias[peticion["memoria"]] = adjuntar_memoria(peticion["memoria"])
+        memoria = memorias[peticion["memoria"]]
+        # Copia: el bloque se reescribe en la siguiente petición
+        return [Image.fromarray(np.ndarray(forma, dtype=np.uint8, buffer=memoria.buf, offset=offset).copy())
+                for offset, forma in peticion["imagenes"]]
+
+class ClienteModelos:
+    """Conexiones a un servidor de modelos, seguras entre hilos
+
+    Cada llamada toma una conexión libre (o abre otra) con su propio bloque de memoria
+    compartida, así que los hilos de un GrafoTareas no se esperan entre sí en el socket.
+    Las firmas de los modelos se piden al abrir cada conexión y se olvidan al perder una: un
+    servidor reiniciado con otro backend no hereda las firmas del anterior.
+    """
+
+    def __init__(self, direccion_servidor=DIRECCION_POR_DEFECTO, authkey=None):
+        self.direccion = direccion(direccion_servidor)
+        self.authkey_explicita = authkey
+        # La clave se lee al conectar: crear el cliente no falla aunque el servidor no haya arrancado nunca
+        self.authkey = None
+        self.libres = []
+        self.firmas = None
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.cerrar()
+
+    @contextmanager
+    def _conexion(self):
+        with self.lock:
+            canal = self.libres.pop() if self.libres else None
+        if canal is None:
+            canal = self._abrir_canal()
+        try:
+            yield canal
+        except (EOFError, OSError) as e:
+            self._cerrar_canal(canal)
+            # Las demás conexiones libres y las firmas seguramente son de un servidor que ya no está
+            self.cerrar()
+            raise RuntimeError(f"Model server connection lost: {e}")
+        except BaseException:
+            self._cerrar_canal(canal)
+            raise
+        with self.lock:
+            self.libres.append(canal)
+
+    def _abrir_canal(self):
+        try:
+            if self.authkey is None:
+                self.authkey = clave_autenticacion(self.authkey_explicita)
+            canal = {"conexion": Client(self.direccion, authkey=self.authkey), "memoria": None}
+        except (OSError, ValueError, AuthenticationError) as e:
+            raise RuntimeError(f"Model server unavailable at {self.direccion[0]}:{self.direccion[1]}: {e}")
+        try:
+            canal["conexion"].send({"op": "estado"})
+            self.firmas = canal["conexion"].recv()["firmas"]
+        except (EOFError, OSError) as e:
+            self._cerrar_canal(canal)
+            raise RuntimeError(f"Model server connection lost: {e}")
+        return canal
+
+    def _cerrar_canal(self, canal):
+        canal["conexion"].close()
+        if canal["memoria"] is not None:
+            canal["memoria"].close()
+            canal["memoria"].unlink()
+            canal["memoria"] = None
+
+    def _llamar(self, peticion, imagenes=None):
+        with self._conexion() as canal:
+            if imagenes is not None:
+                peticion = dict(peticion, **self._escribir_imagenes(canal, imagenes))
+            canal["conexion"].send(peticion)
+            respuesta = canal["conexion"].recv()
+        if not respuesta["ok"]:
+            raise RuntimeError(f"Model server error: {respuesta['error']}")
+        return respuesta
+
+    def _escribir_imagenes(self, canal, imagenes):
+        pixeles = [np.ascontiguousarray(np.asarray(imagen.convert("RGB") if isinstance(imagen, Image.Image) else imagen,
+                                                   dtype=np.uint8))
+                   for imagen in imagenes]
+        necesario = max(sum(p.nbytes for p in pixeles), 1)
+        memoria = canal["memoria"]
+        if memoria is None or memoria.size < necesario:
+            if memoria is not None:
+                memoria.close()
+                memoria.unlink()
+            # Holgura para no recrear el bloque con cada lote algo mayor
+            memoria = canal["memoria"] = shared_memory.SharedMemory(create=True, size=max(necesario * 3 // 2, 1 << 20))
+        posiciones, offset = [], 0
+        for p in pixeles:
+            np.ndarray(p.shape, dtype=np.uint8, buffer=memoria.buf, offset=offset)[...] = p
+            posiciones.append((offset, p.shape))
+            offset += p.nbytes
+        return {"memoria": memoria.name, "imagenes": posiciones}
+
+    def estado(self):
+        return self._llamar({"op": "estado"})
+
+    def firmas_servidor(self):
+        """Firma de cada modelo según el servidor al que está conectado el cliente"""
+        firmas = self.firmas
+        if firmas is None:
+            firmas = self.firmas = self.estado()["firmas"]
+        return firmas
+
+    def cargar(self, nombre):
+        return self._llamar({"op": "cargar", "modelo": nombre})["disponible"]
+
+    def inferir(self, nombre, imagenes, lote=1):
+        """Salidas del modelo para una lista de imágenes PIL o arrays uint8 RGB; None si no está disponible"""
+        return self._llamar({"op": "inferir", "modelo": nombre, "lote": lote}, imagenes)["salidas"]
+
+    def cerrar(self):
+        with self.lock:
+            canales, self.libres = self.libres, []
+            self.firmas = None
+        for canal in canales:
+            self._cerrar_canal(canal)
+
+class ModeloRemoto:
+    """Se llama como un pipeline de transformers, pero la inferencia ocurre en el servidor"""
+
+    def __init__(self, cliente, nombre):
+        self.cliente = cliente
+        self.nombre = nombre
+
+    def __call__(self, imagenes, batch_size=1):
+        lista = isinstance(imagenes, (list, tuple))
+        entradas = list(imagenes) if lista else [imagenes]
+        salidas = self.cliente.inferir(self.nombre, entradas, batch_size)
+        # El servidor puede haber descargado el modelo o fallado al cargarlo desde que se pidió
+        if salidas is None:
+            raise RuntimeError(f"Model {self.nombre} is not available on the model server")
+        if len(salidas) != len(entradas):
+            raise RuntimeError(f"Model server returned {len(salidas)} outputs for {len(entradas)} images")
+        return salidas if lista else salidas[0]
+
+class PoolRemoto:
+    """La interfaz de PoolModelos que usa AnalizadorEspecializadoNASA, con los modelos en el servidor"""
+
+    MODELOS = PoolModelos.MODELOS
+
+    def __init__(self, direccion_servidor=DIRECCION_POR_DEFECTO, authkey=None):
+        self.cliente = ClienteModelos(direccion_servidor, authkey)
+        self.llamadas = {nombre: threading.Lock() for nombre in self.MODELOS}
+        self.usuarios = 0
+        self.avisos = []
+        self.lock = threading.Lock()
+
+    def firma(self, nombre):
+        """La del servidor, que es quien sabe con qué backend carga; None si no responde o no conoce el modelo"""
+        try:
+            return self.cliente.firmas_servidor().get(nombre)
+        except RuntimeError:
+            return None
+
+    def adquirir(self, aviso=None):
+        with self.lock:
+            self.usuarios += 1
+            if aviso is not None:
+                self.avisos.append(aviso)
+
+    def liberar(self, aviso=None):
+        with self.lock:
+            self.usuarios = max(0, self.usuarios - 1)
+            if aviso in self.avisos:
+                self.avisos.remove(aviso)
+            if self.usuarios:
+                return
+        self.cliente.cerrar()
+
+    def _avisar(self, mensaje):
+        with self.lock:
+            avisos = list(self.avisos)
+        for aviso in avisos:
+            aviso(mensaje)
+
+    def cargado(self, nombre):
+        try:
+            return nombre in self.cliente.estado()["cargados"]
+        except RuntimeError:
+            return False
+
+    def obtener(self, nombre):
+        if self.cliente.cargar(nombre):
+            return ModeloRemoto(self.cliente, nombre)
+        self._avisar(f"❌ Model {nombre} not available on the model server")
+        return None
+
+    @contextmanager
+    def usar(self, nombre):
+        yield self.obtener(nombre)
+
+def main():
+    argumentos = [a for a in sys.argv[1:] if not a.startswith("--")]
+    direccion_servidor = argumentos[0] if argumentos else (AI_CONFIG.get("model_server") or DIRECCION_POR_DEFECTO)
+    try:
+        servidor = ServidorModelos(direccion_servidor, permitir_remoto="--allow-remote" in sys.argv)
+    except ValueError as e:
+        sys.exit(f"❌ {e}")
+    servidor.servir()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+import math
+from abc import ABC, abstractmethod
+
+import cv2
+import numpy as np
+
+# Generadores vectorizados de datos sintéticos (campos estelares, superficies con cráteres)
+# compartidos por app.py y prueba.py
+
+COLORES_ESTELARES = ((255, 255, 255), (100, 200, 255), (255, 150, 100))
+
+def salpicar_psf(imagen, xs, ys, brillos, sigmas, colores=(255, 255, 255), banda=1024):
+    """Suma en `imagen` (uint8 BGR o gris, en sitio y con saturación) una PSF gaussiana por fuente
+
+    Cada fuente aporta un sello de radio ceil(3 sigma) centrado en su posición subpíxel, con
+    pico `brillos` teñido por `colores` (BGR, uno común o uno por fuente). Las fuentes se
+    agrupan por tamaño de sello y se acumulan con np.bincount por franjas de `banda` filas,
+    así la memoria extra no depende del tamaño de la imagen.
+    """
+    alto, ancho = imagen.shape[:2]
+    canales = 1 if imagen.ndim == 2 else imagen.shape[2]
+    n = len(xs)
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    brillos = np.broadcast_to(np.asarray(brillos, dtype=np.float64), (n,))
+    sigmas = np.broadcast_to(np.asarray(sigmas, dtype=np.float64), (n,))
+    # Pocos tintes distintos: se acumula una vez por tinte y no una vez por canal
+    colores = np.asarray(colores, dtype=np.int64).reshape(-1, 3)
+    claves, tinte = np.unique(colores @ np.array([1 << 16, 1 << 8, 1]), return_inverse=True)
+    paleta = np.stack([claves >> 16, (claves >> 8) & 255, claves & 255], axis=1)[:, :canales] / 255.0
+    tinte = np.broadcast_to(tinte.ravel(), (n,))
+    radios = np.ceil(3 * sigmas).astype(np.int64)
+    cx, cy = np.floor(xs).astype(np.int64), np.floor(ys).astype(np.int64)
+    if n == 0:
+        return imagen
+
+    # Con un margen de 2 * radio máximo alrededor de cada franja ningún sello se sale del acumulador
+    margen = 2 * int(radios.max())
+    visibles = (cx + radios >= 0) & (cx - radios < ancho)
+    ancho_acumulador = ancho + 2 * margen
+    for y0 in range(0, alto, banda):
+        y1 = min(y0 + banda, alto)
+        en_banda = visibles & (cy + radios >= y0) & (cy - radios < y1)
+        indices, pesos, tintes_franja = [], [], []
+        for radio in np.unique(radios[en_banda]):
+            grupo = np.flatnonzero(en_banda & (radios == radio))
+            desplazamientos = np.arange(-radio, radio + 1)
+            # Gaussiana separable evaluada en la posición subpíxel: sello (N, lado, lado) = gy x gx
+            dx = cx[grupo, None] + desplazamientos + 0.5 - xs[grupo, None]
+            dy = cy[grupo, None] + desplazamientos + 0.5 - ys[grupo, None]
+            dos_sigma2 = 2 * sigmas[grupo, None] ** 2
+            gx = np.exp(-dx ** 2 / dos_sigma2)
+            gy = np.exp(-dy ** 2 / dos_sigma2) * brillos[grupo, None]
+            filas = (cy[grupo] - y0 + margen)[:, None, None] + desplazamientos[None, :, None]
+            columnas = (cx[grupo] + margen)[:, None, None] + desplazamientos[None, None, :]
+            indices.append((filas * ancho_acumulador + columnas).ravel())
+            pesos.append((gy[:, :, None] * gx[:, None, :]).ravel())
+            tintes_franja.append(np.repeat(tinte[grupo], len(desplazamientos) ** 2))
+        if not indices:
+            continue
+
+        # Una acumulación por tinte y franja; se recorta el margen y se suma con saturación
+        indices = np.concatenate(indices)
+        pesos = np.concatenate(pesos)
+        tintes_franja = np.concatenate(tintes_franja)
+        longitud = (y1 - y0 + 2 * margen) * ancho_acumulador
+        planos = [None] * canales
+        for k, color in enumerate(paleta):
+            seleccion = tintes_franja == k if len(paleta) > 1 else slice(None)
+            suma = np.bincount(indices[seleccion], weights=pesos[seleccion], minlength=longitud)
+            suma = suma.reshape(-1, ancho_acumulador)[margen:margen + y1 - y0, margen:margen + ancho]
+            escalados = {}
+            for canal in range(canales):
+                # convertScaleAbs escala y satura a uint8 en una pasada; canales de igual tinte se comparten
+                if color[canal] not in escalados:
+                    escalados[color[canal]] = cv2.convertScaleAbs(suma, alpha=float(color[canal]))
+                plano = escalados[color[canal]]
+                planos[canal] = plano if planos[canal] is None else cv2.add(planos[canal], plano)
+        franja = imagen[y0:y1]
+        aporte = planos[0] if canales == 1 else cv2.merge(planos)
+        cv2.add(franja, aporte.reshape(franja.shape), dst=franja)
+    return imagen
+
+def campo_estelar(ancho, alto, n_estrellas, semilla=42, escala_tamano=1.0, tamano_min=0.5,
+                  colores=COLORES_ESTELARES, brillo=255):
+    """Imagen BGR uint8 de estrellas gaussianas en posiciones aleatorias reproducibles
+
+    El tamaño de cada estrella sigue una exponencial de escala `escala_tamano` más `tamano_min`
+    y se interpreta como radio aparente (sigma = tamaño / 2).
+    """
+    rng = np.random.default_rng(semilla)
+    xs = rng.uniform(0, ancho, n_estrellas)
+    ys = rng.uniform(0, alto, n_estrellas)
+    tamanos = rng.exponential(escala_tamano, n_estrellas) + tamano_min
+    tintes = np.asarray(colores)[rng.integers(0, len(colores), n_estrellas)]
+
+    imagen = np.zeros((alto, ancho, 3), dtype=np.uint8)
+    return salpicar_psf(imagen, xs, ys, brillo, tamanos / 2, tintes)
+
+def superficie_craterizada(ancho, alto, n_crateres, radio_min, radio_max, fondo, relleno, borde,
+                           grosor=1, semilla=42):
+    """Imagen BGR uint8 con cráteres rellenos y su borde; `radio_max` es exclusivo como en randint
+
+    Los parámetros se sortean en bloque; el trazado queda en cv2.circle, que rasteriza un
+    disco más rápido que cualquier sello indexado en numpy.
+    """
+    rng = np.random.default_rng(semilla)
+    xs = rng.integers(0, ancho, n_crateres).tolist()
+    ys = rng.integers(0, alto, n_crateres).tolist()
+    radios = rng.integers(radio_min, radio_max, n_crateres).tolist()
+
+    imagen = np.empty((alto, ancho, 3), dtype=np.uint8)
+    imagen[:] = fondo
+    for x, y, r in zip(xs, ys, radios):
+        cv2.circle(imagen, (x, y), r, relleno, -1)
+        cv2.circle(imagen, (x, y), r, borde, grosor)
+    return imagen
+
+class FuenteProcedural(ABC):
+    """Imagen virtual de ancho x alto píxeles que se genera por regiones a partir de una semilla
+
+    El contenido se reparte en poblaciones k = 0, 1, ...: la población k vive en una rejilla de
+    celdas de `celda * 2**k` píxeles con los mismos objetos por celda, así que es 4 veces más rara
+    y 2 veces más grande que la k - 1. Cada celda se siembra con (semilla, k, cx, cy) y una región
+    sale idéntica se pida como se pida. El nivel `nivel` de la pirámide (escala 1 / 2**nivel) solo
+    pinta las poblaciones que se resuelven a esa escala, de modo que el coste de una tesela no
+    depende del tamaño de la imagen ni del zoom.
+    """
+
+    # Poblaciones más finas que el nivel pedido que todavía se pintan
+    profundidad = 0
+
+    def __init__(self, ancho, alto, semilla=42, celda=512, fondo=(0, 0, 0)):
+        self.ancho = ancho
+        self.alto = alto
+        self.semilla = semilla
+        self.celda = celda
+        self.fondo = fondo
+        self.niveles = max(1, math.ceil(math.log2(max(ancho, alto) / celda)) + 1)
+
+    def tamano(self, nivel):
+        """(ancho, alto) del nivel de la pirámide"""
+        escala = 1 << nivel
+        return -(-self.ancho // escala), -(-self.alto // escala)
+
+    def nivel_para(self, lado_maximo):
+        """Primer nivel cuyo lado mayor no pasa de `lado_maximo`"""
+        for nivel in range(64):
+            if max(self.tamano(nivel)) <= lado_maximo:
+                return nivel
+
+    def region(self, x, y, ancho, alto, nivel=0):
+        """Píxeles BGR uint8 de [x, x + ancho) x [y, y + alto) en coordenadas del nivel, recortados a la imagen"""
+        ancho_nivel, alto_nivel = self.tamano(nivel)
+        ancho = max(0, min(ancho, ancho_nivel - x))
+        alto = max(0, min(alto, alto_nivel - y))
+        lienzo = np.empty((alto, ancho, 3), dtype=np.uint8)
+        lienzo[:] = self.fondo
+        if lienzo.size == 0:
+            return lienzo
+
+        escala = 1 << nivel
+        self._pintar_fondo(lienzo, x, y, escala)
+        # Las poblaciones grandes primero, para que las pequeñas queden encima; todas se pintan juntas
+        objetos = []
+        for k in range(self.niveles - 1, max(nivel - self.profundidad, 0) - 1, -1):
+            lado = self.celda << k
+            margen = self.radio_maximo(k)
+            celdas_x = range(max((x * escala - margen) // lado, 0),
+                             min(((x + ancho) * escala + margen) // lado, (self.ancho - 1) // lado) + 1)
+            celdas_y = range(max((y * escala - margen) // lado, 0),
+                             min(((y + alto) * escala + margen) // lado, (self.alto - 1) // lado) + 1)
+            objetos.extend(self._poblacion(k, cx, cy) for cy in celdas_y for cx in celdas_x)
+        if objetos:
+            objetos = {clave: np.concatenate([o[clave] for o in objetos]) for clave in objetos[0]}
+            self._pintar(lienzo, objetos, x, y, escala)
+        return lienzo
+
+    def _rng(self, k, cx, cy):
+        return np.random.default_rng([self.semilla, k, cx, cy])
+
+    def _posiciones(self, rng, k, cx, cy, n):
+        lado = self.celda << k
+        return (cx + rng.random(n)) * lado, (cy + rng.random(n)) * lado
+
+    def _pintar_fondo(self, lienzo, x, y, escala):
+        pass
+
+    @abstractmethod
+    def radio_maximo(self, k):
+        """Radio máximo en píxeles del nivel 0 de un objeto de la población k"""
+
+    @abstractmethod
+    def _poblacion(self, k, cx, cy):
+        """Columnas (dict de arrays, con "x" e "y" en el nivel 0) de los objetos de la celda (cx, cy)"""
+
+    @abstractmethod
+    def _pintar(self, lienzo, objetos, x, y, escala):
+        """Pinta en `lienzo` los objetos, cuyo origen es (x, y) en el nivel de escala 1 / `escala`"""
+
+class CampoEstelarProcedural(FuenteProcedural):
+    """Campo estelar virtual con galaxia espiral opcional; cada población es 1.6 veces más brillante"""
+
+    profundidad = 2
+
+    def __init__(self, ancho, alto, semilla=42, estrellas_por_celda=150, galaxia=True,
+                 colores=COLORES_ESTELARES, celda=512):
+        super().__init__(ancho, alto, semilla, celda)
+        self.estrellas_por_celda = estrellas_por_celda
+        self.galaxia = galaxia
+        self.colores = np.asarray(colores)
+
+    def radio_maximo(self, k):
+        return math.ceil(3 * 1.3 ** k)
+
+    def _poblacion(self, k, cx, cy):
+        rng = self._rng(k, cx, cy)
+        n = self.estrellas_por_celda
+        xs, ys = self._posiciones(rng, k, cx, cy, n)
+        return {
+            "x": xs,
+            "y": ys,
+            "brillo": rng.uniform(0.5, 1.0, n) * min(255.0, 90 * 1.6 ** k),
+            "sigma": rng.uniform(0.6, 1.0, n) * 1.3 ** k,
+            "color": rng.integers(0, len(self.colores), n),
+        }
+
+    def _pintar(self, lienzo, objetos, x, y, escala):
+        # Por debajo de medio píxel una estrella se sigue viendo como un punto
+        salpicar_psf(lienzo, objetos["x"] / escala - x, objetos["y"] / escala - y, objetos["brillo"],
+                     np.maximum(objetos["sigma"] / escala, 0.5), self.colores[objetos["color"]])
+
+    def _pintar_fondo(self, lienzo, x, y, escala):
+        """Galaxia espiral inclinada de dos brazos, evaluada analíticamente en cada píxel"""
+        if not self.galaxia:
+            return
+        alto, ancho = lienzo.shape[:2]
+        inclinacion = 0.35
+        radio_disco = 0.1 * min(self.ancho, self.alto / inclinacion)
+        u = (((x + np.arange(ancho) + 0.5) * escala - self.ancho / 2) / radio_disco).astype(np.float32)
+        v = (((y + np.arange(alto) + 0.5) * escala - self.alto / 2) / (radio_disco * inclinacion)).astype(np.float32)
+        # Más allá de 12 radios de disco la galaxia no llega a medio nivel de gris
+        if np.abs(u).min() ** 2 + np.abs(v).min() ** 2 > 144:
+            return
+        r = np.hypot(u[None, :], v[:, None])
+        theta = np.arctan2(v[:, None], u[None, :])
+        brazos = ((1 + np.cos(2 * theta - 2 * np.log(r + np.float32(1e-3)) / np.float32(math.tan(0.35)))) / 2) ** 3
+        intensidad = np.exp(r / np.float32(-0.15)) + np.float32(0.6) * np.exp(-r) * (np.float32(0.25) + np.float32(0.75) * brazos)
+        aporte = cv2.convertScaleAbs(intensidad[:, :, None] * np.float32((200, 150, 100)))
+        cv2.add(lienzo, aporte, dst=lienzo)
+
+class SuperficieProcedural(FuenteProcedural):
+    """Superficie virtual con cráteres; el radio se duplica en cada población (distribución ~ r^-2)"""
+
+    profundidad = 1
+
+    def __init__(self, ancho, alto, fondo, relleno, borde, grosor=1, semilla=42,
+                 crateres_por_celda=40, radio_base=4, celda=512):
+        super().__init__(ancho, alto, semilla, celda, fondo)
+        self.relleno = relleno
+        self.borde = borde
+        self.grosor = grosor
+        self.crateres_por_celda = crateres_por_celda
+        self.radio_base = radio_base
+
+    def radio_maximo(self, k):
+        return 2 * self.radio_base << k
+
+    def _poblacion(self, k, cx, cy):
+        rng = self._rng(k, cx, cy)
+        n = self.crateres_por_celda
+        xs, ys = self._posiciones(rng, k, cx, cy, n)
+        return {"x": xs, "y": ys, "radio": rng.uniform(1.0, 2.0, n) * (self.radio_base << k)}
+
+    def _pintar(self, lienzo, objetos, x, y, escala):
+        # Disco y anillo se evalúan en el centro de cada píxel: el mismo cráter da los mismos
+        # píxeles en cualquier tesela, cosa que cv2.circle no garantiza al recortar el trazo
+        alto, ancho = lienzo.shape[:2]
+        px = objetos["x"] / escala - x
+        py = objetos["y"] / escala - y
+        radios = objetos["radio"] / escala
+        visibles = np.flatnonzero((px + radios >= 0) & (px - radios < ancho) &
+                                  (py + radios >= 0) & (py - radios < alto))
+        for i in visibles.tolist():
+            cx, cy, r = px[i], py[i], radios[i]
+            x0, x1 = max(int(cx - r), 0), min(int(cx + r) + 1, ancho)
+            y0, y1 = max(int(cy - r), 0), min(int(cy + r) + 1, alto)
+            d2 = (np.arange(x0, x1) + 0.5 - cx)[None, :] ** 2 + (np.arange(y0, y1) + 0.5 - cy)[:, None] ** 2
+            ventana = lienzo[y0:y1, x0:x1]
+            ventana[d2 <= r * r] = self.borde
+            ventana[d2 <= max(r - self.grosor, 0) ** 2] = self.relleno
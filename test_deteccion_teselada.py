@@ -0,0 +1,84 @@
+"""
+La detección por teselas debe dar el mismo catálogo que una sola pasada sobre la imagen completa
+
+Imagen sintética con discos, rectángulos y estrellas repartidos por toda la imagen, de modo que
+varios cruzan las costuras entre teselas. Uso: python -m pytest -q test_deteccion_teselada.py
+"""
+import cv2
+import numpy as np
+import pytest
+
+from app import CatalogoPatrones, ClasificadorColorHSV, DetectorTeselado, detectar_patrones
+from simulacion import salpicar_psf
+
+RANGOS_COLOR = {
+    "Rojo": {"hsv_bajo": np.array([0, 120, 70]), "hsv_alto": np.array([10, 255, 255]), "color_bgr": (0, 0, 255)},
+    "Verde": {"hsv_bajo": np.array([40, 40, 40]), "hsv_alto": np.array([80, 255, 255]), "color_bgr": (0, 255, 0)},
+    "Blanco": {"hsv_bajo": np.array([0, 0, 200]), "hsv_alto": np.array([180, 30, 255]), "color_bgr": (255, 255, 255)},
+}
+
+DETECTORES = ["circulos", "contornos", "rectangulos", "estrellas"]
+TAMANOS_TESELA = [384, 512]
+
+@pytest.fixture(scope="module")
+def clasificador():
+    return ClasificadorColorHSV(RANGOS_COLOR)
+
+@pytest.fixture(scope="module")
+def imagen():
+    rng = np.random.default_rng(3)
+    imagen = np.full((1100, 1500, 3), 20, dtype=np.uint8)
+    for i in range(30):
+        x, y, radio = int(rng.integers(40, 1460)), int(rng.integers(40, 1060)), int(rng.integers(12, 35))
+        cv2.circle(imagen, (x, y), radio, (60, 60, 255) if i % 2 else (220, 220, 220), -1)
+    for _ in range(12):
+        x, y = int(rng.integers(20, 1400)), int(rng.integers(20, 1000))
+        ancho, alto = (int(lado) for lado in rng.integers(30, 90, 2))
+        cv2.rectangle(imagen, (x, y), (x + ancho, y + alto), (120, 255, 120), -1)
+    # Bordes suaves: con bordes duros HoughCircles (dp=1) apenas acumula votos
+    imagen = cv2.GaussianBlur(imagen, (9, 9), 2)
+    n = 300
+    salpicar_psf(imagen, rng.uniform(0, 1500, n), rng.uniform(0, 1100, n), rng.uniform(60, 200, n),
+                 rng.uniform(0.8, 1.5, n))
+    return imagen
+
+def ordenado(catalogo):
+    return np.sort(catalogo.datos, order=["tipo", "x", "y", "area", "radio"])
+
+def cruza_costura(catalogo, tile_size):
+    """Algún círculo cortado por una costura entre teselas"""
+    x, y, radio = catalogo.datos["x"], catalogo.datos["y"], catalogo.datos["radio"]
+    return bool(np.any((np.abs(x - np.rint(x / tile_size) * tile_size) < radio) & (x > radio)) or
+                np.any((np.abs(y - np.rint(y / tile_size) * tile_size) < radio) & (y > radio)))
+
+@pytest.mark.parametrize("tile_size", TAMANOS_TESELA)
+@pytest.mark.parametrize("detector", DETECTORES)
+def test_teselado_igual_a_una_pasada(imagen, clasificador, detector, tile_size):
+    opciones = {detector: True}
+    una_pasada, _ = detectar_patrones(imagen, clasificador, opciones)
+    teselado, _ = DetectorTeselado(clasificador, opciones, tile_size=tile_size, halo=128).ejecutar(imagen)
+
+    assert len(una_pasada) > 0
+    esperado, obtenido = ordenado(una_pasada), ordenado(teselado)
+    assert len(obtenido) == len(esperado)
+    for campo in esperado.dtype.names:
+        if esperado[campo].dtype.kind == "f":
+            # Los centroides subpíxel solo difieren en el redondeo al desplazar el origen de la tesela
+            np.testing.assert_allclose(obtenido[campo], esperado[campo], rtol=0, atol=1e-9, err_msg=campo)
+        else:
+            np.testing.assert_array_equal(obtenido[campo], esperado[campo], err_msg=campo)
+
+@pytest.mark.parametrize("tile_size", TAMANOS_TESELA)
+def test_hay_circulos_en_las_costuras(imagen, clasificador, tile_size):
+    circulos, _ = detectar_patrones(imagen, clasificador, {"circulos": True})
+    assert cruza_costura(circulos, tile_size)
+
+@pytest.mark.parametrize("region", [(200, 200, 200, 400), (300, 300, 100, 100), (2000, 0, 2500, 100)])
+def test_region_vacia_devuelve_catalogo_vacio(imagen, clasificador, region):
+    detector = DetectorTeselado(clasificador, {"circulos": True, "contornos": True}, tile_size=512)
+    catalogo, info = detector.ejecutar(imagen, region=region)
+
+    assert isinstance(catalogo, CatalogoPatrones)
+    assert len(catalogo) == 0
+    assert detector.teselas_nuevas == 0
+    assert info == ["Círculos detectados: 0", "Contornos detectados: 0"]